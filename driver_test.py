@@ -35,6 +35,7 @@
 
 import os
 import time
+import struct
 import pytest
 import logging
 import warnings
@@ -382,6 +383,15 @@ def test_qpair_overflow(nvme0, nvme0n1, buf):
     q.waitdone(3)
 
 
+def test_qpair_delay_doorbell(nvme0, nvme0n1, buf):
+    q = d.Qpair(nvme0, 16, delay_doorbell=True)
+    for i in range(8):
+        nvme0n1.read(q, buf, i*8, 8)
+    # doorbell is rung in polling completions
+    q.waitdone(8)
+    q.delete()
+
+
 @pytest.mark.parametrize("shift", range(1, 8))
 def test_qpair_different_size(nvme0n1, nvme0, shift):
     size = 1 << shift
@@ -462,6 +472,29 @@ def test_controller_reset_redo(nvme0):
     assert cdw0 == 0xf000f
 
 
+def test_ioworker_stats(nvme0n1):
+    w = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                         read_percentage=50, time=5).start()
+    last = w.stats()
+    for i in range(3):
+        time.sleep(1.5)
+        s = w.stats()
+        assert s.mseconds > last.mseconds
+        assert s.io_count_read+s.io_count_nonread > last.io_count_read+last.io_count_nonread
+        assert s.bytes_read == s.io_count_read*8*512
+        assert s.iops > 0
+        assert len(s.latency_distribution) == 1024
+        assert sum(s.latency_distribution) > 0
+        last = s
+    r = w.close()
+
+    # final statistics are published at the end
+    s = w.stats()
+    assert s.io_count_read == r.io_count_read
+    assert s.io_count_nonread == r.io_count_nonread
+    assert s.latency_max_us == r.latency_max_us
+
+
 def test_ioworker_is_running(nvme0n1):
     with nvme0n1.ioworker(io_size=8, time=6) as a:
         for i in range(5):
@@ -546,6 +579,51 @@ def test_ioworker_sequential_unfixed_iosize(nvme0n1):
         assert cmdlog_list[i][0]+cmdlog_list[i][1] == cmdlog_list[i+1][0]
 
 
+def test_ioworker_random_lba_coverage(nvme0n1):
+    # random lba covers the whole namespace, even beyond 2^31
+    ns_size = nvme0n1.id_data(7, 0)
+    cmdlog_list = [None]*1000
+    nvme0n1.ioworker(io_size=1,
+                     lba_random=True,
+                     io_count=len(cmdlog_list),
+                     qdepth=16,
+                     output_cmdlog_list=cmdlog_list).start().close()
+    lba_list = [c[0] for c in cmdlog_list]
+    assert max(lba_list) < ns_size
+    assert max(lba_list) > ns_size*0.9
+    assert min(lba_list) < ns_size*0.1
+
+
+def test_ioworker_io_plan(nvme0n1):
+    import struct
+
+    # user given plan: write 100 IO backward, one pass
+    plan = b''.join(struct.pack('<QII', (99-i)*8, 8, 1) for i in range(100))
+    cmdlog_list = [None]*100
+    r = nvme0n1.ioworker(io_plan=plan, qdepth=2,
+                         output_cmdlog_list=cmdlog_list).start().close()
+    assert r.io_count_write == 100
+    assert r.io_count_read == 0
+    assert cmdlog_list[-1][0] == 0
+    assert cmdlog_list[-2][0] == 8
+
+    # repeat the plan
+    plan = b''.join(struct.pack('<QII', i*8, 8, 2) for i in range(10))
+    r = nvme0n1.ioworker(io_plan=plan, io_count=1000).start().close()
+    assert r.io_count_read == 1000
+
+    # generated by the ioworker in batch
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, read_percentage=50,
+                         io_plan=True, time=2).start().close()
+    assert r.io_count_read > 0
+    assert r.io_count_nonread > 0
+
+    # io out of the namespace
+    plan = struct.pack('<QII', nvme0n1.id_data(7, 0), 8, 2)
+    with pytest.warns(UserWarning, match="ioworker host ERROR -8: invalid io plan or sequence"):
+        nvme0n1.ioworker(io_plan=plan).start().close()
+
+
 def test_getlogpage_send_cmd(nvme0, buf):
     fid=1
 
@@ -758,6 +836,27 @@ def test_write_and_format(nvme0n1, nvme0):
     nvme0.format(nvme0n1.get_lba_format(512, 0)).waitdone()
 
 
+def test_verify_after_format_and_trim(nvme0, nvme0n1, qpair, verify):
+    buf = d.Buffer(4096)
+    nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=False,
+                     region_end=1024*1024, qdepth=16,
+                     read_percentage=0, io_count=1024*1024//8).start().close()
+
+    # trimmed lba are not verified, the range is not aligned
+    buf.set_dsm_range(0, 1, 1024*1024-2)
+    nvme0n1.dsm(qpair, buf, 1).waitdone()
+    r = nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=True,
+                         region_end=1024*1024, qdepth=16,
+                         read_percentage=100, time=2).start().close()
+    assert r.error == 0
+
+    # the whole verify table is cleared after format
+    nvme0n1.format(512)
+    r = nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=True,
+                         read_percentage=100, time=2).start().close()
+    assert r.error == 0
+
+
 def test_get_identify_quick(nvme0, nvme0n1):
     logging.info("vid: 0x%x" % nvme0.id_data(1, 0))
     logging.info("namespace size: %d" % nvme0n1.id_data(7, 0))
@@ -1473,6 +1572,67 @@ def test_dst_extended(nvme0):
         nvme0.getlogpage(0x6, buf, 32).waitdone()
 
 
+@pytest.mark.parametrize("crc_bits", [8, 16, 32])
+@pytest.mark.parametrize("crc_file", [None, "/tmp/pynvme_crc_table.bin"])
+def test_verify_compact_crc_table(nvme0, crc_bits, crc_file):
+    region_end = 1024*1024*1024//512  # 1GB space
+    nvme0n1 = d.Namespace(nvme0, 1, region_end, crc_bits=crc_bits, crc_file=crc_file)
+    assert True == nvme0n1.verify_enable(True)
+    if crc_file:
+        assert os.path.getsize(crc_file) == region_end*crc_bits//8
+
+    nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=False,
+                     region_end=region_end,
+                     read_percentage=0, time=2).start().close()
+    r = nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=True,
+                         region_end=region_end,
+                         read_percentage=50, time=5).start().close()
+    assert r.error == 0
+
+    q = d.Qpair(nvme0, 8)
+    buf = d.Buffer(4096)
+    nvme0n1.write(q, buf, 0, 8).waitdone()
+    nvme0n1.read(q, buf, 0, 8).waitdone()
+    q.delete()
+    nvme0n1.close()
+
+
+def test_verify_save_load_crc(nvme0, nvme0n1, verify, qpair, tmp_path):
+    buf = d.Buffer(4096)
+    crc_snapshot = str(tmp_path/"nvme0n1.crc")
+    nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=False,
+                     region_end=100000,
+                     read_percentage=0, time=2).start().close()
+    nvme0n1.write(qpair, buf, 0, 8).waitdone()
+    assert nvme0n1.save_crc(crc_snapshot)
+
+    # crc of new data does not match the restored one
+    nvme0n1.write(qpair, buf, 0, 8).waitdone()
+    nvme0n1.read(qpair, buf, 0, 8).waitdone()
+    assert nvme0n1.load_crc(crc_snapshot)
+    with pytest.warns(UserWarning, match="ERROR status: 07/81"):
+        nvme0n1.read(qpair, buf, 0, 8).waitdone()
+
+    # restore crc after a new namespace is created
+    nvme0n1.write(qpair, buf, 0, 8).waitdone()
+    assert nvme0n1.save_crc(crc_snapshot)
+    nvme0n1.close()
+    nvme0n1 = d.Namespace(nvme0)
+    assert nvme0n1.load_crc(crc_snapshot)
+    assert nvme0n1.verify_enable(True)
+    nvme0n1.read(qpair, buf, 0, 8).waitdone()
+    r = nvme0n1.ioworker(io_size=8, lba_align=8, lba_random=True,
+                         region_end=100000,
+                         read_percentage=100, time=2).start().close()
+    assert r.error == 0
+
+    # snapshot of a different table
+    nvme0n1.close()
+    nvme0n1 = d.Namespace(nvme0, crc_bits=16)
+    assert not nvme0n1.load_crc(crc_snapshot)
+    nvme0n1.close()
+
+
 def test_write_uncorrectable(nvme0, nvme0n1):
     buf = d.Buffer(4096)
     q = d.Qpair(nvme0, 8)
@@ -1548,6 +1708,29 @@ def test_ioworker_skip_uncorrectable_lba(nvme0n1, qpair, buf):
     assert cmdlog_list[1][0] == 1064
 
 
+def test_ioworker_skip_partial_uncorrectable_lba(nvme0n1, qpair, buf):
+    cmdlog_list = [None]*2
+    nvme0n1.write_uncorrectable(qpair, 1004, 64).waitdone()
+    nvme0n1.write_uncorrectable(qpair, 2000, 8).waitdone()
+    nvme0n1.ioworker(io_size=8, io_count=126,
+                     read_percentage=0,
+                     lba_random=False,
+                     output_cmdlog_list=cmdlog_list).start().close()
+    # io partially overlapped with uncorrectable lba is also skipped
+    assert cmdlog_list[0][0] == 992
+    assert cmdlog_list[1][0] == 1072
+
+    # written lba is not uncorrectable anymore
+    nvme0n1.write(qpair, buf, 1000, 8).waitdone()
+    nvme0n1.write(qpair, buf, 1008, 8).waitdone()
+    nvme0n1.ioworker(io_size=8, io_count=127,
+                     read_percentage=0,
+                     lba_random=False,
+                     output_cmdlog_list=cmdlog_list).start().close()
+    assert cmdlog_list[0][0] == 1000
+    assert cmdlog_list[1][0] == 1008
+
+
 @pytest.mark.parametrize("io_count", [0, 1, 8, 9])
 @pytest.mark.parametrize("lba_count", [0, 1, 8, 9])
 @pytest.mark.parametrize("lba_offset", [0, 1, 8, 9])
@@ -2589,6 +2772,78 @@ def test_ioworker_io_sequence_read_write_trim_flush_uncorr(nvme0n1):
     assert cmdlog_list[-6][2] == 1
 
 
+def test_ioworker_io_sequence_file(nvme0n1, tmp_path):
+    # binary trace of (timestamp_ns, slba, nlba, op)
+    trace = tmp_path / "io.trace"
+    with open(trace, "wb") as f:
+        for i in range(10000):
+            f.write(struct.pack('<QQII', i*100000, i*8, 8, 1 if i%2 else 2))
+    cmdlog_list = [None]*10
+
+    r = nvme0n1.ioworker(io_sequence=str(trace),
+                         output_cmdlog_list=cmdlog_list).start().close()
+    assert r.io_count_read == 5000
+    assert r.io_count_nonread == 5000
+    assert r.mseconds >= 1000
+    assert cmdlog_list[-1] == (9999*8, 8, 1)
+
+    # incomplete record
+    with open(trace, "ab") as f:
+        f.write(b'\0')
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_sequence=str(trace))
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_sequence=str(tmp_path / "none.trace"))
+
+
+@pytest.mark.parametrize("slba, nlba", [(0, 0), (0, 0x10000), (0xffffffffffff, 8)])
+def test_ioworker_io_sequence_file_invalid_io(nvme0n1, tmp_path, slba, nlba):
+    # invalid io of external trace is not sent
+    trace = tmp_path / "io.trace"
+    with open(trace, "wb") as f:
+        for i in range(100):
+            f.write(struct.pack('<QQII', i*1000, i*8, 8, 2))
+        f.write(struct.pack('<QQII', 100*1000, slba, nlba, 2))
+    with pytest.warns(UserWarning, match="ioworker host ERROR -8: invalid io plan or sequence"):
+        nvme0n1.ioworker(io_sequence=str(trace)).start().close()
+
+
+def test_ioworker_io_sequence_replay_lag(nvme0, nvme0n1):
+    # a burst of 1000 read at the same time
+    r = nvme0n1.ioworker(io_sequence=[(0, 2, i*8, 8) for i in range(1000)],
+                         output_percentile_latency={99: 0}).start().close()
+    assert r.io_count_read == 1000
+    assert r.replay.io_count == 1000
+    assert r.replay.lag_max_us >= r.replay.lag[99]
+    assert sum(r.replay.lag_distribution) == 1000
+
+    # deeper queue for the burst, buffers sized by the largest io in the list
+    qdepth = min(1024, (nvme0.cap & 0xffff) + 1)
+    r = nvme0n1.ioworker(io_sequence=[(0, 2, i*8, 8) for i in range(1000)],
+                         qdepth=qdepth).start().close()
+    assert r.io_count_read == 1000
+    assert r.replay.io_count == 1000
+
+    # sparse io is sent in time
+    r = nvme0n1.ioworker(io_sequence=[(i*10000, 2, 0, 8) for i in range(100)]).start().close()
+    assert r.replay.io_count == 100
+    assert r.replay.lag[50] < 1000
+
+
+def test_ioworker_io_sequence_replay_speed(nvme0n1):
+    cmd_seq = [(i*20000, 2, 0, 8) for i in range(101)]  # 2s
+
+    r = nvme0n1.ioworker(io_sequence=cmd_seq, replay_speed=2).start().close()
+    assert r.mseconds >= 1000
+    assert r.mseconds < 1900
+
+    r = nvme0n1.ioworker(io_sequence=cmd_seq, replay_speed=0.5).start().close()
+    assert r.mseconds >= 4000
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_sequence=cmd_seq, replay_speed=0)
+
+
 def test_ioworker_io_sequence_uncorr_and_read(nvme0n1):
     cmd_seq = [(000000, 1, 0, 8),
                (200000, 4, 0, 8),
@@ -2624,6 +2879,63 @@ def test_ioworker_distribution(nvme0n1, repeat):
     logging.debug(r)
 
 
+@pytest.mark.parametrize("lba_distribution", [('zipf', 0.99),
+                                              ('pareto', 0.2),
+                                              ('gaussian', 0.1),
+                                              ('hotcold', [(0.1, 50), (9.9, 30), (90, 20)])])
+def test_ioworker_lba_distribution(nvme0n1, lba_distribution):
+    cmdlog_list = [None]*1000
+    region_end = 1024*1024
+    r = nvme0n1.ioworker(io_size=8, lba_align=8,
+                         lba_random=True, qdepth=16,
+                         region_start=1024, region_end=region_end,
+                         lba_distribution=lba_distribution,
+                         output_cmdlog_list=cmdlog_list,
+                         read_percentage=100, time=2).start().close()
+    assert r.error == 0
+    for lba, count, opcode in cmdlog_list:
+        assert lba >= 1024 and lba < region_end
+        assert lba%8 == 0
+
+    # the hot set of the region
+    if lba_distribution[0] in ('zipf', 'pareto', 'hotcold'):
+        hot = [lba for lba, c, o in cmdlog_list if lba < 1024+region_end//10]
+        assert len(hot) > 500
+
+
+def test_ioworker_lba_permutation(nvme0n1):
+    # fill the region in random order, one pass
+    cmdlog_list = [None]*1000
+    r = nvme0n1.ioworker(io_size=8, lba_random='permutation',
+                         region_start=0, region_end=8000,
+                         read_percentage=0,
+                         output_cmdlog_list=cmdlog_list).start().close()
+    assert r.io_count_write == 1000
+    assert sorted(lba for lba, c, o in cmdlog_list) == list(range(0, 8000, 8))
+    assert [lba for lba, c, o in cmdlog_list] != list(range(0, 8000, 8))
+
+    # repeat in another order
+    r = nvme0n1.ioworker(io_size=8, lba_random='permutation',
+                         region_start=0, region_end=8000,
+                         read_percentage=100, io_count=1500).start().close()
+    assert r.io_count_read == 1500
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, lba_random='permutation',
+                         lba_distribution=('zipf', 0.9))
+
+
+def test_ioworker_lba_distribution_invalid(nvme0n1):
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, lba_distribution=('zipf', 1.5))
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, lba_distribution=('hotcold', [(10, 50), (80, 50)]))
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, lba_random=False, lba_distribution=('pareto', 0.2))
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, lba_distribution=('uniform', 0))
+
+
 def test_ioworker_simplified_context(nvme0n1):
     with nvme0n1.ioworker(io_size=8, lba_align=16,
                           lba_random=True, qdepth=16,
@@ -2643,7 +2955,10 @@ def test_ioworker_output_io_per_latency(nvme0n1, nvme0):
     logging.debug(output_percentile_latency)
     heavy_latency_average = r.latency_average_us
     max_iops = (r.io_count_read+r.io_count_nonread)*1000//r.mseconds
-    assert len(r.latency_distribution) == 1000000
+    assert len(r.latency_distribution) == 1024
+    assert sum(r.latency_distribution) == r.io_count_read+r.io_count_nonread
+    assert output_percentile_latency[50] == \
+        d.latency_histogram_percentile(r.latency_distribution, 50)
 
     # limit iops, should get smaller latency
     output_percentile_latency = dict.fromkeys([10, 50, 90, 99, 99.9, 99.99, 99.999, 99.99999])
@@ -2666,6 +2981,140 @@ def test_ioworker_output_io_per_latency(nvme0n1, nvme0):
     assert output_percentile_latency[99.999] <= output_percentile_latency[99.99999]
 
 
+def test_ioworker_output_tables_long_time(nvme0n1):
+    # time=0 allocates io counter table for 1000 hours
+    io_per_second = []
+    percentile_latency = dict.fromkeys([99, 99.9])
+    w = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                         read_percentage=100, io_count=10000,
+                         output_io_per_second=io_per_second,
+                         output_percentile_latency=percentile_latency).start()
+    time.sleep(3)
+    start_time = time.time()
+    r = w.close()
+    assert time.time()-start_time < 1
+    assert len(io_per_second) == r.mseconds//1000
+    assert sum(r.latency_distribution) == 10000
+    assert percentile_latency[99] <= percentile_latency[99.9]
+
+
+def test_ioworker_output_tables_values(nvme0n1):
+    # read the values of output tables in shared memory
+    io_per_second = []
+    percentile_latency = dict.fromkeys([50, 99])
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                         read_percentage=100, time=3, iops=1000,
+                         output_io_per_second=io_per_second,
+                         output_percentile_latency=percentile_latency).start().close()
+    assert len(io_per_second) == 3
+    for iops in io_per_second:
+        assert type(iops) is int
+        assert 900 <= iops <= 1100
+    assert sum(io_per_second) <= r.io_count_read
+    h = r.latency_distribution
+    assert len(h) == len(d.latency_histogram_merge(h))
+    assert sum(h) == r.io_count_read
+    assert max(h[i] for i in range(len(h))) > 0
+    assert 0 < percentile_latency[50] <= percentile_latency[99]
+
+    # the table of the pool is copied before it is reused
+    with d.IOWorkerPool(nvme0n1) as pool:
+        io_per_second = []
+        r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                             read_percentage=100, time=2,
+                             output_io_per_second=io_per_second,
+                             output_percentile_latency=dict.fromkeys([99]),
+                             pool=pool).start().close()
+        assert len(io_per_second) == 2 and min(io_per_second) > 0
+        assert type(r.latency_distribution) is list
+        assert sum(r.latency_distribution) == r.io_count_read
+
+
+def test_ioworker_latency_histogram_merge(nvme0n1):
+    output_percentile_latency = dict.fromkeys([99])
+    w1 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                          read_percentage=100, time=3,
+                          output_percentile_latency=output_percentile_latency).start()
+    w2 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                          read_percentage=100, time=3,
+                          output_percentile_latency=output_percentile_latency).start()
+    r1 = w1.close()
+    r2 = w2.close()
+
+    h = d.latency_histogram_merge(r1.latency_distribution, r2.latency_distribution)
+    assert sum(h) == r1.io_count_read+r2.io_count_read
+    p99 = d.latency_histogram_percentile(h, 99)
+    logging.info("merged p99 latency: %.3fus" % p99)
+    assert p99 <= max(r1.latency_max_us, r2.latency_max_us)*1.04
+    assert d.latency_histogram_value(0) == 0
+    assert d.latency_histogram_value(1023) > 60*1000*1000
+
+
+def test_ioworker_multiple_qpairs(nvme0n1):
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                         qcount=8, read_percentage=100, time=3).start().close()
+    assert len(r.qpairs) == 8
+    assert sum(q.io_count_read for q in r.qpairs) == r.io_count_read
+    for q in r.qpairs:
+        assert q.io_count_read > 0
+        assert q.latency_max_us <= r.latency_max_us
+
+    # qpairs share the limited iops in the ratio of weights
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                         qcount=2, qweight=[1, 4], iops=20000,
+                         read_percentage=100, time=3).start().close()
+    assert len(r.qpairs) == 2
+    ratio = r.qpairs[1].io_count_read/r.qpairs[0].io_count_read
+    logging.info("weighted io ratio: %f" % ratio)
+    assert 3.8 < ratio < 4.2
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, qcount=2, qweight=[0, 1], time=1)
+
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                         qcount=4, read_percentage=100, io_count=10).start().close()
+    assert r.io_count_read == 10
+
+
+def test_ioworker_burst(nvme0n1):
+    r1 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=128,
+                          read_percentage=100, time=5).start().close()
+    r2 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=128,
+                          burst_max=32, read_percentage=100,
+                          time=5).start().close()
+    logging.info("cpu usage: %f, burst %f" % (r1.cpu_usage, r2.cpu_usage))
+    logging.info("iops: %d, burst %d" % (r1.io_count_read/5, r2.io_count_read/5))
+    assert r2.error == 0
+    assert r2.io_count_read > 0
+
+    r = nvme0n1.ioworker(io_size=8, lba_random=False, qdepth=64, qcount=2,
+                         burst_max=64, read_percentage=0,
+                         io_count=1000).start().close()
+    assert r.io_count_write == 1000
+
+
+def test_ioworker_pool(nvme0n1):
+    with d.IOWorkerPool(nvme0n1, count=2) as pool:
+        start_time = time.time()
+        for i in range(10):
+            r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                                 read_percentage=100, io_count=100,
+                                 pool=pool).start().close()
+            assert r.io_count_read == 100
+        logging.info("10 ioworkers in the pool take %fs" % (time.time()-start_time))
+
+        # concurrent ioworkers in the pool, with different qpair configuration
+        w1 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=16,
+                              read_percentage=100, time=2, pool=pool).start()
+        w2 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=32, qcount=2,
+                              read_percentage=0, time=2, pool=pool).start()
+        r1 = w1.close()
+        r2 = w2.close()
+        assert r1.io_count_read > 0
+        assert r2.io_count_write > 0
+        assert len(r2.qpairs) == 2
+
+
 def test_ioworker_iops_deep_queue(nvme0n1):
     r = nvme0n1.ioworker(io_size=8,
                          lba_random=True,
@@ -2683,6 +3132,117 @@ def test_ioworker_iops_deep_queue(nvme0n1):
     assert r.io_count_read <= 1024+2*2000
 
 
+def test_ioworker_rate_limiter(nvme0n1):
+    # iops is accurate at high rate
+    output_io_per_second = []
+    r = nvme0n1.ioworker(io_size=1, lba_random=True, qdepth=256,
+                         read_percentage=100, iops=300000, time=5,
+                         output_io_per_second=output_io_per_second).start().close()
+    logging.info(output_io_per_second)
+    if r.io_count_read >= 5*300000*0.99:
+        assert output_io_per_second[-1] >= 300000*0.99
+        assert output_io_per_second[-1] <= 300000*1.01
+    assert r.io_count_read <= 5*300000+1
+
+    # bandwidth limit in MB/s
+    r = nvme0n1.ioworker(io_size=256, lba_random=False, qdepth=16,
+                         read_percentage=100, bandwidth=100, time=5).start().close()
+    assert r.io_count_read*256*512 <= 5*100*1000*1000+256*512
+
+    # burst and both limits
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                         read_percentage=0, iops=10000, rate_burst=32,
+                         bandwidth=20, time=2).start().close()
+    assert r.io_count_write <= 2*20*1000*1000//4096+32
+
+    # poisson and jitter arrival at the mean rate
+    for arrival in ('poisson', 'jitter'):
+        output_io_per_second = []
+        r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                             read_percentage=100, iops=10000, time=5,
+                             arrival=arrival, jitter=20,
+                             output_io_per_second=output_io_per_second).start().close()
+        logging.info(output_io_per_second)
+        assert r.io_count_read >= 5*10000*0.95
+        assert r.io_count_read <= 5*10000*1.05
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, arrival='poisson')
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, iops=100, arrival='burst')
+
+
+def test_ioworker_latency_target(nvme0n1):
+    output_percentile_latency = dict.fromkeys([99])
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=256,
+                         read_percentage=100, time=20,
+                         latency_target=(99, 500),
+                         output_percentile_latency=output_percentile_latency).start().close()
+    logging.info(r.latency_target)
+    assert r.latency_target.windows > 0
+    assert r.latency_target.iops > 0
+    assert r.latency_target.qdepth >= 1
+    assert r.latency_target.qdepth <= 255
+    assert r.latency_target.percentile_latency_us <= 500
+
+    # a very tight target limits the rate at queue depth 1
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                         read_percentage=100, time=5,
+                         latency_target=(99.9, 1)).start().close()
+    logging.info(r.latency_target)
+    assert r.latency_target.windows > 0
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, iops=1000, latency_target=(99, 200))
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, latency_target=(100, 200))
+
+
+def test_ioworker_op_stats(nvme0n1):
+    output_percentile_latency = dict.fromkeys([50, 99, 99.9])
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                         op_percentage={2: 70, 1: 30}, time=5,
+                         output_percentile_latency=output_percentile_latency).start().close()
+    logging.info(r.op_stats[2].latency)
+    logging.info(r.op_stats[1].latency)
+    assert r.op_stats[2].io_count == r.io_count_read
+    assert r.op_stats[1].io_count == r.io_count_write
+    assert r.op_stats[2].bytes == r.io_count_read*8*512
+    assert r.op_stats[1].bytes == r.io_count_write*8*512
+    assert max(r.op_stats[2].latency_max_us, r.op_stats[1].latency_max_us) == r.latency_max_us
+    assert sum(r.op_stats[2].latency_distribution) == r.op_stats[2].io_count
+    assert r.op_stats[2].latency[50] <= r.op_stats[2].latency[99.9]
+
+    # no histogram without output_percentile_latency
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                         op_percentage={2: 50, 9: 50}, time=2).start().close()
+    assert r.op_stats[9].io_count > 0
+    assert r.op_stats[9].latency_average_us > 0
+    assert 'latency' not in r.op_stats[2]
+
+
+def test_ioworker_sweep(nvme0n1):
+    r = nvme0n1.ioworker(lba_random=True, read_percentage=100,
+                         sweep={'qdepth': [1, 2, 4, 8, 16, 32, 64, 128, 256],
+                                'io_size': [1, 8, 256],
+                                'time': 1,
+                                'percentile': [99, 99.9]}).start().close()
+    assert len(r.sweep) == 27
+    for step in r.sweep:
+        logging.info(step)
+        assert step.io_count > 0
+        assert step.mseconds >= 1000
+        assert 99 in step.latency
+        assert step.latency[99] <= step.latency[99.9]
+    assert r.sweep[0].qdepth == 1 and r.sweep[0].io_size == 1
+    assert r.sweep[-1].qdepth == 256 and r.sweep[-1].io_size == 256
+    assert r.sweep[8].iops > r.sweep[0].iops
+    assert r.sweep[26].bandwidth > r.sweep[8].bandwidth
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_count=100, sweep={'qdepth': [1, 2]})
+
+
 def test_ioworker_output_io_per_second(nvme0n1, nvme0):
     nvme0n1.format(512)
 
@@ -2907,6 +3467,63 @@ def test_ioworker_iops_confliction_after_reset(nvme0, pcie):
     nvme0n1.close()
 
 
+@pytest.mark.parametrize("io_size", [1, 3, 4, 5, 63, 64, 65, 256])
+def test_ioworker_verify_io_size(nvme0n1, verify, io_size):
+    # crc of all lba in one io are calculated in batches
+    assert verify == True
+    nvme0n1.ioworker(io_size=io_size, lba_random=False,
+                     region_start=0, region_end=io_size*1000,
+                     read_percentage=0).start().close()
+    r = nvme0n1.ioworker(io_size=io_size, lba_random=False,
+                         region_start=0, region_end=io_size*1000,
+                         read_percentage=100).start().close()
+    assert r.error == 0
+    assert r.io_count_read == 1000
+
+
+def test_ioworker_verify_threads(nvme0n1, qpair, verify):
+    assert verify == True
+
+    nvme0n1.ioworker(io_size=256, lba_random=False,
+                     region_start=0, region_end=256*1000,
+                     read_percentage=0).start().close()
+    r = nvme0n1.ioworker(io_size=256, lba_random=True, qdepth=64,
+                         region_start=0, region_end=256*1000,
+                         read_percentage=100, time=2,
+                         verify_threads=4).start().close()
+    assert r.error == 0
+    assert r.io_count_read > 0
+
+    # mixed read/write on overlapped lba, in one and two ioworkers
+    r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                         region_start=0, region_end=64,
+                         read_percentage=50, time=3,
+                         verify_threads=4).start().close()
+    assert r.error == 0
+    assert r.io_count_read > 0 and r.io_count_nonread > 0
+    w1 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=32,
+                          region_start=0, region_end=64,
+                          read_percentage=50, time=3,
+                          verify_threads=2).start()
+    w2 = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=32,
+                          region_start=0, region_end=64,
+                          read_percentage=50, time=3).start()
+    assert w1.close().error == 0
+    assert w2.close().error == 0
+
+    # overwrite lba 0 without pynvme's injected data
+    buf = d.Buffer(512, ptype=32, pvalue=0x5aa5a55a)
+    nvme0n1.send_cmd(1, qpair, buf).waitdone()
+    with pytest.warns(UserWarning, match="ERROR status: 07/81"):
+        nvme0n1.ioworker(io_size=256, lba_random=False,
+                         region_start=0, region_end=256*1000,
+                         read_percentage=100, time=2,
+                         verify_threads=4).start().close()
+
+    with pytest.raises(AssertionError):
+        nvme0n1.ioworker(io_size=8, time=1, verify_threads=17)
+
+
 def test_ioworker_iops(nvme0n1):
     import time
     start_time = time.time()
@@ -3127,6 +3744,42 @@ def test_io_conflict(nvme0, nvme0n1, buf, verify):
     qpair.delete()
 
 
+def test_io_conflict_overlapped_range(nvme0, nvme0n1, verify):
+    assert verify
+
+    qpair = d.Qpair(nvme0, 1024)
+    buf_list = [d.Buffer(64*512) for i in range(4)]
+
+    # overlapped lba ranges are locked by in-flight commands one by one
+    for i in range(250):
+        for j, buf in enumerate(buf_list):
+            nvme0n1.write(qpair, buf, j*16, 64)
+    qpair.waitdone(1000)
+    for j, buf in enumerate(buf_list):
+        nvme0n1.read(qpair, buf, j*16, 64)
+    qpair.waitdone(4)
+    qpair.delete()
+
+
+def test_io_conflict_dsm_ranges(nvme0, nvme0n1, verify):
+    assert verify
+
+    # dsm locks its ranges, not the span between them
+    nsze = nvme0n1.id_data(7, 0)
+    qpair = d.Qpair(nvme0, 16)
+    buf = d.Buffer(4096)
+    buf.set_dsm_range(0, 0, 8)
+    buf.set_dsm_range(1, nsze-8, 8)
+    with nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                          region_start=1024, region_end=nsze-1024,
+                          read_percentage=50, time=5) as w:
+        time.sleep(1)
+        for i in range(100):
+            nvme0n1.dsm(qpair, buf, 2).waitdone()
+        assert w.running
+    qpair.delete()
+
+
 def test_ioworker_trim_rw_without_confliction(nvme0n1, verify):
     assert verify
 
@@ -3259,6 +3912,55 @@ def test_io_cmd_log(nvme0, nvme0n1):
     q.delete()
 
 
+def test_io_cmd_log_mode(nvme0, nvme0n1, verify):
+    assert verify == True
+
+    q = d.Qpair(nvme0, 16)
+    buf = d.Buffer(512)
+    nvme0n1.write(q, buf, 0).waitdone()
+    for mode in ('off', 'error', 2, 'full'):
+        q.cmdlog_mode(mode)
+        for i in range(5):
+            nvme0n1.read(q, buf, 0).waitdone()
+        q.cmdlog(15)
+
+    # data verify still works without the cmdlog
+    q.cmdlog_mode('off')
+    nvme0n1.write_uncorrectable(q, 0, 1).waitdone()
+    with pytest.warns(UserWarning, match="ERROR status: 02/81"):
+        nvme0n1.read(q, buf, 0).waitdone()
+
+    # failed commands are logged with their latency
+    q.cmdlog_mode('error')
+    with pytest.warns(UserWarning, match="ERROR status: 02/81"):
+        nvme0n1.read(q, buf, 0).waitdone()
+    assert q.latest_latency > 0
+    q.cmdlog(1)
+    nvme0n1.write(q, buf, 0).waitdone()
+    nvme0n1.read(q, buf, 0).waitdone()
+
+    with pytest.raises(AssertionError):
+        q.cmdlog_mode('on')
+    with pytest.raises(AssertionError):
+        q.cmdlog_mode(0)
+    q.delete()
+
+
+def test_ioworker_cmdlog_mode(nvme0n1, verify):
+    assert verify == True
+
+    nvme0n1.ioworker(io_size=8, lba_random=False,
+                     region_start=0, region_end=8*1000,
+                     read_percentage=0).start().close()
+    for cmdlog in ('full', 1000, 'error', 'off'):
+        r = nvme0n1.ioworker(io_size=8, lba_random=True, qdepth=64,
+                             region_start=0, region_end=8*1000,
+                             read_percentage=100, time=2,
+                             cmdlog=cmdlog).start().close()
+        assert r.error == 0
+        logging.info("cmdlog %s: %d IOPS" % (cmdlog, r.io_count_read//2))
+
+
 def test_cmd_cb_features(nvme0):
     orig_config = 0
 
@@ -58,12 +58,19 @@ def test_swl_only(nvme0: d.Controller, nvme0n1: d.Namespace, verify):
     io_per_second = []
     logging.info("write hot sequential data")
     # 10GB seq write
-    nvme0n1.ioworker(io_size=8,
-                     lba_random=False,
-                     region_end=10*1024*1024*1024//512, #10GB
-                     read_percentage=0,
-                     time=10*3600,
-                     output_io_per_second=io_per_second).start().close()
+    w = nvme0n1.ioworker(io_size=8,
+                         lba_random=False,
+                         region_end=10*1024*1024*1024//512, #10GB
+                         read_percentage=0,
+                         time=10*3600,
+                         output_io_per_second=io_per_second).start()
+    while w.running:
+        # monitor the throughput of the running ioworker
+        time.sleep(60)
+        s = w.stats()
+        logging.info("%ds: %d IOPS, %dMB written" %
+                     (s.mseconds//1000, s.iops, s.bytes_nonread//1000000))
+    w.close()
     logging.info(io_per_second)
 
     logging.info("verify whole drive")
@@ -71,8 +71,9 @@ def do_fill_drive(rand, nvme0n1, nvme0, filename):
     io_per_second = []
     output_percentile_latency = dict.fromkeys([99.9])
     
+    # random fill visits every lba once
     w = nvme0n1.ioworker(io_size=io_size, lba_align=io_size,
-                         lba_random=rand, qdepth=64,
+                         lba_random='permutation' if rand else False, qdepth=64,
                          io_count=io_count, read_percentage=0,
                          output_percentile_latency=output_percentile_latency,
                          output_io_per_second=io_per_second).start()
@@ -84,10 +85,11 @@ def do_fill_drive(rand, nvme0n1, nvme0, filename):
     
     import matplotlib.pyplot as plt
     plt.figure(figsize=(30, 12))
-    plt.plot(r.latency_distribution)
+    latency = [d.latency_histogram_value(i) for i in range(len(r.latency_distribution))]
+    plt.plot(latency, r.latency_distribution)
     plt.xlabel('useconds')
     plt.ylabel('#IO')
-    plt.xlim(1, len(r.latency_distribution))
+    plt.xlim(latency[1], latency[-1])
     plt.ylim(bottom=1)
     plt.xscale('log')
     plt.yscale('log')
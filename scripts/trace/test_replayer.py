@@ -33,9 +33,12 @@
 # -*- coding: utf-8 -*-
 
 
+import os
 import pytest
+import struct
 import logging
 import zipfile
+import tempfile
 
 import nvme as d
 
@@ -50,14 +53,15 @@ def test_replay_pynvme_trace(nvme0, nvme0n1, accelerator=1.0):
         # format before replay
         nvme0n1.format(512)
         
-        responce_time = [0]*1000000
+        responce_time = [0]*1024
         replay_logfile(filename, nvme0n1, nvme0.mdts, accelerator, responce_time)
 
         import matplotlib.pyplot as plt
-        plt.plot(responce_time)
+        latency = [d.latency_histogram_value(i) for i in range(len(responce_time))]
+        plt.plot(latency, responce_time)
         plt.xlabel('useconds')
         plt.ylabel('# IO')
-        plt.xlim(1, len(responce_time))
+        plt.xlim(latency[1], latency[-1])
         plt.ylim(bottom=1)
         plt.xscale('log')
         plt.yscale('log')
@@ -96,28 +100,32 @@ def replay_logfile(filename, nvme0n1, mdts, accelerator, responce_time):
     for start in range(0, len(files), 4):
         ioworkers = []
 
-        # start 4 ioworkers
-        io_sequences = [[], [], [], []]
+        # convert to binary trace files, streamed by the ioworker
+        io_sequences = []
         for i in range(4):
             filepath = files[start+i]
+            trace = tempfile.NamedTemporaryFile(suffix='.trace', delete=False)
             for line in zfile.open(filepath):
                 line = line.split()
-                time = int(float(line[0])/accelerator)
+                time = int(float(line[0])*1000/accelerator)  # ns
                 op = opcode[line[1]]
                 slba = int(line[2])
                 nlba = int(line[3])
                 if b'write' in line or b'read' in  line:
                     while nlba:
                         n = min(nlba, max_lba)
-                        io_sequences[i].append((time, op, slba, n))
+                        trace.write(struct.pack('<QQII', time, slba, n, op))
                         slba += n
                         nlba -= n
                 else:
-                    io_sequences[i].append((time, op, slba, nlba))
+                    trace.write(struct.pack('<QQII', time, slba, nlba, op))
 
             # add a dummy io to force ioworker run
-            io_sequences[i].append((300*1000000/accelerator, 0, 0, 1))
+            trace.write(struct.pack('<QQII', int(300*1000000000/accelerator), 0, 1, 0))
+            trace.close()
+            io_sequences.append(trace.name)
 
+        # start 4 ioworkers
         for i in range(4):
             logging.info("replaying IO in trace file %d" % (start+i))
             w = nvme0n1.ioworker(io_sequence=io_sequences[i],
@@ -129,10 +137,11 @@ def replay_logfile(filename, nvme0n1, mdts, accelerator, responce_time):
         rs = [[], [], [], []]
         for i, w in enumerate(ioworkers):
             rs[i] = w.close()
+            os.remove(io_sequences[i])
 
         for i in range(4):
-            for j in range(1000000):
-                responce_time[j] += rs[i].latency_distribution[j]
+            responce_time[:] = d.latency_histogram_merge(responce_time,
+                                                         rs[i].latency_distribution)
 
             # GUI progress
             progress += 1
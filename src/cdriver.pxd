@@ -48,10 +48,71 @@ cdef extern from "driver.h":
         unsigned int count;
         unsigned int opcode;
     ctypedef struct ioworker_ioseq:
-        unsigned long slba;
-        unsigned int timestamp;
-        unsigned int op;
-        unsigned int nlba;
+        unsigned long timestamp
+        unsigned long slba
+        unsigned int nlba
+        unsigned int op
+    ctypedef struct ioworker_plan:
+        unsigned long slba
+        unsigned int nlba
+        unsigned int op
+    ctypedef struct ioworker_rets:
+        unsigned long io_count_read
+        unsigned long io_count_nonread
+        unsigned int mseconds
+        unsigned int latency_max_us
+        unsigned short error
+        unsigned int cpu_usage
+        unsigned int latency_average_us
+    enum: LATENCY_HISTOGRAM_BUCKETS
+    enum: IOWORKER_PLAN_BATCH
+    enum: IOWORKER_LBA_ZIPF
+    enum: IOWORKER_LBA_PARETO
+    enum: IOWORKER_LBA_GAUSSIAN
+    enum: IOWORKER_LBA_HOTCOLD
+    enum: IOWORKER_HOTCOLD_LEVELS_MAX
+    enum: IOWORKER_ARRIVAL_FIXED
+    enum: IOWORKER_ARRIVAL_POISSON
+    enum: IOWORKER_ARRIVAL_JITTER
+    enum: IOWORKER_VERIFY_THREADS_MAX
+    enum: CRC_TABLE_FILE_LEN
+    enum: CMDLOG_MODE_FULL
+    enum: CMDLOG_MODE_SAMPLE
+    enum: CMDLOG_MODE_ERROR
+    enum: CMDLOG_MODE_OFF
+    ctypedef struct ioworker_target:
+        double percentile
+        unsigned int latency_us
+        unsigned int qdepth
+        unsigned int iops
+        unsigned int percentile_latency_us
+        unsigned int windows
+    ctypedef struct ioworker_op_stats:
+        unsigned long io_count
+        unsigned long bytes
+        unsigned long latency_total_ns
+        unsigned int latency_max_us
+    ctypedef struct ioworker_replay:
+        unsigned long io_count
+        unsigned long lag_total_ns
+        unsigned int lag_max_us
+    ctypedef struct ioworker_sweep:
+        unsigned int qdepth
+        unsigned int io_size
+        unsigned long io_count
+        unsigned long bytes
+        unsigned long latency_total_ns
+        unsigned int mseconds
+    ctypedef struct ioworker_stats:
+        unsigned long sequence
+        unsigned long io_count_read
+        unsigned long io_count_nonread
+        unsigned long bytes_read
+        unsigned long bytes_nonread
+        unsigned int mseconds
+        unsigned int iops
+        unsigned int latency_max_us
+        unsigned long latency_histogram[LATENCY_HISTOGRAM_BUCKETS]
     ctypedef struct ioworker_args:
         unsigned long lba_start
         unsigned int lba_size_max
@@ -74,7 +135,7 @@ cdef extern from "driver.h":
         unsigned int pvalue
         unsigned int ptype
         ioworker_ioseq* io_sequence
-        unsigned int io_sequence_len
+        unsigned long io_sequence_len
         unsigned int* io_counter_per_second
         unsigned long* io_counter_per_latency
         unsigned int* distribution
@@ -83,14 +144,35 @@ cdef extern from "driver.h":
         unsigned int* op_list
         unsigned long* op_counter
         unsigned int op_num
-    ctypedef struct ioworker_rets:
-        unsigned long io_count_read
-        unsigned long io_count_nonread
-        unsigned int mseconds
-        unsigned int latency_max_us
-        unsigned short error
-        unsigned int cpu_usage
-        unsigned int latency_average_us
+        unsigned int qcount
+        unsigned int* qweight
+        ioworker_rets* qpair_rets
+        ioworker_stats* stats
+        unsigned int burst_max
+        ioworker_plan* io_plan
+        unsigned long io_plan_len
+        unsigned int io_plan_batch
+        unsigned long bandwidth
+        unsigned int rate_burst
+        unsigned short arrival
+        unsigned short jitter
+        ioworker_target* target
+        ioworker_sweep* sweep
+        unsigned int sweep_len
+        unsigned int sweep_dwell_ms
+        unsigned long* sweep_histogram
+        ioworker_op_stats* op_stats
+        unsigned long* op_histogram
+        unsigned short lba_distribution
+        double lba_distribution_param
+        unsigned int* lba_hotcold
+        unsigned int lba_hotcold_len
+        bint lba_permutation
+        char* io_sequence_file
+        double replay_speed
+        ioworker_replay* replay
+        unsigned long* replay_histogram
+        unsigned int verify_threads
 
     ctypedef void(*cmd_cb_func)(void * cmd_cb_arg, const cpl * cpl)
     ctypedef void(*timeout_cb_func)(void * cb_arg, ctrlr * ctrlr,
@@ -162,17 +244,22 @@ cdef extern from "driver.h":
                          unsigned int prio,
                          unsigned int depth,
                          bint ien,
-                         unsigned short iv)
+                         unsigned short iv,
+                         bint delay_doorbell)
     int qpair_wait_completion(qpair * q, unsigned int max_completions)
     unsigned short qpair_get_latest_cid(qpair * q, ctrlr* c)
     unsigned int qpair_get_latest_latency(qpair * q, ctrlr* c)
 
     int qpair_get_id(qpair * q)
+    void qpair_cmdlog_mode(qpair * q, unsigned int mode, unsigned int sample)
     int qpair_free(qpair * q)
 
-    namespace * ns_init(ctrlr * c, unsigned int nsid, unsigned long nlba_verify)
+    namespace * ns_init(ctrlr * c, unsigned int nsid, unsigned long nlba_verify,
+                        unsigned int crc_bits, const char * crc_file)
     int ns_refresh(namespace * ns, unsigned int nsid, ctrlr * c)
     bint ns_verify_enable(namespace * ns, bint enable)
+    int ns_crc_save(namespace * ns, const char * file)
+    int ns_crc_load(namespace * ns, const char * file)
     int ns_cmd_io(unsigned char opcode,
                   namespace * ns,
                   qpair * qpair,
@@ -191,9 +278,14 @@ cdef extern from "driver.h":
     int ns_fini(namespace * ns)
 
     int ioworker_entry(namespace* ns,
-                       qpair* qpair,
+                       qpair** qpair_list,
                        ioworker_args* args,
                        ioworker_rets* rets)
+    unsigned int latency_histogram_index(unsigned long ns)
+    unsigned long latency_histogram_value(unsigned int index)
+    unsigned long latency_histogram_percentile(unsigned long* histogram,
+                                               double percentile)
+    void ioworker_stats_read(ioworker_stats* stats, ioworker_stats* snapshot)
 
     char* log_buf_dump(const char * header, const void * buf, size_t len, size_t base)
     void log_cmd_dump(qpair * qpair, size_t count)
@@ -36,52 +36,90 @@
 
 #include "../spdk/lib/nvme/nvme_internal.h"
 
+#ifdef __SSE4_2__
+#include <nmmintrin.h>
+#endif
+
 
 static uint64_t* g_driver_io_token_ptr = NULL;
 static uint64_t* g_driver_config_ptr = NULL;
 static bool g_driver_crc32_memory_enough = false;
+static bool g_driver_verify_offload = false;
 
 
-////module: timeval
+////module: timestamp
 ///////////////////////////////
 
-static struct timespec tv_diff;
+// all timestamps in the driver are nanoseconds of the monotonic TSC
+// clock. The calibration is shared by primary and secondary processes, so
+// timestamps taken in different processes are comparable.
+#define DRIVER_TIMESTAMP_NAME   "driver_timestamp_clock"
+#define TIMESTAMP_SHIFT         (32)
+
+struct timestamp_clock_t {
+  uint64_t tsc_mult;       // ns per tick, fixed-point of TIMESTAMP_SHIFT
+  uint64_t wall_offset_ns; // realtime = monotonic + wall_offset_ns
+};
+
+static struct timestamp_clock_t* g_timestamp_clock = NULL;
+static uint64_t g_timestamp_tsc_mult = 0;
 
 
-static void timeval_init(void)
+static uint64_t timestamp_clock_ns(clockid_t clk_id)
 {
   struct timespec ts;
-  struct timeval tv;
-
-  gettimeofday(&tv, NULL);
-  clock_gettime(CLOCK_MONOTONIC, &ts);
 
-  tv_diff.tv_sec = tv.tv_sec-ts.tv_sec-1;
-  tv_diff.tv_nsec = (1<<30)+tv.tv_usec*1000-ts.tv_nsec;
+  clock_gettime(clk_id, &ts);
+  return ts.tv_sec*NS_PER_S + ts.tv_nsec;
 }
 
 
-uint32_t timeval_to_us(struct timeval* t)
+static void timestamp_init(void)
 {
-  return t->tv_sec*US_PER_S + t->tv_usec;
+  if (spdk_process_is_primary())
+  {
+    uint64_t hz = spdk_get_ticks_hz();
+
+    assert(g_timestamp_clock == NULL);
+    assert(hz != 0);
+    g_timestamp_clock = spdk_memzone_reserve(DRIVER_TIMESTAMP_NAME,
+                                             sizeof(struct timestamp_clock_t),
+                                             0,
+                                             0);
+    assert(g_timestamp_clock != NULL);
+    g_timestamp_clock->tsc_mult = (NS_PER_S<<TIMESTAMP_SHIFT)/hz;
+    g_timestamp_tsc_mult = g_timestamp_clock->tsc_mult;
+    g_timestamp_clock->wall_offset_ns =
+        timestamp_clock_ns(CLOCK_REALTIME) - timestamp_ns();
+  }
+  else
+  {
+    g_timestamp_clock = spdk_memzone_lookup(DRIVER_TIMESTAMP_NAME);
+    assert(g_timestamp_clock != NULL);
+    g_timestamp_tsc_mult = g_timestamp_clock->tsc_mult;
+  }
+
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "tsc mult 0x%lx, wall offset %ld ns\n",
+                g_timestamp_clock->tsc_mult, g_timestamp_clock->wall_offset_ns);
 }
 
 
-void timeval_gettimeofday(struct timeval *tv)
+uint64_t timestamp_ns(void)
 {
-  struct timespec ts;
+  // one rdtsc and one multiply in the IO path, no syscall
+  return ((unsigned __int128)spdk_get_ticks()*g_timestamp_tsc_mult)>>TIMESTAMP_SHIFT;
+}
 
-  assert(tv != NULL);
 
-  // gettimeofday is affected by NTP and etc, so use clock_gettime
-  clock_gettime(CLOCK_MONOTONIC, &ts);
-  tv->tv_sec = ts.tv_sec+tv_diff.tv_sec;
-  tv->tv_usec = (ts.tv_nsec+tv_diff.tv_nsec)>>10;
-  if (tv->tv_usec > US_PER_S)
-  {
-    tv->tv_sec += tv->tv_usec/US_PER_S;
-    tv->tv_usec = tv->tv_usec%US_PER_S;
-  }
+// convert a monotonic timestamp to the wall clock, for display only
+void timestamp_to_timespec(uint64_t ns, struct timespec* ts)
+{
+  assert(ts != NULL);
+  assert(g_timestamp_clock != NULL);
+
+  ns += g_timestamp_clock->wall_offset_ns;
+  ts->tv_sec = ns/NS_PER_S;
+  ts->tv_nsec = ns%NS_PER_S;
 }
 
 
@@ -154,9 +192,9 @@ void* buffer_init(size_t bytes, uint64_t *phys_addr,
   return buf;
 }
 
-static inline uint32_t buffer_calc_csum(uint64_t* ptr, int len)
+static inline uint32_t buffer_csum_final(uint32_t crc32c)
 {
-  uint32_t crc = spdk_crc32c_update(ptr, len, 0)>>1;
+  uint32_t crc = crc32c>>1;
 
   //reserve 0: nomapping
   //reserve 0xffffffff: uncorrectable
@@ -166,6 +204,205 @@ static inline uint32_t buffer_calc_csum(uint64_t* ptr, int len)
   return crc;
 }
 
+static inline uint32_t buffer_calc_csum(uint64_t* ptr, int len)
+{
+  return buffer_csum_final(spdk_crc32c_update(ptr, len, 0));
+}
+
+// checksum of all lba in one io: the crc instruction has the latency of
+// several cycles, so interleave the streams of 4 lba to fill the pipeline
+#define BUFFER_CSUM_STREAMS     (4)
+#define BUFFER_CSUM_BLOCK       (64)
+
+static void buffer_calc_csum_batch(const void* buf,
+                                   uint32_t lba_count,
+                                   uint32_t lba_size,
+                                   uint32_t* csum)
+{
+  uint32_t i = 0;
+
+#ifdef __SSE4_2__
+  if (lba_size%sizeof(uint64_t) == 0)
+  {
+    uint32_t words = lba_size/sizeof(uint64_t);
+
+    for (; i+BUFFER_CSUM_STREAMS <= lba_count; i+=BUFFER_CSUM_STREAMS)
+    {
+      const uint64_t* p0 = (const uint64_t*)(buf+(uint64_t)i*lba_size);
+      const uint64_t* p1 = p0+words;
+      const uint64_t* p2 = p1+words;
+      const uint64_t* p3 = p2+words;
+      uint64_t c0 = 0, c1 = 0, c2 = 0, c3 = 0;
+
+      for (uint32_t j=0; j<words; j++)
+      {
+        c0 = _mm_crc32_u64(c0, p0[j]);
+        c1 = _mm_crc32_u64(c1, p1[j]);
+        c2 = _mm_crc32_u64(c2, p2[j]);
+        c3 = _mm_crc32_u64(c3, p3[j]);
+      }
+
+      csum[i] = buffer_csum_final(c0);
+      csum[i+1] = buffer_csum_final(c1);
+      csum[i+2] = buffer_csum_final(c2);
+      csum[i+3] = buffer_csum_final(c3);
+    }
+  }
+#endif
+
+  // remaining lba
+  for (; i<lba_count; i++)
+  {
+    csum[i] = buffer_calc_csum((uint64_t*)(buf+(uint64_t)i*lba_size), lba_size);
+  }
+}
+
+// each lba has an entry of 1, 2 or 4 bytes in the crc table keeping the
+// digest of the lba data: 0 is nomapping, and all-one is uncorrectable.
+// The 4-byte entry keeps the 31-bit checksum.
+static inline uint32_t crc_table_mask(crc_table_t* crc_table)
+{
+  if (crc_table->width == sizeof(uint32_t))
+  {
+    return 0x7fffffff;
+  }
+
+  return (uint32_t)((1ULL<<(crc_table->width*8))-1);
+}
+
+// entries are grouped in blocks. A block is valid only when its epoch is
+// the epoch of the table, otherwise all its entries are 0. So the table
+// is cleared by a new epoch, and a block is cleared by a stale epoch.
+#define CRC_TABLE_BLOCK       (1ULL<<CRC_TABLE_BLOCK_SHIFT)
+#define CRC_TABLE_BLOCK_BUSY  (0xffffffff)
+
+static void crc_table_block_prepare(crc_table_t* crc_table, uint64_t block)
+{
+  uint32_t epoch = __atomic_load_n(&crc_table->block_epoch[block], __ATOMIC_ACQUIRE);
+
+  while (epoch != crc_table->epoch)
+  {
+    // one process clears the stale block, others wait for it
+    if (epoch != CRC_TABLE_BLOCK_BUSY &&
+        __atomic_compare_exchange_n(&crc_table->block_epoch[block], &epoch,
+                                    CRC_TABLE_BLOCK_BUSY, false,
+                                    __ATOMIC_ACQUIRE, __ATOMIC_RELAXED))
+    {
+      uint64_t count = crc_table->size/crc_table->width;
+      uint64_t lba = block<<CRC_TABLE_BLOCK_SHIFT;
+
+      memset((uint8_t*)crc_table->data + lba*crc_table->width, 0,
+             MIN(CRC_TABLE_BLOCK, count-lba)*crc_table->width);
+      __atomic_store_n(&crc_table->block_epoch[block], crc_table->epoch,
+                       __ATOMIC_RELEASE);
+      break;
+    }
+
+    epoch = __atomic_load_n(&crc_table->block_epoch[block], __ATOMIC_ACQUIRE);
+  }
+}
+
+static inline void crc_table_prepare(crc_table_t* crc_table,
+                                     uint64_t lba,
+                                     uint64_t nlb)
+{
+  // make blocks of the lba range valid before updating their entries
+  for (uint64_t block=(lba>>CRC_TABLE_BLOCK_SHIFT);
+       block<=((lba+nlb-1)>>CRC_TABLE_BLOCK_SHIFT) && nlb;
+       block++)
+  {
+    crc_table_block_prepare(crc_table, block);
+  }
+}
+
+static inline uint32_t crc_table_get(crc_table_t* crc_table, uint64_t lba)
+{
+  if (crc_table->block_epoch[lba>>CRC_TABLE_BLOCK_SHIFT] != crc_table->epoch)
+  {
+    return 0;
+  }
+
+  switch (crc_table->width)
+  {
+    case 1:
+      return ((uint8_t*)crc_table->data)[lba];
+
+    case 2:
+      return ((uint16_t*)crc_table->data)[lba];
+
+    default:
+      return ((uint32_t*)crc_table->data)[lba];
+  }
+}
+
+static inline void crc_table_set(crc_table_t* crc_table, uint64_t lba, uint32_t c)
+{
+  if (crc_table->block_epoch[lba>>CRC_TABLE_BLOCK_SHIFT] != crc_table->epoch)
+  {
+    crc_table_block_prepare(crc_table, lba>>CRC_TABLE_BLOCK_SHIFT);
+  }
+
+  switch (crc_table->width)
+  {
+    case 1:
+      ((uint8_t*)crc_table->data)[lba] = c;
+      break;
+
+    case 2:
+      ((uint16_t*)crc_table->data)[lba] = c;
+      break;
+
+    default:
+      ((uint32_t*)crc_table->data)[lba] = c;
+      break;
+  }
+}
+
+static inline uint32_t crc_table_digest(crc_table_t* crc_table, uint32_t crc)
+{
+  uint32_t mask = crc_table_mask(crc_table);
+  uint32_t bits = __builtin_popcount(mask);
+
+  // fold the checksum into the narrow entry
+  while (crc > mask)
+  {
+    crc = (crc&mask) ^ (crc>>bits);
+  }
+
+  //reserve 0 and mask, same as the full checksum
+  if (crc == 0) crc = 1;
+  if (crc == mask) crc = mask-1;
+
+  return crc;
+}
+
+static inline uint64_t crc_table_count(struct spdk_nvme_ns* ns)
+{
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+
+  if (crc_table == NULL)
+  {
+    return 0;
+  }
+
+  return ns->table_size/crc_table->width;
+}
+
+static inline uint32_t buffer_csum_count(struct spdk_nvme_ns* ns,
+                                         const unsigned long lba_first,
+                                         const uint32_t lba_count)
+{
+  // lba covered by the crc table
+  uint64_t table_count = crc_table_count(ns);
+
+  if (lba_first >= table_count)
+  {
+    return 0;
+  }
+
+  return MIN(lba_count, table_count-lba_first);
+}
+
 static void buffer_fill_rawdata(void* buf,
                                 uint64_t lba,
                                 uint32_t lba_count,
@@ -189,7 +426,6 @@ static void buffer_fill_rawdata(void* buf,
 }
 
 static inline void buffer_update_crc(struct spdk_nvme_ns* ns,
-                                     uint32_t* crc_table_data,
                                      const void* buf,
                                      const unsigned long lba_first,
                                      const uint32_t lba_count,
@@ -199,14 +435,31 @@ static inline void buffer_update_crc(struct spdk_nvme_ns* ns,
   // suppose device modify data correctly. If the command fails, we cannot
   // tell what part of data is updated, while what not. Even when atomic
   // write is supported, we still cannot tell that.
-  for (uint64_t i=0, lba=lba_first; i<lba_count; i++, lba++)
+  uint32_t count = buffer_csum_count(ns, lba_first, lba_count);
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "lba %ld, count %d\n", lba_first, count);
+  if (crc_table->width == sizeof(uint32_t))
   {
-    if (lba < ns->table_size/sizeof(uint32_t))
+    uint32_t* crc_table_data = (uint32_t*)crc_table->data;
+
+    crc_table_prepare(crc_table, lba_first, count);
+    buffer_calc_csum_batch(buf, count, lba_size, &crc_table_data[lba_first]);
+  }
+  else
+  {
+    // compact table: fold checksums of a block of lba into the entries
+    for (uint32_t i=0; i<count; i+=BUFFER_CSUM_BLOCK)
     {
-      SPDK_DEBUGLOG(SPDK_LOG_NVME, "lba %ld\n", lba);
+      uint32_t csum[BUFFER_CSUM_BLOCK];
+      uint32_t n = MIN(BUFFER_CSUM_BLOCK, count-i);
 
-      uint64_t* ptr = (uint64_t*)(buf+i*lba_size);
-      crc_table_data[lba] = buffer_calc_csum(ptr, lba_size);
+      buffer_calc_csum_batch(buf+(uint64_t)i*lba_size, n, lba_size, csum);
+      for (uint32_t j=0; j<n; j++)
+      {
+        crc_table_set(crc_table, lba_first+i+j,
+                      crc_table_digest(crc_table, csum[j]));
+      }
     }
   }
 }
@@ -238,32 +491,39 @@ static inline int buffer_verify_data(struct spdk_nvme_ns* ns,
                                      const uint32_t lba_count,
                                      const uint32_t lba_size)
 {
-  for (uint64_t i=0, lba=lba_first; i<lba_count; i++, lba++)
+  uint32_t csum[BUFFER_CSUM_BLOCK];
+  uint32_t count = buffer_csum_count(ns, lba_first, lba_count);
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+  uint32_t mask = crc_table_mask(crc_table);
+
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "lba %ld, count %d\n", lba_first, count);
+
+  // compute checksums of a block of lba, and then compare them in order
+  for (uint32_t i=0; i<count; i+=BUFFER_CSUM_BLOCK)
   {
-    SPDK_DEBUGLOG(SPDK_LOG_NVME, "lba %ld\n", lba);
+    uint32_t n = MIN(BUFFER_CSUM_BLOCK, count-i);
 
-    if (lba < ns->table_size/sizeof(uint32_t))
+    buffer_calc_csum_batch(buf+(uint64_t)i*lba_size, n, lba_size, csum);
+    for (uint32_t j=0; j<n; j++)
     {
-      crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
-      uint32_t expected_crc = (0x7fffffff&crc_table->data[lba]);
+      uint64_t lba = lba_first+i+j;
+      uint32_t expected_crc = (mask&crc_table_get(crc_table, lba));
+      uint32_t crc = crc_table_digest(crc_table, csum[j]);
+
       if (expected_crc == 0)
       {
         // no mapping, nothing to verify
         continue;
       }
-      if (expected_crc == 0x7fffffff)
+      if (expected_crc == mask)
       {
         SPDK_WARNLOG("lba uncorrectable: lba 0x%lx\n", lba);
         return -1;
       }
-
-      uint64_t* ptr = (uint64_t*)(buf+i*lba_size);
-      uint32_t computed_crc = buffer_calc_csum(ptr, lba_size);
-      if (computed_crc != expected_crc)
+      if (crc != expected_crc)
       {
-        assert(expected_crc != 0);  // exclude nomapping
         SPDK_WARNLOG("crc mismatch: lba 0x%lx, expected crc 0x%x, but got: 0x%x\n",
-                     lba, expected_crc, computed_crc);
+                     lba, expected_crc, crc);
         return -3;
       }
     }
@@ -283,32 +543,282 @@ void buffer_fini(void* buf)
 ////crc32 table
 ///////////////////////////////
 
+static inline void crc32_spin_lock(bool* lock)
+{
+  while (__atomic_test_and_set(lock, __ATOMIC_ACQUIRE))
+  {
+    // critical sections are short, just spin
+  }
+}
+
+static inline void crc32_spin_unlock(bool* lock)
+{
+  __atomic_clear(lock, __ATOMIC_RELEASE);
+}
+
+static uint32_t crc32_range_search(const crc_range_t* ranges,
+                                   uint32_t count,
+                                   uint64_t slba)
+{
+  uint32_t low = 0;
+  uint32_t high = count;
+
+  // the first range ending after slba, in sorted and disjoint ranges
+  while (low < high)
+  {
+    uint32_t mid = (low+high)/2;
+
+    if (ranges[mid].elba <= slba)
+    {
+      low = mid+1;
+    }
+    else
+    {
+      high = mid;
+    }
+  }
+
+  return low;
+}
+
+
+// uncorrectable lba ranges are kept in the crc table header, merged and
+// sorted by slba. When the index is full, look up the table instead.
+static void crc32_uncorr_insert(crc_table_t* crc_table,
+                                uint64_t slba,
+                                uint64_t elba)
+{
+  uint32_t i, j;
+  crc_range_t* ranges = crc_table->uncorr_ranges;
+
+  crc32_spin_lock(&crc_table->uncorr_lock);
+
+  // merge with the overlapped and adjacent ranges
+  i = crc32_range_search(ranges, crc_table->uncorr_count, slba?slba-1:0);
+  for (j=i; j<crc_table->uncorr_count && ranges[j].slba<=elba; j++)
+  {
+    slba = MIN(slba, ranges[j].slba);
+    elba = MAX(elba, ranges[j].elba);
+  }
+
+  if (j > i)
+  {
+    ranges[i].slba = slba;
+    ranges[i].elba = elba;
+    memmove(&ranges[i+1], &ranges[j],
+            (crc_table->uncorr_count-j)*sizeof(crc_range_t));
+    crc_table->uncorr_count -= (j-i-1);
+  }
+  else if (crc_table->uncorr_count < CRC_UNCORR_RANGES_MAX)
+  {
+    memmove(&ranges[i+1], &ranges[i],
+            (crc_table->uncorr_count-i)*sizeof(crc_range_t));
+    ranges[i].slba = slba;
+    ranges[i].elba = elba;
+    crc_table->uncorr_count ++;
+  }
+  else
+  {
+    SPDK_DEBUGLOG(SPDK_LOG_NVME, "uncorrectable lba index is full\n");
+    crc_table->uncorr_overflow = true;
+  }
+
+  crc32_spin_unlock(&crc_table->uncorr_lock);
+}
+
+
+static void crc32_uncorr_remove(crc_table_t* crc_table,
+                                uint64_t slba,
+                                uint64_t elba)
+{
+  uint32_t i;
+  crc_range_t* ranges = crc_table->uncorr_ranges;
+
+  if (crc_table->uncorr_count == 0)
+  {
+    // no uncorrectable lba, the usual case
+    return;
+  }
+
+  crc32_spin_lock(&crc_table->uncorr_lock);
+
+  i = crc32_range_search(ranges, crc_table->uncorr_count, slba);
+  while (i<crc_table->uncorr_count && ranges[i].slba<elba)
+  {
+    if (ranges[i].slba < slba && ranges[i].elba > elba)
+    {
+      // split the range
+      if (crc_table->uncorr_count == CRC_UNCORR_RANGES_MAX)
+      {
+        crc_table->uncorr_overflow = true;
+        break;
+      }
+
+      memmove(&ranges[i+1], &ranges[i],
+              (crc_table->uncorr_count-i)*sizeof(crc_range_t));
+      crc_table->uncorr_count ++;
+      ranges[i].elba = slba;
+      ranges[i+1].slba = elba;
+      break;
+    }
+    else if (ranges[i].slba < slba)
+    {
+      ranges[i++].elba = slba;
+    }
+    else if (ranges[i].elba > elba)
+    {
+      ranges[i].slba = elba;
+      break;
+    }
+    else
+    {
+      crc_table->uncorr_count --;
+      memmove(&ranges[i], &ranges[i+1],
+              (crc_table->uncorr_count-i)*sizeof(crc_range_t));
+    }
+  }
+
+  crc32_spin_unlock(&crc_table->uncorr_lock);
+}
+
+
+static void crc32_uncorr_reset(crc_table_t* crc_table)
+{
+  crc32_spin_lock(&crc_table->uncorr_lock);
+  crc_table->uncorr_count = 0;
+  crc_table->uncorr_overflow = false;
+  crc32_spin_unlock(&crc_table->uncorr_lock);
+}
+
+
+static void crc32_uncorr_rebuild(struct spdk_nvme_ns* ns)
+{
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+  uint64_t table_count = crc_table_count(ns);
+  uint32_t uncorr = crc_table_mask(crc_table);
+
+  // index all uncorrectable lba in the table
+  crc32_uncorr_reset(crc_table);
+  for (uint64_t lba=0; lba<table_count; lba++)
+  {
+    if (crc_table_get(crc_table, lba) == uncorr)
+    {
+      uint64_t elba = lba+1;
+
+      while (elba < table_count && crc_table_get(crc_table, elba) == uncorr)
+      {
+        elba ++;
+      }
+      crc32_uncorr_insert(crc_table, lba, elba);
+      lba = elba;
+    }
+  }
+}
+
+
+static void crc32_epoch_new(crc_table_t* crc_table)
+{
+  uint64_t count = crc_table->size/crc_table->width;
+
+  // all blocks become stale
+  crc_table->epoch ++;
+  if (crc_table->epoch == CRC_TABLE_BLOCK_BUSY)
+  {
+    // epoch wraps around, reset all blocks
+    memset(crc_table->block_epoch, 0,
+           ALIGN_UP(count, CRC_TABLE_BLOCK)/CRC_TABLE_BLOCK*sizeof(uint32_t));
+    crc_table->epoch = 1;
+  }
+}
+
+
+static void crc32_zero(crc_table_t* crc_table,
+                       uint64_t lba,
+                       uint64_t nlb)
+{
+  uint64_t count = crc_table->size/crc_table->width;
+
+  if (lba == 0 && nlb == count)
+  {
+    crc32_epoch_new(crc_table);
+    return;
+  }
+
+  for (uint64_t block=(lba>>CRC_TABLE_BLOCK_SHIFT);
+       block<=((lba+nlb-1)>>CRC_TABLE_BLOCK_SHIFT) && nlb;
+       block++)
+  {
+    uint64_t block_start = block<<CRC_TABLE_BLOCK_SHIFT;
+    uint64_t block_end = MIN(block_start+CRC_TABLE_BLOCK, count);
+    uint64_t start = MAX(lba, block_start);
+    uint64_t end = MIN(lba+nlb, block_end);
+    uint8_t* ptr = (uint8_t*)crc_table->data + start*crc_table->width;
+
+    if (crc_table->block_epoch[block] != crc_table->epoch)
+    {
+      // stale block is already cleared
+      continue;
+    }
+
+    if (start == block_start && end == block_end)
+    {
+      // clear the whole block by a stale epoch
+      crc_table->block_epoch[block] = 0;
+
+      // punch the pages out of the file, so the table keeps sparse
+      if (crc_table->file[0] != '\0')
+      {
+        madvise(ptr, (end-start)*crc_table->width, MADV_REMOVE);
+      }
+    }
+    else
+    {
+      memset(ptr, 0, (end-start)*crc_table->width);
+    }
+  }
+}
+
+
 static void crc32_clear(struct spdk_nvme_ns *ns,
                         uint64_t lba,
-                        uint64_t len,
+                        uint64_t nlb,
                         bool uncorr)
 {
-  uint32_t c = uncorr ? 0x7fffffff : 0;
   crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+  uint64_t table_count = crc_table_count(ns);
 
   assert(ns != NULL);
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "clear crc: lba %ld, len %ld, uncorr %d\n", lba, len, uncorr);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "clear crc: lba %ld, nlb %ld, uncorr %d\n", lba, nlb, uncorr);
 
-  if (crc_table != NULL && lba*sizeof(uint32_t) < ns->table_size)
+  if (lba < table_count)
   {
-    assert(ns->table_size != 0);
-
     // clear crc table if it exists and cover the lba range
-    if (lba*sizeof(uint32_t)+len > ns->table_size)
-    {
-      len = ns->table_size - lba*sizeof(uint32_t);
-    }
+    nlb = MIN(nlb, table_count-lba);
 
     SPDK_DEBUGLOG(SPDK_LOG_NVME, "clear checksum table, "
-                  "lba 0x%lx, c %d, len %ld\n", lba, c, len);
-    for (uint64_t i=0; i<len/sizeof(uint32_t); i++)
+                  "lba 0x%lx, uncorr %d, nlb %ld\n", lba, uncorr, nlb);
+    if (uncorr)
     {
-      crc_table->data[lba+i] = c;
+      uint32_t c = crc_table_mask(crc_table);
+
+      for (uint64_t i=0; i<nlb; i++)
+      {
+        crc_table_set(crc_table, lba+i, c);
+      }
+      crc32_uncorr_insert(crc_table, lba, lba+nlb);
+    }
+    else
+    {
+      crc32_zero(crc_table, lba, nlb);
+      if (lba == 0 && nlb == table_count)
+      {
+        // the whole table is cleared
+        crc32_uncorr_reset(crc_table);
+      }
+      else
+      {
+        crc32_uncorr_remove(crc_table, lba, lba+nlb);
+      }
     }
   }
 }
@@ -326,83 +836,107 @@ static void crc32_clear_ranges(struct spdk_nvme_ns* ns,
                   ranges[i].length);
     crc32_clear(ns,
                 ranges[i].starting_lba,
-                ranges[i].length * sizeof(uint32_t),
+                ranges[i].length,
                 false);
   }
 }
 
 
-static void crc32_set_lock_bits(struct spdk_nvme_ns* ns,
-                                crc_table_t* crc_table,
-                                uint64_t slba,
-                                uint64_t nlb,
-                                bool lock)
+// lba ranges [slba, elba) of in-flight commands are kept in the crc table
+// header shared by all processes, sorted by slba. Locked ranges never
+// overlap, so their elba are also sorted. All ranges of one command are
+// locked together, or none of them. When the index is full, no more
+// command can be locked, and the caller queues it for retry until other
+// in-flight commands complete and unlock their ranges.
+static bool crc32_lock_ranges(crc_table_t* crc_table,
+                              const crc_range_t* lock,
+                              uint32_t count)
 {
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "slba 0x%lx, nlb %ld, lock %d\n", slba, nlb, lock);
+  static bool full_warned = false;
+  bool locked = true;
+  crc_range_t* ranges = crc_table->lock_ranges;
 
-  if (crc_table != NULL && slba*sizeof(uint32_t) < ns->table_size)
+  crc32_spin_lock(&crc_table->lock);
+  if (crc_table->lock_count+count > CRC_LOCK_RANGES_MAX)
   {
-    // clear crc table if it exists and cover the lba range
-    if ((slba+nlb)*sizeof(uint32_t) > ns->table_size)
+    locked = false;
+    if (!full_warned)
     {
-      nlb = ns->table_size/sizeof(uint32_t) - slba;
+      SPDK_WARNLOG("lba lock ranges are full, queue commands for retry\n");
+      full_warned = true;
     }
+  }
+
+  // check all ranges before locking any of them
+  for (uint32_t i=0; locked && i<count; i++)
+  {
+    uint32_t j = crc32_range_search(ranges, crc_table->lock_count, lock[i].slba);
 
-    for (uint64_t i=0; i<nlb; i++)
+    if (j < crc_table->lock_count && ranges[j].slba < lock[i].elba)
     {
-      if (lock)
-      {
-        crc_table->data[slba+i] |= 0x80000000;
-      }
-      else
-      {
-        crc_table->data[slba+i] &= ~0x80000000;
-      }
+      // one lba is locked
+      SPDK_DEBUGLOG(SPDK_LOG_NVME, "lba 0x%lx is locked\n", ranges[j].slba);
+      locked = false;
     }
   }
+
+  for (uint32_t i=0; locked && i<count; i++)
+  {
+    // insert the range in order
+    uint32_t j = crc32_range_search(ranges, crc_table->lock_count, lock[i].slba);
+
+    SPDK_DEBUGLOG(SPDK_LOG_NVME, "slba 0x%lx, elba 0x%lx\n",
+                  lock[i].slba, lock[i].elba);
+    memmove(&ranges[j+1], &ranges[j],
+            (crc_table->lock_count-j)*sizeof(crc_range_t));
+    ranges[j] = lock[i];
+    crc_table->lock_count ++;
+  }
+  crc32_spin_unlock(&crc_table->lock);
+
+  return locked;
 }
 
 
-static bool crc32_check_lock_bits(struct spdk_nvme_ns* ns,
-                                  crc_table_t* crc_table,
-                                  uint64_t slba,
-                                  uint16_t nlb)
+static void crc32_unlock_ranges(crc_table_t* crc_table,
+                                const crc_range_t* lock,
+                                uint32_t count)
 {
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "slba 0x%lx, nlb %d\n", slba, nlb);
+  crc_range_t* ranges = crc_table->lock_ranges;
 
-  if (crc_table != NULL && slba*sizeof(uint32_t) < ns->table_size)
+  crc32_spin_lock(&crc_table->lock);
+  for (uint32_t i=0; i<count; i++)
   {
-    // clear crc table if it exists and cover the lba range
-    if ((slba+nlb)*sizeof(uint32_t) > ns->table_size)
-    {
-      nlb = ns->table_size/sizeof(uint32_t) - slba;
-    }
+    uint32_t j = crc32_range_search(ranges, crc_table->lock_count, lock[i].slba);
 
-    for (uint16_t i=0; i<nlb; i++)
+    SPDK_DEBUGLOG(SPDK_LOG_NVME, "slba 0x%lx, elba 0x%lx\n",
+                  lock[i].slba, lock[i].elba);
+    if (j < crc_table->lock_count &&
+        ranges[j].slba == lock[i].slba &&
+        ranges[j].elba == lock[i].elba)
     {
-      if (crc_table->data[slba+i] & 0x80000000)
-      {
-        // one lba is locked
-        SPDK_DEBUGLOG(SPDK_LOG_NVME, "lba 0x%lx is locked\n", slba+i);
-        return true;
-      }
+      crc_table->lock_count --;
+      memmove(&ranges[j], &ranges[j+1],
+              (crc_table->lock_count-j)*sizeof(crc_range_t));
     }
   }
-
-  // no lba was locked
-  return false;
+  crc32_spin_unlock(&crc_table->lock);
 }
 
 
-bool crc32_lock_lba(struct nvme_request* req)
+static int crc32_range_cmp(const void* a, const void* b)
 {
-  struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(req->qpair->ctrlr, req->cmd.nsid);
+  const crc_range_t* ra = (const crc_range_t*)a;
+  const crc_range_t* rb = (const crc_range_t*)b;
+
+  return (ra->slba > rb->slba) - (ra->slba < rb->slba);
+}
 
-  if (ns == NULL || req->qpair == req->qpair->ctrlr->adminq)
-  {
-    return true;
-  }
 
+// get lba ranges of the command, upto 256 ranges of dsm
+static uint32_t crc32_lock_req_range(struct nvme_request* req,
+                                     crc_range_t* lock)
+{
   // check lockers for each LBA
   if (req->cmd.opc == 1 ||   //write
       req->cmd.opc == 2 ||   //read
@@ -410,110 +944,94 @@ bool crc32_lock_lba(struct nvme_request* req)
       req->cmd.opc == 5 ||   //compare
       req->cmd.opc == 8)     //write zeroes
   {
-    bool locked;
-
-    locked = crc32_check_lock_bits(ns, ns->crc_table,
-                                   *(uint64_t*)&req->cmd.cdw10,
-                                   (uint16_t)req->cmd.cdw12+1);
-    if (locked == false)
-    {
-      // lock each LBA
-      crc32_set_lock_bits(ns, ns->crc_table,
-                          *(uint64_t*)&req->cmd.cdw10,
-                          (uint16_t)req->cmd.cdw12+1,
-                          true);
-
-      // locked LBA successfully
-      return true;
-    }
+    lock[0].slba = *(uint64_t*)&req->cmd.cdw10;
+    lock[0].elba = lock[0].slba + (uint16_t)req->cmd.cdw12+1;
+    return 1;
   }
   else if (req->cmd.opc == 9)      //dsm
   {
     void* buf = req->payload.contig_or_cb_arg;
     struct spdk_nvme_dsm_range *ranges = (struct spdk_nvme_dsm_range*)buf;
     unsigned int count = (uint8_t)req->cmd.cdw10+1;
-    bool locked = true;
+    uint32_t n = 0;
 
+    // lock each range, merge overlapped ranges to keep them disjoint
     for (unsigned int i=0; i<count; i++)
     {
-      locked = crc32_check_lock_bits(ns, ns->crc_table,
-                                     ranges[i].starting_lba,
-                                     ranges[i].length);
-      if (locked == true)
+      if (ranges[i].length != 0)
       {
-        //lba is already lock by others
-        break;
+        lock[n].slba = ranges[i].starting_lba;
+        lock[n].elba = ranges[i].starting_lba+ranges[i].length;
+        n ++;
       }
     }
+    qsort(lock, n, sizeof(crc_range_t), crc32_range_cmp);
 
-    if (locked == false)
+    count = n;
+    n = 0;
+    for (unsigned int i=0; i<count; i++)
     {
-      // no lba is locked, so locked all of them
-      for (unsigned int i=0; i<count; i++)
+      if (n != 0 && lock[i].slba < lock[n-1].elba)
       {
-        // lock each LBA
-        crc32_set_lock_bits(ns, ns->crc_table,
-                            ranges[i].starting_lba,
-                            ranges[i].length,
-                            true);
+        lock[n-1].elba = MAX(lock[n-1].elba, lock[i].elba);
+      }
+      else
+      {
+        lock[n++] = lock[i];
       }
-
-      // locked LBA successfully
-      return true;
     }
+    return n;
   }
-  else
+
+  // other no data command like flush
+  return 0;
+}
+
+
+bool crc32_lock_lba(struct nvme_request* req)
+{
+  uint32_t count;
+  crc_range_t lock[256];
+  struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(req->qpair->ctrlr, req->cmd.nsid);
+
+  if (ns == NULL || ns->crc_table == NULL ||
+      req->qpair == req->qpair->ctrlr->adminq)
   {
-    // other no data command like flush
     return true;
   }
 
-  // cannot lock all LBA
-  return false;
+  count = crc32_lock_req_range(req, lock);
+  if (count == 0)
+  {
+    return true;
+  }
+
+  // cannot lock all LBA if it returns false
+  return crc32_lock_ranges(ns->crc_table, lock, count);
 }
 
 
 void crc32_unlock_lba(struct nvme_request* req)
 {
+  uint32_t count;
+  crc_range_t lock[256];
   struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(req->qpair->ctrlr, req->cmd.nsid);
 
-  if (ns == NULL || req->qpair == req->qpair->ctrlr->adminq)
+  if (ns == NULL || ns->crc_table == NULL ||
+      req->qpair == req->qpair->ctrlr->adminq)
   {
     return;
   }
 
-  // check lockers for each LBA
-  if (req->cmd.opc == 1 ||   //write
-      req->cmd.opc == 2 ||   //read
-      req->cmd.opc == 4 ||   //write uncorrectable
-      req->cmd.opc == 5 ||   //compare
-      req->cmd.opc == 8)     //write zeroes
+  // keep the range of offloaded read locked till its data is verified,
+  // the caller unlocks it by ns_verify_unlock()
+  if (g_driver_verify_offload && req->cmd.opc == 2)
   {
-    // unlock each LBA
-    crc32_set_lock_bits(ns, ns->crc_table,
-                        *(uint64_t*)&req->cmd.cdw10,
-                        (uint16_t)req->cmd.cdw12+1,
-                        false);
+    return;
   }
-  else if (req->cmd.opc == 9)      //dsm
-  {
-    void* buf = req->payload.contig_or_cb_arg;
-    struct spdk_nvme_dsm_range *ranges = (struct spdk_nvme_dsm_range*)buf;
-    unsigned int count = (uint8_t)req->cmd.cdw10+1;
 
-    for (unsigned int i=0; i<count; i++)
-    {
-      // unlock each LBA
-      crc32_set_lock_bits(ns, ns->crc_table,
-                          ranges[i].starting_lba,
-                          ranges[i].length,
-                          false);
-    }
-  }
-  else
-  {
-    // other no data command like flush
-  }
+  count = crc32_lock_req_range(req, lock);
+  crc32_unlock_ranges(ns->crc_table, lock, count);
 }
 
 
@@ -522,11 +1040,14 @@ void crc32_unlock_all(struct spdk_nvme_ctrlr* ctrlr)
   for (uint32_t nsid = 1; nsid <= ctrlr->num_ns; nsid++)
   {
     struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(ctrlr, nsid);
+    crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
 
-    crc32_set_lock_bits(ns, ns->crc_table,
-                        0,
-                        ns->table_size/sizeof(uint32_t),
-                        false);
+    if (crc_table != NULL)
+    {
+      crc32_spin_lock(&crc_table->lock);
+      crc_table->lock_count = 0;
+      crc32_spin_unlock(&crc_table->lock);
+    }
   }
 }
 
@@ -534,15 +1055,44 @@ void crc32_unlock_all(struct spdk_nvme_ctrlr* ctrlr)
 uint64_t crc32_skip_uncorr(struct spdk_nvme_ns* ns, uint64_t slba, uint32_t nlba)
 {
   crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+  uint64_t table_count = crc_table_count(ns);
+
+  if (slba >= table_count)
+  {
+    return slba;
+  }
 
-  if (crc_table != NULL && slba*sizeof(uint32_t) < ns->table_size)
+  // find the first lba range [slba, slba+nlba) without uncorrectable lba
+  if (crc_table->uncorr_overflow)
   {
-    // TODO: check nlba
-    while (crc_table->data[slba] == 0x7fffffff) {
-      slba ++;
+    uint32_t uncorr = crc_table_mask(crc_table);
+
+    for (uint64_t lba=slba; lba<slba+nlba && lba<table_count; lba++)
+    {
+      if (crc_table_get(crc_table, lba) == uncorr)
+      {
+        slba = lba+1;
+      }
     }
   }
-  
+  else if (crc_table->uncorr_count != 0)
+  {
+    crc_range_t* ranges = crc_table->uncorr_ranges;
+
+    crc32_spin_lock(&crc_table->uncorr_lock);
+    while (true)
+    {
+      uint32_t i = crc32_range_search(ranges, crc_table->uncorr_count, slba);
+
+      if (i == crc_table->uncorr_count || ranges[i].slba >= slba+nlba)
+      {
+        break;
+      }
+      slba = ranges[i].elba;
+    }
+    crc32_spin_unlock(&crc_table->uncorr_lock);
+  }
+
   return slba;
 }
 
@@ -553,9 +1103,9 @@ uint64_t crc32_skip_uncorr(struct spdk_nvme_ns* ns, uint64_t slba, uint32_t nlba
 struct cmd_log_entry_t {
   // cmd and cpl
   struct spdk_nvme_cmd cmd;
-  struct timeval time_cmd;
+  uint64_t time_cmd;
   struct spdk_nvme_cpl cpl;
-  uint32_t cpl_latency_us;
+  uint64_t cpl_latency_ns;
   bool overlap_allocated;
 
   // for data verification after read
@@ -567,15 +1117,22 @@ struct cmd_log_entry_t {
 };
 static_assert(sizeof(struct cmd_log_entry_t) == 128, "cacheline aligned");
 
+// submission time of commands not logged, indexed by cid
+#define CMD_LOG_CID_MAX   (2048)
+
 struct cmd_log_table_t {
   struct cmd_log_entry_t table[CMD_LOG_DEPTH];
+  uint64_t time_cmd_cid[CMD_LOG_CID_MAX];
   uint32_t head_index;
   uint32_t tail_index;
   uint32_t latest_latency_us;
   uint16_t latest_cid;
   uint16_t intr_vec;
   uint16_t intr_enabled;
-  uint16_t dummy[53];
+  uint16_t mode;            // see CMDLOG_MODE_*
+  uint16_t sample;          // log 1 in sample commands
+  uint32_t sample_count;
+  uint16_t dummy[49];
 };
 static_assert(sizeof(struct cmd_log_table_t)%64 == 0, "cacheline aligned");
 
@@ -603,6 +1160,21 @@ void cmdlog_init(struct spdk_nvme_qpair* q)
 }
 
 
+void qpair_cmdlog_mode(struct spdk_nvme_qpair* q, uint32_t mode, uint32_t sample)
+{
+  struct cmd_log_table_t* log_table = q->pynvme_cmdlog;
+
+  assert(log_table != NULL);
+  assert(mode <= CMDLOG_MODE_OFF);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "qpair %d cmdlog mode %d, sample %d\n",
+                q->id, mode, sample);
+
+  log_table->mode = mode;
+  log_table->sample = MAX(sample, 1);
+  log_table->sample_count = 0;
+}
+
+
 void cmdlog_free(struct spdk_nvme_qpair* q)
 {
   char cmdlog_name[64];
@@ -628,7 +1200,7 @@ static void cmdlog_update_crc_admin(struct spdk_nvme_cmd* cmd,
     for (uint32_t nsid = 1; nsid <= ctrlr->num_ns; nsid++)
     {
       struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(ctrlr, nsid);
-      crc32_clear(ns, 0, ns->table_size, false);
+      crc32_clear(ns, 0, crc_table_count(ns), false);
     }
   }
 }
@@ -651,17 +1223,18 @@ static void cmdlog_update_crc_io(struct spdk_nvme_cmd* cmd,
       case 1:
         // command write
         assert(buf != NULL);
-        buffer_update_crc(ns, crc_table->data, buf, lba, lba_count, lba_size);
+        buffer_update_crc(ns, buf, lba, lba_count, lba_size);
+        crc32_uncorr_remove(crc_table, lba, lba+lba_count);
         break;
 
       case 4:
         //write uncorrectable
-        crc32_clear(ns, lba, lba_count*sizeof(uint32_t), true);
+        crc32_clear(ns, lba, lba_count, true);
         break;
 
       case 8:
         //write zerores
-        crc32_clear(ns, lba, lba_count*sizeof(uint32_t), false);
+        crc32_clear(ns, lba, lba_count, false);
         break;
 
       case 9:
@@ -677,13 +1250,14 @@ static void cmdlog_update_crc_io(struct spdk_nvme_cmd* cmd,
 }
 
 
-static void cmdlog_update_crc(struct cmd_log_entry_t* log_entry)
+static void cmdlog_update_crc(struct spdk_nvme_qpair* qpair,
+                              struct spdk_nvme_cmd* cmd,
+                              void* buf)
 {
-  struct spdk_nvme_cmd* cmd = &log_entry->cmd;
-  struct spdk_nvme_ctrlr* ctrlr = log_entry->req->qpair->ctrlr;
+  struct spdk_nvme_ctrlr* ctrlr = qpair->ctrlr;
 
   // admin queue
-  if (log_entry->req->qpair->id == 0)
+  if (qpair->id == 0)
   {
     cmdlog_update_crc_admin(cmd, ctrlr);
   }
@@ -693,62 +1267,169 @@ static void cmdlog_update_crc(struct cmd_log_entry_t* log_entry)
     struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(ctrlr, cmd->nsid);
 
     assert(ns != NULL);
-    cmdlog_update_crc_io(cmd, ns, log_entry->buf);
+    cmdlog_update_crc_io(cmd, ns, buf);
+  }
+}
+
+
+int ns_verify_read(struct spdk_nvme_ns* ns,
+                   const void* buf,
+                   uint64_t lba,
+                   uint32_t lba_count)
+{
+  int ret = 0;
+  uint32_t lba_size = spdk_nvme_ns_get_sector_size(ns);
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+
+  assert(buf != NULL);
+
+  // data verify is enabled
+  if (crc_table && crc_table->enabled)
+  {
+    // verify lba
+    ret = buffer_verify_lba(buf, lba, lba_count, lba_size);
+    if (ret == 0)
+    {
+      //verify data pattern and crc
+      ret = buffer_verify_data(ns, buf, lba, lba_count, lba_size);
+    }
+    else
+    {
+      // lba wrong, verify crc with expected lba, instead of given lba
+      uint64_t expected_lba = *(uint64_t*)(buf);
+      ret = buffer_verify_data(ns, buf, expected_lba, lba_count, lba_size);
+      if (ret == 0)
+      {
+        // crc ok, so it is a real lba mismatch, mapping error
+        SPDK_WARNLOG("lba mismatch: lba 0x%lx, but got: 0x%lx\n", lba, expected_lba);
+        ret = -2;
+      }
+    }
+  }
+
+  return ret;
+}
+
+
+void ns_verify_unlock(struct spdk_nvme_ns* ns,
+                      uint64_t lba,
+                      uint32_t lba_count)
+{
+  // unlock the range of the read command after its data is verified
+  crc_range_t lock = {lba, lba+lba_count};
+
+  if (ns->crc_table != NULL)
+  {
+    crc32_unlock_ranges(ns->crc_table, &lock, 1);
   }
 }
 
 
-static int cmdlog_verify_crc(struct cmd_log_entry_t* log_entry)
+void driver_verify_offload(bool offload)
+{
+  // the caller verifies read data by ns_verify_read() out of the
+  // completion path, e.g. ioworker's helper threads, and then unlocks
+  // the lba range of the read by ns_verify_unlock()
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "offload data verify: %d\n", offload);
+  g_driver_verify_offload = offload;
+}
+
+
+static int cmdlog_verify_crc(struct spdk_nvme_qpair* qpair,
+                             struct spdk_nvme_cmd* cmd,
+                             void* buf)
 {
   int ret = 0;
-  struct spdk_nvme_cmd* cmd = &log_entry->cmd;
-  struct spdk_nvme_ctrlr* ctrlr = log_entry->req->qpair->ctrlr;
+  struct spdk_nvme_ctrlr* ctrlr = qpair->ctrlr;
 
   // read command
-  if (log_entry->req->qpair->id != 0 && log_entry->cmd.opc == 2)
+  if (qpair->id != 0 && cmd->opc == 2 && !g_driver_verify_offload)
   {
     struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(ctrlr, cmd->nsid);
     uint64_t lba = cmd->cdw10 + ((uint64_t)(cmd->cdw11)<<32);
     uint16_t lba_count = (cmd->cdw12 & 0xffff) + 1;
-    uint32_t lba_size = spdk_nvme_ns_get_sector_size(ns);
-    crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
 
     assert(ns != NULL);
-    assert(log_entry->buf != NULL);
+    ret = ns_verify_read(ns, buf, lba, lba_count);
+  }
+
+  return ret;
+}
+
+
+static void cmdlog_cmd_cpl_crc(struct spdk_nvme_qpair* qpair,
+                               struct spdk_nvme_cmd* cmd,
+                               void* buf,
+                               struct spdk_nvme_cpl* cpl)
+{
+  //update crc table when command completes successfully, except for write uncorrectable
+  if ((cpl->status.sc == 0 && cpl->status.sct == 0) ||
+      (cmd->opc == 4))
+  {
+    // write-like commnds
+    cmdlog_update_crc(qpair, cmd, buf);
 
-    // data verify is enabled
-    if (crc_table && crc_table->enabled)
+    // read commands: verify data
+    if (0 != cmdlog_verify_crc(qpair, cmd, buf))
     {
-      // verify lba
-      ret = buffer_verify_lba(log_entry->buf, lba, lba_count, lba_size);
-      if (ret == 0)
+      //verify data wrong
+      //Unrecovered Read Error: The read data could not be recovered from the media.
+      SPDK_NOTICELOG("original cpl:\n");
+      spdk_nvme_qpair_print_completion(qpair, cpl);
+      cpl->status.sct = 0x07;  // change to vendor specific unrecovered read error
+      cpl->status.sc = 0x81;
+    }
+  }
+}
+
+
+// commands not logged in the cmdlog table, only do the crc bookkeeping
+static struct cmd_log_entry_t g_cmdlog_entry_light;
+
+static void cmdlog_cmd_cpl_light(struct nvme_request* req, struct spdk_nvme_cpl* cpl)
+{
+  struct cmd_log_table_t* cmdlog = req->qpair->pynvme_cmdlog;
+
+  req->cmdlog_entry = NULL;
+  cmdlog_cmd_cpl_crc(req->qpair, &req->cmd,
+                     req->payload.contig_or_cb_arg, cpl);
+
+  if (cmdlog->mode == CMDLOG_MODE_ERROR &&
+      (cpl->status.sc != 0 || cpl->status.sct != 0))
+  {
+    // log the failed command with the submission time kept by its cid
+    uint64_t now = timestamp_ns();
+    uint32_t tail_index = cmdlog->tail_index;
+    struct cmd_log_entry_t* log_entry = &cmdlog->table[tail_index];
+
+    if (log_entry->req == NULL)
+    {
+      memcpy(&log_entry->cmd, &req->cmd, sizeof(struct spdk_nvme_cmd));
+      memcpy(&log_entry->cpl, cpl, sizeof(struct spdk_nvme_cpl));
+      log_entry->time_cmd = cmdlog->time_cmd_cid[req->cmd.cid%CMD_LOG_CID_MAX];
+      log_entry->cpl_latency_ns = MAX(now-log_entry->time_cmd, 1);
+      cmdlog->latest_latency_us = log_entry->cpl_latency_ns/1000;
+      log_entry->buf = NULL;
+      log_entry->overlap_allocated = false;
+
+      tail_index += 1;
+      if (tail_index == CMD_LOG_DEPTH)
       {
-        //verify data pattern and crc
-        ret = buffer_verify_data(ns, log_entry->buf, lba, lba_count, lba_size);
+        tail_index = 0;
       }
-      else
+      cmdlog->tail_index = tail_index;
+      if (cmdlog->head_index == tail_index)
       {
-        // lba wrong, verify crc with expected lba, instead of given lba
-        uint64_t expected_lba = *(uint64_t*)(log_entry->buf);
-        ret = buffer_verify_data(ns, log_entry->buf, expected_lba, lba_count, lba_size);
-        if (ret == 0)
-        {
-          // crc ok, so it is a real lba mismatch, mapping error
-          SPDK_WARNLOG("lba mismatch: lba 0x%lx, but got: 0x%lx\n", lba, expected_lba);
-          ret = -2;
-        }
+        cmdlog->head_index = (tail_index+1 == CMD_LOG_DEPTH) ? 0 : tail_index+1;
       }
     }
   }
-
-  return ret;
 }
 
 
 void cmdlog_cmd_cpl(struct nvme_request* req, struct spdk_nvme_cpl* cpl)
 {
-  struct timeval diff;
-  struct timeval now;
+  uint64_t now;
   struct cmd_log_entry_t* log_entry = req->cmdlog_entry;
   struct cmd_log_table_t* cmdlog = req->qpair->pynvme_cmdlog;
 
@@ -757,6 +1438,12 @@ void cmdlog_cmd_cpl(struct nvme_request* req, struct spdk_nvme_cpl* cpl)
     return;
   }
 
+  if (log_entry == &g_cmdlog_entry_light)
+  {
+    cmdlog_cmd_cpl_light(req, cpl);
+    return;
+  }
+
   assert(cpl != NULL);
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "cmd completed, cid %d\n", log_entry->cpl.cid);
 
@@ -770,32 +1457,13 @@ void cmdlog_cmd_cpl(struct nvme_request* req, struct spdk_nvme_cpl* cpl)
     return;
   }
 
-  timeval_gettimeofday(&now);
+  now = timestamp_ns();
   memcpy(&log_entry->cpl, cpl, sizeof(struct spdk_nvme_cpl));
-  timersub(&now, &log_entry->time_cmd, &diff);
-  log_entry->cpl_latency_us = timeval_to_us(&diff);
-  cmdlog->latest_latency_us = log_entry->cpl_latency_us;
-
-  //update crc table when command completes successfully, except for write uncorrectable
-  if ((cpl->status.sc == 0 && cpl->status.sct == 0) ||
-      (log_entry->cmd.opc == 4))
-  {
-    // write-like commnds
-    cmdlog_update_crc(log_entry);
+  // keep latency non-zero to mark the entry completed
+  log_entry->cpl_latency_ns = MAX(now-log_entry->time_cmd, 1);
+  cmdlog->latest_latency_us = log_entry->cpl_latency_ns/1000;
 
-    // read commands: verify data
-    if (0 != cmdlog_verify_crc(log_entry))
-    {
-      //verify data wrong
-      assert(log_entry->req);
-
-      //Unrecovered Read Error: The read data could not be recovered from the media.
-      SPDK_NOTICELOG("original cpl:\n");
-      spdk_nvme_qpair_print_completion(log_entry->req->qpair, cpl);
-      cpl->status.sct = 0x07;  // change to vendor specific unrecovered read error
-      cpl->status.sc = 0x81;
-    }
-  }
+  cmdlog_cmd_cpl_crc(req->qpair, &log_entry->cmd, log_entry->buf, cpl);
 
   //recover callback argument
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "recover req %p cb arg, entry %p, old %p, new %p\n",
@@ -831,6 +1499,21 @@ void cmdlog_add_cmd(struct spdk_nvme_qpair* qpair, struct nvme_request* req)
   // keep the latest cid for inqury by scripts later
   log_table->latest_cid = req->cmd.cid;
 
+  // skip the commands not logged by the mode of the qpair
+  if (log_table->mode != CMDLOG_MODE_FULL &&
+      (log_table->mode != CMDLOG_MODE_SAMPLE ||
+       ++log_table->sample_count < log_table->sample))
+  {
+    if (log_table->mode == CMDLOG_MODE_ERROR)
+    {
+      // keep submission time for the latency of failed commands
+      log_table->time_cmd_cid[req->cmd.cid%CMD_LOG_CID_MAX] = timestamp_ns();
+    }
+    req->cmdlog_entry = &g_cmdlog_entry_light;
+    return;
+  }
+  log_table->sample_count = 0;
+
   if (log_entry->req != NULL)
   {
     // this entry is overlapped before command complete
@@ -843,9 +1526,9 @@ void cmdlog_add_cmd(struct spdk_nvme_qpair* qpair, struct nvme_request* req)
 
   log_entry->overlap_allocated = false;
   log_entry->buf = req->payload.contig_or_cb_arg;
-  log_entry->cpl_latency_us = 0;
+  log_entry->cpl_latency_ns = 0;
   memcpy(&log_entry->cmd, &req->cmd, sizeof(struct spdk_nvme_cmd));
-  timeval_gettimeofday(&log_entry->time_cmd);
+  log_entry->time_cmd = timestamp_ns();
 
   // link req and cmdlog entry
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "save req %p cb arg to entry %p, new %p, old %p\n",
@@ -1231,7 +1914,8 @@ struct spdk_nvme_qpair *qpair_create(struct spdk_nvme_ctrlr* ctrlr,
                                      unsigned int prio,
                                      unsigned int depth,
                                      bool ien,
-                                     unsigned short iv)
+                                     unsigned short iv,
+                                     bool delay_doorbell)
 {
   struct spdk_nvme_qpair* qpair;
   struct spdk_nvme_io_qpair_opts opts;
@@ -1241,7 +1925,8 @@ struct spdk_nvme_qpair *qpair_create(struct spdk_nvme_ctrlr* ctrlr,
   opts.qprio = prio;
   opts.io_queue_size = depth;
   opts.io_queue_requests = depth;
-  opts.delay_pcie_doorbell = false;
+  // ring SQ tail doorbell once in next polling for all commands submitted
+  opts.delay_pcie_doorbell = delay_doorbell;
   opts.intr_enable = ien;
   opts.intr_vector = iv;
   
@@ -1335,22 +2020,78 @@ static void _ns_uname(struct spdk_nvme_ns* ns, char* name, uint32_t len)
 }
 
 
-static int ns_table_init(struct spdk_nvme_ns* ns, uint64_t table_size)
+static int ns_table_map(crc_table_t* crc_table)
+{
+  int fd;
+  void* data;
+  void* addr = crc_table->data;
+
+  fd = open(crc_table->file, O_RDWR|O_CREAT, 0644);
+  if (fd < 0)
+  {
+    SPDK_ERRLOG("cannot open crc table file %s: %s\n",
+                crc_table->file, strerror(errno));
+    return -1;
+  }
+
+  // primary starts from an empty table. The file is sparse, so only the
+  // pages of written lba take space of the file system.
+  if (spdk_process_is_primary() &&
+      (0 != ftruncate(fd, 0) || 0 != ftruncate(fd, crc_table->size)))
+  {
+    SPDK_ERRLOG("cannot resize crc table file %s: %s\n",
+                crc_table->file, strerror(errno));
+    close(fd);
+    return -1;
+  }
+
+  data = mmap(addr, crc_table->size, PROT_READ|PROT_WRITE,
+              MAP_SHARED|MAP_NORESERVE, fd, 0);
+  close(fd);
+  if (data == MAP_FAILED)
+  {
+    SPDK_ERRLOG("cannot map crc table file %s: %s\n",
+                crc_table->file, strerror(errno));
+    return -1;
+  }
+
+  // the table is at the same address in primary and secondary processes
+  if (addr != NULL && data != addr)
+  {
+    SPDK_ERRLOG("cannot map crc table file %s at %p\n", crc_table->file, addr);
+    munmap(data, crc_table->size);
+    return -1;
+  }
+
+  crc_table->data = data;
+  return 0;
+}
+
+
+static int ns_table_init(struct spdk_nvme_ns* ns,
+                         uint64_t table_size,
+                         uint32_t width,
+                         const char* file)
 {
   crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
   char memzone_name[64];
   _ns_uname(ns, memzone_name, sizeof(memzone_name));
 
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "crc table init, ns %p, size: %ld\n",
-                ns, table_size);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "crc table init, ns %p, size: %ld, width %d\n",
+                ns, table_size, width);
 
   if (spdk_process_is_primary())
   {
     assert(crc_table == NULL);
 
-    // get the shared memory for crc table, and the verify enabled flag
+    // get the shared memory for crc table, and the verify enabled flag.
+    // The table in a file only keeps its header and block epochs in the
+    // shared memory.
+    uint64_t blocks = ALIGN_UP(table_size/width, CRC_TABLE_BLOCK)/CRC_TABLE_BLOCK;
+    uint64_t epoch_size = ALIGN_UP(blocks*sizeof(uint32_t), 64);
+
     crc_table = spdk_memzone_reserve(memzone_name,
-                                     table_size+sizeof(crc_table_t),
+                                     sizeof(crc_table_t)+epoch_size+(file?0:table_size),
                                      0,
                                      SPDK_MEMZONE_NO_IOVA_CONTIG);
     if (crc_table == NULL)
@@ -1358,6 +2099,24 @@ static int ns_table_init(struct spdk_nvme_ns* ns, uint64_t table_size)
       SPDK_NOTICELOG("memory is not large enough to keep CRC32 table.\n");
       SPDK_NOTICELOG("Data verification is disabled!\n");
     }
+    else
+    {
+      crc_table->size = table_size;
+      crc_table->width = width;
+      crc_table->epoch = 1;
+      crc_table->block_epoch = (uint32_t*)(crc_table+1);
+      crc_table->data = (uint8_t*)crc_table->block_epoch + epoch_size;
+      if (file != NULL)
+      {
+        crc_table->data = NULL;
+        strncpy(crc_table->file, file, CRC_TABLE_FILE_LEN-1);
+        if (0 != ns_table_map(crc_table))
+        {
+          spdk_memzone_free(memzone_name);
+          return -1;
+        }
+      }
+    }
   }
   else
   {
@@ -1367,13 +2126,20 @@ static int ns_table_init(struct spdk_nvme_ns* ns, uint64_t table_size)
     {
       SPDK_NOTICELOG("cannot find the crc_table in secondary process!\n");
     }
+    else if (crc_table->file[0] != '\0')
+    {
+      // map the file to the address used in primary process
+      if (0 != ns_table_map(crc_table))
+      {
+        return -1;
+      }
+    }
   }
 
   if (crc_table != NULL)
   {
     assert(crc_table->data);
-    crc_table->size = table_size;
-    ns->table_size = table_size;
+    ns->table_size = crc_table->size;
 
     g_driver_crc32_memory_enough = true;  // obsoloted
   }
@@ -1384,17 +2150,21 @@ static int ns_table_init(struct spdk_nvme_ns* ns, uint64_t table_size)
 }
 
 
-static void ns_table_fini(struct spdk_nvme_ns* ns)
+static void ns_table_free(struct spdk_nvme_ns* ns, const char* memzone_name)
 {
-  char memzone_name[64];
-  _ns_uname(ns, memzone_name, sizeof(memzone_name));
+  crc_table_t* crc_table;
 
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "crc table fini, ns %p\n", ns);
+  // update crc because namespace may changed after controller reset
+  crc_table = spdk_memzone_lookup(memzone_name);
+  if (crc_table != NULL && crc_table->file[0] != '\0')
+  {
+    // every process unmaps its own mapping of the file
+    munmap(crc_table->data, crc_table->size);
+  }
 
   if (spdk_process_is_primary())
   {
-    // update crc because namespace may changed after controller reset
-    ns->crc_table = spdk_memzone_lookup(memzone_name);
+    ns->crc_table = crc_table;
     if (ns->crc_table != NULL)
     {
       spdk_memzone_free(memzone_name);
@@ -1404,9 +2174,21 @@ static void ns_table_fini(struct spdk_nvme_ns* ns)
 }
 
 
+static void ns_table_fini(struct spdk_nvme_ns* ns)
+{
+  char memzone_name[64];
+  _ns_uname(ns, memzone_name, sizeof(memzone_name));
+
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "crc table fini, ns %p\n", ns);
+  ns_table_free(ns, memzone_name);
+}
+
+
 struct spdk_nvme_ns* ns_init(struct spdk_nvme_ctrlr* ctrlr,
                              uint32_t nsid,
-                             uint64_t nlba_verify)
+                             uint64_t nlba_verify,
+                             uint32_t crc_bits,
+                             const char* crc_file)
 {
   struct spdk_nvme_ns* ns = spdk_nvme_ctrlr_get_ns(ctrlr, nsid);
 
@@ -1414,6 +2196,12 @@ struct spdk_nvme_ns* ns_init(struct spdk_nvme_ctrlr* ctrlr,
   assert(nsid > 0);
   assert(ns != NULL);
 
+  if (crc_bits != 8 && crc_bits != 16 && crc_bits != 32)
+  {
+    SPDK_ERRLOG("crc table of %d-bit entries is not supported\n", crc_bits);
+    return NULL;
+  }
+
   uint64_t nsze = spdk_nvme_ns_get_num_sectors(ns);
   if (nlba_verify > 0)
   {
@@ -1421,7 +2209,7 @@ struct spdk_nvme_ns* ns_init(struct spdk_nvme_ctrlr* ctrlr,
     nsze = MIN(nsze, nlba_verify);
   }
 
-  if (0 != ns_table_init(ns, sizeof(uint32_t)*nsze))
+  if (0 != ns_table_init(ns, crc_bits/8*nsze, crc_bits/8, crc_file))
   {
     return NULL;
   }
@@ -1442,17 +2230,34 @@ int ns_refresh(struct spdk_nvme_ns *ns, uint32_t id,
   {
     assert(ns->table_size != 0);
     uint32_t enabled = crc_table->enabled;
+    uint32_t width = crc_table->width;
+    char file[CRC_TABLE_FILE_LEN];
+    char memzone_name[64];
+    char memzone_name_new[64];
 
-    ns_table_fini(ns);
+    // keep the same table backend
+    strncpy(file, crc_table->file, sizeof(file));
+
+    _ns_uname(ns, memzone_name, sizeof(memzone_name));
     nvme_ns_construct(ns, id, ctrlr);
-    ret = ns_table_init(ns, ns->table_size);
+    _ns_uname(ns, memzone_name_new, sizeof(memzone_name_new));
+    if (0 == strcmp(memzone_name, memzone_name_new))
+    {
+      // same namespace, clear its table by a new epoch
+      ns->crc_table = (void*)crc_table;
+      crc32_clear(ns, 0, crc_table_count(ns), false);
+      return 0;
+    }
+
+    ns_table_free(ns, memzone_name);
+    ret = ns_table_init(ns, ns->table_size, width, file[0]?file:NULL);
     if (ret == 0)
     {
       // keep the same enabled flag
       crc_table = (crc_table_t*)ns->crc_table;
       assert(crc_table);
       crc_table->enabled = enabled;
-      crc32_clear(ns, 0, ns->table_size, false);
+      crc32_clear(ns, 0, crc_table_count(ns), false);
     }
   }
 
@@ -1477,6 +2282,198 @@ bool ns_verify_enable(struct spdk_nvme_ns* ns, bool enable)
 }
 
 
+// snapshot file of the crc table: the header followed by all entries
+#define CRC_SNAPSHOT_MAGIC      (0x6372632d656d766eULL)   // "nvme-crc"
+#define CRC_SNAPSHOT_VERSION    (1)
+#define CRC_SNAPSHOT_CHUNK      (1024*1024ULL)
+
+struct crc_snapshot_t {
+  uint64_t magic;
+  uint32_t version;
+  uint32_t width;
+  uint64_t count;
+  uint32_t lba_size;
+  uint32_t reserved[9];
+};
+static_assert(sizeof(struct crc_snapshot_t) == 64, "snapshot header size");
+
+static bool crc_snapshot_chunk_zero(const uint8_t* chunk, uint64_t len)
+{
+  return chunk[0] == 0 && 0 == memcmp(chunk, chunk+1, len-1);
+}
+
+static int crc_snapshot_header(struct spdk_nvme_ns* ns,
+                               struct crc_snapshot_t* header)
+{
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+
+  if (crc_table == NULL)
+  {
+    SPDK_WARNLOG("data verify is not enabled on namespace %d\n", ns->id);
+    return -1;
+  }
+
+  memset(header, 0, sizeof(*header));
+  header->magic = CRC_SNAPSHOT_MAGIC;
+  header->version = CRC_SNAPSHOT_VERSION;
+  header->width = crc_table->width;
+  header->count = crc_table_count(ns);
+  header->lba_size = spdk_nvme_ns_get_sector_size(ns);
+  return 0;
+}
+
+
+int ns_crc_save(struct spdk_nvme_ns* ns, const char* file)
+{
+  int fd;
+  int ret = 0;
+  uint8_t* chunk;
+  struct crc_snapshot_t header;
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+
+  if (0 != crc_snapshot_header(ns, &header))
+  {
+    return -1;
+  }
+
+  fd = open(file, O_WRONLY|O_CREAT|O_TRUNC, 0644);
+  if (fd < 0)
+  {
+    SPDK_WARNLOG("cannot open crc snapshot %s: %s\n", file, strerror(errno));
+    return -2;
+  }
+
+  chunk = malloc(CRC_SNAPSHOT_CHUNK);
+  if (chunk == NULL)
+  {
+    close(fd);
+    return -2;
+  }
+
+  SPDK_INFOLOG(SPDK_LOG_NVME, "save crc table to %s, lba count %ld\n",
+               file, header.count);
+  for (uint64_t offset=0; offset<crc_table->size; offset+=CRC_SNAPSHOT_CHUNK)
+  {
+    uint64_t len = MIN(CRC_SNAPSHOT_CHUNK, crc_table->size-offset);
+    uint64_t block_bytes = CRC_TABLE_BLOCK*crc_table->width;
+
+    // entries of stale blocks are 0
+    memcpy(chunk, (uint8_t*)crc_table->data+offset, len);
+    for (uint64_t i=0; i<len; i+=block_bytes)
+    {
+      if (crc_table->block_epoch[(offset+i)/block_bytes] != crc_table->epoch)
+      {
+        memset(chunk+i, 0, MIN(block_bytes, len-i));
+      }
+    }
+
+    // skip the unwritten lba, and leave a hole in the sparse file
+    if (crc_snapshot_chunk_zero(chunk, len))
+    {
+      continue;
+    }
+
+    if (len != pwrite(fd, chunk, len, sizeof(header)+offset))
+    {
+      SPDK_WARNLOG("cannot write crc snapshot %s: %s\n", file, strerror(errno));
+      ret = -2;
+      break;
+    }
+  }
+
+  // write the header at last, so an incomplete snapshot cannot be loaded
+  if (ret == 0 &&
+      (0 != ftruncate(fd, sizeof(header)+crc_table->size) ||
+       sizeof(header) != pwrite(fd, &header, sizeof(header), 0)))
+  {
+    SPDK_WARNLOG("cannot write crc snapshot %s: %s\n", file, strerror(errno));
+    ret = -2;
+  }
+
+  free(chunk);
+  close(fd);
+  return ret;
+}
+
+
+int ns_crc_load(struct spdk_nvme_ns* ns, const char* file)
+{
+  int fd;
+  int ret = 0;
+  uint8_t* chunk;
+  struct crc_snapshot_t header;
+  struct crc_snapshot_t expected;
+  crc_table_t* crc_table = (crc_table_t*)ns->crc_table;
+
+  if (0 != crc_snapshot_header(ns, &expected))
+  {
+    return -1;
+  }
+
+  fd = open(file, O_RDONLY);
+  if (fd < 0)
+  {
+    SPDK_WARNLOG("cannot open crc snapshot %s: %s\n", file, strerror(errno));
+    return -2;
+  }
+
+  // the snapshot should be saved from the same table
+  if (sizeof(header) != pread(fd, &header, sizeof(header), 0) ||
+      0 != memcmp(&header, &expected, sizeof(header)))
+  {
+    SPDK_WARNLOG("crc snapshot %s does not match namespace %d\n", file, ns->id);
+    close(fd);
+    return -3;
+  }
+
+  chunk = malloc(CRC_SNAPSHOT_CHUNK);
+  if (chunk == NULL)
+  {
+    close(fd);
+    return -2;
+  }
+
+  SPDK_INFOLOG(SPDK_LOG_NVME, "load crc table from %s, lba count %ld\n",
+               file, header.count);
+  for (uint64_t offset=0; offset<crc_table->size; offset+=CRC_SNAPSHOT_CHUNK)
+  {
+    uint64_t len = MIN(CRC_SNAPSHOT_CHUNK, crc_table->size-offset);
+
+    if (len != pread(fd, chunk, len, sizeof(header)+offset))
+    {
+      SPDK_WARNLOG("cannot read crc snapshot %s: %s\n", file, strerror(errno));
+      ret = -2;
+      break;
+    }
+
+    if (crc_snapshot_chunk_zero(chunk, len))
+    {
+      // keep the table in file sparse
+      crc32_zero(crc_table, offset/crc_table->width, len/crc_table->width);
+    }
+    else
+    {
+      uint64_t block_bytes = CRC_TABLE_BLOCK*crc_table->width;
+
+      memcpy((uint8_t*)crc_table->data+offset, chunk, len);
+      for (uint64_t i=0; i<len; i+=block_bytes)
+      {
+        crc_table->block_epoch[(offset+i)/block_bytes] = crc_table->epoch;
+      }
+    }
+  }
+
+  if (ret == 0)
+  {
+    crc32_uncorr_rebuild(ns);
+  }
+
+  free(chunk);
+  close(fd);
+  return ret;
+}
+
+
 int nvme_set_ns(struct spdk_nvme_ctrlr *ctrlr)
 {
   int rc;
@@ -1691,32 +2688,30 @@ void log_cmd_dump(struct spdk_nvme_qpair* qpair, size_t count)
     }
     index -= 1;
 
-    // no timeval, empty slot, not print
-    struct timeval tv = table[index].time_cmd;
-    if (timercmp(&tv, &(struct timeval){0}, >))
+    // no timestamp, empty slot, not print
+    if (table[index].time_cmd != 0)
     {
       struct tm* time;
+      struct timespec ts;
       char tmbuf[128];
 
       //cmd part
-      tv = table[index].time_cmd;
-      time = localtime(&tv.tv_sec);
+      timestamp_to_timespec(table[index].time_cmd, &ts);
+      time = localtime(&ts.tv_sec);
       strftime(tmbuf, sizeof(tmbuf), "%Y-%m-%d %H:%M:%S", time);
-      SPDK_NOTICELOG("index %d, %s.%06ld\n", index, tmbuf, tv.tv_usec);
+      SPDK_NOTICELOG("index %d, %s.%09ld\n", index, tmbuf, ts.tv_nsec);
       spdk_nvme_qpair_print_command(qpair, &table[index].cmd);
 
       //cpl part
-      if (table[index].cpl_latency_us != 0)
+      if (table[index].cpl_latency_ns != 0)
       {
         // a completed command, display its cpl cdws
-        struct timeval time_cpl = (struct timeval){0};
-        time_cpl.tv_usec = table[index].cpl_latency_us;
-        timeradd(&tv, &time_cpl, &time_cpl);
+        timestamp_to_timespec(table[index].time_cmd+table[index].cpl_latency_ns, &ts);
 
         //get the string of cpl date/time
-        time = localtime(&time_cpl.tv_sec);
+        time = localtime(&ts.tv_sec);
         strftime(tmbuf, sizeof(tmbuf), "%Y-%m-%d %H:%M:%S", time);
-        SPDK_NOTICELOG("index %d, %s.%06ld\n", index, tmbuf, time_cpl.tv_usec);
+        SPDK_NOTICELOG("index %d, %s.%09ld\n", index, tmbuf, ts.tv_nsec);
         spdk_nvme_qpair_print_completion(qpair, &table[index].cpl);
       }
     }
@@ -2048,49 +3043,47 @@ rpc_get_cmdlog(struct spdk_jsonrpc_request *request,
     }
     index -= 1;
 
-    // no timeval, empty slot, not print
+    // no timestamp, empty slot, not print
     char tmbuf[128];
     struct tm* time;
-    struct timeval time_cmd = table[index].time_cmd;
-    if (timercmp(&time_cmd, &(struct timeval){0}, >))
+    struct timespec ts;
+    if (table[index].time_cmd != 0)
     {
       // get the string of the op name
       const char* cmdname = cmd_name(table[index].cmd.opc, q->id==0?0:1);
       uint32_t* cmd = (uint32_t*)&table[index].cmd;
 
       //get the string of date/time
-      time = localtime(&time_cmd.tv_sec);
+      timestamp_to_timespec(table[index].time_cmd, &ts);
+      time = localtime(&ts.tv_sec);
       strftime(tmbuf, sizeof(tmbuf), "%Y-%m-%d %H:%M:%S", time);
 
-      spdk_json_write_string_fmt(w, "%s.%06ld [cmd%03d: %s]\n"
+      spdk_json_write_string_fmt(w, "%s.%09ld [cmd%03d: %s]\n"
                                  "0x%08x, 0x%08x, 0x%08x, 0x%08x\n"
                                  "0x%08x, 0x%08x, 0x%08x, 0x%08x\n"
                                  "0x%08x, 0x%08x, 0x%08x, 0x%08x\n"
                                  "0x%08x, 0x%08x, 0x%08x, 0x%08x",
-                                 tmbuf, time_cmd.tv_usec,
+                                 tmbuf, ts.tv_nsec,
                                  seq, cmdname,
                                  cmd[0], cmd[1], cmd[2], cmd[3],
                                  cmd[4], cmd[5], cmd[6], cmd[7],
                                  cmd[8], cmd[9], cmd[10], cmd[11],
                                  cmd[12], cmd[13], cmd[14], cmd[15]);
 
-      if (table[index].cpl_latency_us != 0)
+      if (table[index].cpl_latency_ns != 0)
       {
         // a completed command, display its cpl cdws
-        struct timeval time_cpl = (struct timeval){0};
-        time_cpl.tv_sec = table[index].cpl_latency_us/US_PER_S;
-        time_cpl.tv_usec = table[index].cpl_latency_us%US_PER_S;
-        timeradd(&time_cmd, &time_cpl, &time_cpl);
+        timestamp_to_timespec(table[index].time_cmd+table[index].cpl_latency_ns, &ts);
 
         //get the string of cpl date/time
-        time = localtime(&time_cpl.tv_sec);
+        time = localtime(&ts.tv_sec);
         strftime(tmbuf, sizeof(tmbuf), "%Y-%m-%d %H:%M:%S", time);
 
         uint32_t* cpl = (uint32_t*)&table[index].cpl;
         const char* sts = nvme_qpair_get_status_string(&table[index].cpl);
-        spdk_json_write_string_fmt(w, "%s.%06ld: [cpl: %s] \n"
+        spdk_json_write_string_fmt(w, "%s.%09ld: [cpl: %s] \n"
                                    "0x%08x, 0x%08x, 0x%08x, 0x%08x\n",
-                                   tmbuf, time_cpl.tv_usec,
+                                   tmbuf, ts.tv_nsec,
                                    sts,
                                    cpl[0], cpl[1], cpl[2], cpl[3]);
       }
@@ -2204,7 +3197,7 @@ int driver_init(void)
   driver_init_token();
 
   // init timer
-  timeval_init();
+  timestamp_init();
 
   return 0;
 }
@@ -2217,11 +3210,13 @@ int driver_fini(void)
   {
     spdk_memzone_free(DRIVER_IO_TOKEN_NAME);
     spdk_memzone_free(DRIVER_GLOBAL_CONFIG_NAME);
+    spdk_memzone_free(DRIVER_TIMESTAMP_NAME);
     SPDK_DEBUGLOG(SPDK_LOG_NVME, "pynvme driver unloaded.\n");
   }
 
   g_driver_io_token_ptr = NULL;
   g_driver_config_ptr = NULL;
+  g_timestamp_clock = NULL;
   g_driver_crc32_memory_enough = false;
 
   return spdk_env_cleanup();
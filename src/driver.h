@@ -39,6 +39,7 @@
 #include <string.h>
 #include <pthread.h>
 #include <sys/time.h>
+#include <math.h>
 #include <sys/sysinfo.h>
 
 #include "spdk/stdinc.h"
@@ -50,12 +51,14 @@
 
 
 #define MIN(X,Y)              ((X) < (Y) ? (X) : (Y))
+#define MAX(X,Y)              ((X) > (Y) ? (X) : (Y))
 
 #ifndef BIT
 #define BIT(a)                (1UL << (a))
 #endif /* BIT */
 
 #define US_PER_S              (1000L*1000L)
+#define NS_PER_S              (1000ULL*1000ULL*1000ULL)
 
 #define ALIGN_UP(n, a)    (((n)%(a))?((n)+(a)-((n)%(a))):((n)))
 #define ALIGN_DOWN(n, a)  ((n)-((n)%(a)))
@@ -66,6 +69,46 @@
 // reserved one slot space for tail value
 #define CMD_LOG_DEPTH              (2050)
 
+// io generated in one batch of the io plan
+#define IOWORKER_PLAN_BATCH             (64*1024)
+
+// io of the trace file in one window of the mapping, multiple of 4K page
+#define IOWORKER_SEQUENCE_WINDOW        (1024*1024ULL)
+
+// helper threads verifying read data of one ioworker
+#define IOWORKER_VERIFY_THREADS_MAX     (16)
+
+// commands logged in the cmdlog table of a qpair: all, 1 in N commands,
+// failed commands only, or none. Data verify works in all modes.
+#define CMDLOG_MODE_FULL                (0)
+#define CMDLOG_MODE_SAMPLE              (1)
+#define CMDLOG_MODE_ERROR               (2)
+#define CMDLOG_MODE_OFF                 (3)
+
+// arrival process of the rate limited io
+#define IOWORKER_ARRIVAL_FIXED          (0)
+#define IOWORKER_ARRIVAL_POISSON        (1)
+#define IOWORKER_ARRIVAL_JITTER         (2)
+
+// skewed lba distribution of random io
+#define IOWORKER_LBA_UNIFORM            (0)
+#define IOWORKER_LBA_ZIPF               (1)
+#define IOWORKER_LBA_PARETO             (2)
+#define IOWORKER_LBA_GAUSSIAN           (3)
+#define IOWORKER_LBA_HOTCOLD            (4)
+#define IOWORKER_HOTCOLD_LEVELS_MAX     (16)
+
+// the latency target controller adjusts at most every window
+#define IOWORKER_TARGET_WINDOW_NS       (100*1000*1000ULL)
+#define IOWORKER_TARGET_IOPS_MIN        (100)
+
+// log-linear latency histogram in ns: each power-of-2 range is divided
+// into 2^SUB_BITS linear buckets, so the relative error is below 1/2^SUB_BITS
+#define LATENCY_HISTOGRAM_SUB_BITS      (5)
+#define LATENCY_HISTOGRAM_MAX_BITS      (36)   // ~68 seconds
+#define LATENCY_HISTOGRAM_BUCKETS       \
+  ((LATENCY_HISTOGRAM_MAX_BITS-LATENCY_HISTOGRAM_SUB_BITS+1)<<LATENCY_HISTOGRAM_SUB_BITS)
+
 // the global configuration of the driver
 #define DCFG_VERIFY_READ      (BIT(0))
 #define DCFG_ENABLE_MSIX      (BIT(1))
@@ -88,14 +131,75 @@ typedef struct ioworker_cmdlog
   unsigned int opcode;
 } ioworker_cmdlog;
 
+// one io of the trace, also the record of the binary trace file
 typedef struct ioworker_ioseq
 {
+  unsigned long timestamp;  // ns
   unsigned long slba;
-  unsigned int timestamp;
-  unsigned int op;
   unsigned int nlba;
+  unsigned int op;
 } ioworker_ioseq;
 
+typedef struct ioworker_plan
+{
+  unsigned long slba;
+  unsigned int nlba;
+  unsigned int op;
+} ioworker_plan;
+
+// closed-loop latency target: the percentile latency to keep, and the
+// operating point of the highest IOPS found under the target
+typedef struct ioworker_target
+{
+  double percentile;
+  unsigned int latency_us;
+  unsigned int qdepth;
+  unsigned int iops;
+  unsigned int percentile_latency_us;
+  unsigned int windows;
+} ioworker_target;
+
+// statistics of each opcode in op_list
+typedef struct ioworker_op_stats
+{
+  unsigned long io_count;
+  unsigned long bytes;
+  unsigned long latency_total_ns;
+  unsigned int latency_max_us;
+} ioworker_op_stats;
+
+// dispatch lag of the replayed io sequence: actual minus scheduled send time
+typedef struct ioworker_replay
+{
+  unsigned long io_count;
+  unsigned long lag_total_ns;
+  unsigned int lag_max_us;
+} ioworker_replay;
+
+// one step of the queue depth and io size sweep, and its statistics
+typedef struct ioworker_sweep
+{
+  unsigned int qdepth;
+  unsigned int io_size;
+  unsigned long io_count;
+  unsigned long bytes;
+  unsigned long latency_total_ns;
+  unsigned int mseconds;
+} ioworker_sweep;
+
+typedef struct ioworker_stats
+{
+  unsigned long sequence;  // odd when the ioworker is updating
+  unsigned long io_count_read;
+  unsigned long io_count_nonread;
+  unsigned long bytes_read;
+  unsigned long bytes_nonread;
+  unsigned int mseconds;
+  unsigned int iops;  // in the last second
+  unsigned int latency_max_us;
+  unsigned long latency_histogram[LATENCY_HISTOGRAM_BUCKETS];  // in the last second
+} ioworker_stats;
+
 typedef struct ioworker_args
 {
   unsigned long lba_start;
@@ -119,7 +223,7 @@ typedef struct ioworker_args
   unsigned int pvalue;
   unsigned int ptype;
   ioworker_ioseq* io_sequence;
-  unsigned int io_sequence_len;
+  unsigned long io_sequence_len;
   unsigned int* io_counter_per_second;
   unsigned long* io_counter_per_latency;
   unsigned int* distribution;
@@ -128,6 +232,35 @@ typedef struct ioworker_args
   unsigned int* op_list;
   unsigned long* op_counter;
   unsigned int op_num;
+  unsigned int qcount;
+  unsigned int* qweight;
+  struct ioworker_rets* qpair_rets;
+  struct ioworker_stats* stats;
+  unsigned int burst_max;
+  ioworker_plan* io_plan;
+  unsigned long io_plan_len;
+  unsigned int io_plan_batch;
+  unsigned long bandwidth;
+  unsigned int rate_burst;
+  unsigned short arrival;
+  unsigned short jitter;
+  struct ioworker_target* target;
+  struct ioworker_sweep* sweep;
+  unsigned int sweep_len;
+  unsigned int sweep_dwell_ms;
+  unsigned long* sweep_histogram;
+  struct ioworker_op_stats* op_stats;
+  unsigned long* op_histogram;
+  unsigned short lba_distribution;
+  double lba_distribution_param;
+  unsigned int* lba_hotcold;
+  unsigned int lba_hotcold_len;
+  bool lba_permutation;
+  char* io_sequence_file;
+  double replay_speed;
+  ioworker_replay* replay;
+  unsigned long* replay_histogram;
+  unsigned int verify_threads;
 } ioworker_args;
 
 typedef struct ioworker_rets
@@ -141,23 +274,59 @@ typedef struct ioworker_rets
   unsigned int latency_average_us;
 } ioworker_rets;
 
+// path of the file backing the crc table
+#define CRC_TABLE_FILE_LEN    (256)
+
+// entries in one block of the crc table, cleared together
+#define CRC_TABLE_BLOCK_SHIFT (12)
+
+// lba ranges locked by in-flight commands of all processes
+#define CRC_LOCK_RANGES_MAX   (16*1024)
+
+// lba ranges of uncorrectable data
+#define CRC_UNCORR_RANGES_MAX (4*1024)
+
+typedef struct crc_range_t
+{
+  unsigned long slba;
+  unsigned long elba;
+} crc_range_t;
+
 typedef struct crc_table_t
 {
   unsigned long size;
   unsigned int enabled;
-  uint32_t data[0];
+  unsigned int width;     // bytes of each entry: 1, 2, or 4
+  void* data;             // entries follow the header, or in the mapped file
+  char file[CRC_TABLE_FILE_LEN];
+  unsigned int epoch;     // epoch of valid blocks
+  uint32_t* block_epoch;  // epoch of each block of entries
+  bool lock;              // spinlock of the lock ranges
+  unsigned int lock_count;
+  crc_range_t lock_ranges[CRC_LOCK_RANGES_MAX];
+  bool uncorr_lock;       // spinlock of the uncorrectable ranges
+  bool uncorr_overflow;   // not all uncorrectable lba are in the ranges
+  unsigned int uncorr_count;
+  crc_range_t uncorr_ranges[CRC_UNCORR_RANGES_MAX];
 } crc_table_t;
 
 extern int ioworker_entry(namespace* ns,
-                          struct spdk_nvme_qpair *qpair,
+                          struct spdk_nvme_qpair** qpair_list,
                           ioworker_args* args,
                           ioworker_rets* rets);
 
+extern uint32_t latency_histogram_index(uint64_t ns);
+extern uint64_t latency_histogram_value(uint32_t index);
+extern uint64_t latency_histogram_percentile(unsigned long* histogram,
+                                             double percentile);
+extern void ioworker_stats_read(ioworker_stats* stats, ioworker_stats* snapshot);
+
 extern int driver_init(void);
 extern int driver_fini(void);
 extern uint64_t driver_config(uint64_t cfg_word);
 extern uint64_t driver_config_read(void);
 extern void driver_srand(unsigned int seed);
+extern void driver_verify_offload(bool offload);
 extern uint32_t driver_io_qpair_count(struct spdk_nvme_ctrlr* ctrlr);
 extern bool driver_no_secondary(struct spdk_nvme_ctrlr* ctrlr);
 extern void driver_init_num_queues(struct spdk_nvme_ctrlr* ctrlr, uint32_t cdw0);
@@ -224,18 +393,30 @@ extern qpair* qpair_create(struct spdk_nvme_ctrlr *c,
                            unsigned int prio,
                            unsigned int depth,
                            bool ien,
-                           unsigned short iv);
+                           unsigned short iv,
+                           bool delay_doorbell);
 extern int qpair_wait_completion(struct spdk_nvme_qpair *q, uint32_t max_completions);
 extern uint16_t qpair_get_latest_cid(struct spdk_nvme_qpair* q,
                                      struct spdk_nvme_ctrlr* c);
 extern uint32_t qpair_get_latest_latency(struct spdk_nvme_qpair* q,
                                          struct spdk_nvme_ctrlr* c);
 extern int qpair_get_id(struct spdk_nvme_qpair* q);
+extern void qpair_cmdlog_mode(struct spdk_nvme_qpair* q, uint32_t mode, uint32_t sample);
 extern int qpair_free(struct spdk_nvme_qpair* q);
 
-extern namespace* ns_init(ctrlr* c, unsigned int nsid, unsigned long nlba_verify);
+extern namespace* ns_init(ctrlr* c, unsigned int nsid, unsigned long nlba_verify,
+                          unsigned int crc_bits, const char* crc_file);
+extern int ns_crc_save(namespace* ns, const char* file);
+extern int ns_crc_load(namespace* ns, const char* file);
 extern int ns_refresh(namespace* ns, uint32_t id, struct spdk_nvme_ctrlr *ctrlr);
 extern bool ns_verify_enable(struct spdk_nvme_ns* ns, bool enable);
+extern int ns_verify_read(struct spdk_nvme_ns* ns,
+                          const void* buf,
+                          uint64_t lba,
+                          uint32_t lba_count);
+extern void ns_verify_unlock(struct spdk_nvme_ns* ns,
+                             uint64_t lba,
+                             uint32_t lba_count);
 extern int ns_cmd_io(uint8_t opcode,
                      namespace* ns,
                      struct spdk_nvme_qpair *qpair,
@@ -265,6 +446,6 @@ extern void intc_mask(struct spdk_nvme_qpair* q);
 extern void intc_unmask(struct spdk_nvme_qpair* q);
 extern void* intc_lookup_ctrl(struct spdk_nvme_ctrlr* ctrlr);
 
-extern void timeval_gettimeofday(struct timeval *tv);
-extern uint32_t timeval_to_us(struct timeval* t);
+extern uint64_t timestamp_ns(void);
+extern void timestamp_to_timespec(uint64_t ns, struct timespec* ts);
 
@@ -51,6 +51,7 @@ import math
 import atexit
 import signal
 import struct
+import ctypes
 import random
 import logging
 import warnings
@@ -61,7 +62,7 @@ import multiprocessing
 
 # c library
 import cython
-from libc.string cimport strncpy, memset, strlen
+from libc.string cimport strncpy, memset, memcpy, strlen
 from libc.stdio cimport printf
 from cpython.mem cimport PyMem_Malloc, PyMem_Free
 from cpython.exc cimport PyErr_CheckSignals
@@ -1708,6 +1709,21 @@ class QpairDeletionError(Exception):
     pass
 
 
+# commands logged in the cmdlog of qpairs
+_cmdlog_mode = {'full': d.CMDLOG_MODE_FULL,
+                'error': d.CMDLOG_MODE_ERROR,
+                'off': d.CMDLOG_MODE_OFF}
+
+
+def _cmdlog_mode_sample(mode):
+    # (mode, sample) of the cmdlog, int mode is sampling 1 in every N commands
+    if type(mode) is int:
+        assert mode > 0 and mode < 0x10000, "sample 1 in [1, 65535] commands"
+        return (d.CMDLOG_MODE_SAMPLE, mode)
+    assert mode in _cmdlog_mode, "cmdlog should be full, error, off or int"
+    return (_cmdlog_mode[mode], 1)
+
+
 cdef class Qpair(object):
     """Qpair class. IO SQ and CQ are combinded as qpairs.
 
@@ -1717,6 +1733,7 @@ cdef class Qpair(object):
         prio (int): when Weighted Round Robin is enabled, specify SQ priority here
         ien (bool): interrupt enabled. Default: True
         iv (short): interrupt vector. Default: 0xffff, choose by driver
+        delay_doorbell (bool): ring SQ tail doorbell once in next completion polling for all submitted commands, instead of ringing it for every command. Default: False
     """
 
     cdef d.qpair * _qpair
@@ -1726,14 +1743,15 @@ cdef class Qpair(object):
                   unsigned int depth,
                   unsigned int prio=0,
                   bint ien=True,
-                  unsigned short iv=0xffff):
+                  unsigned short iv=0xffff,
+                  bint delay_doorbell=False):
         # create CQ and SQ
         assert depth>=2 and depth<=1024, "qdepth should be in [2, 1024]"
         assert depth <= (nvme.cap & 0xffff) + 1, "qpair depth is larger than specification"
 
         if ien==False and iv==0xffff:
             iv = 0
-        self._qpair = d.qpair_create(nvme.pcie._ctrlr, prio, depth, ien, iv)
+        self._qpair = d.qpair_create(nvme.pcie._ctrlr, prio, depth, ien, iv, delay_doorbell)
         if self._qpair is NULL:
             raise QpairCreationError("qpair create fail")
         self._nvme = nvme
@@ -1783,6 +1801,21 @@ cdef class Qpair(object):
 
         d.log_cmd_dump(self._qpair, count)
 
+    def cmdlog_mode(self, mode='full'):
+        """select commands logged in the cmdlog of this qpair.
+
+        Logging every command costs the timestamps and the copies of the command and its completion. For high IOPS qpairs, it can be sampled or disabled.
+
+        # Parameters
+            mode (str, int): 'full': log all commands. 'error': log failed commands only, with their completions and latency. 'off': log none of the commands. int N: log 1 in every N commands. Default: 'full'
+
+        Notice
+            Data verify works in all modes, and the latest cid is still kept. latest_latency is not updated by commands not logged.
+        """
+
+        mode, sample = _cmdlog_mode_sample(mode)
+        d.qpair_cmdlog_mode(self._qpair, mode, sample)
+
     def msix_clear(self):
         d.intc_clear(self._qpair)
 
@@ -1845,6 +1878,8 @@ cdef class Namespace(object):
         nvme (Controller): controller where to create the queue
         nsid (int): nsid of the namespace. Default 1
         nlba_verify (long): number of LBAs where data verificatoin is enabled. Default 0, the whole namespace
+        crc_bits (int): bits of the CRC data of each LBA, 8, 16, or 32. Less bits saves memory but misses more corruptions. Default 32
+        crc_file (str): path of the file to keep CRC data, instead of the hugepage memory. Default None
     """
 
     cdef Controller _nvme
@@ -1854,11 +1889,21 @@ cdef class Namespace(object):
     cdef unsigned long nlba_verify
     cdef object locker  # locker for all ioworker processes
 
-    def __cinit__(self, Controller nvme, unsigned int nsid=1, unsigned long nlba_verify=0):
+    def __cinit__(self, Controller nvme, unsigned int nsid=1, unsigned long nlba_verify=0,
+                  unsigned int crc_bits=32, crc_file=None):
         logging.debug("initialize namespace nsid %d" % nsid)
+        assert crc_bits in (8, 16, 32), "crc_bits should be 8, 16, or 32"
         self._nvme = nvme
         self._nsid = nsid
-        self._ns = d.ns_init(nvme.pcie._ctrlr, nsid, nlba_verify)
+        if crc_file is not None:
+            # the file is mapped by ioworker processes with the same path
+            crc_file = os.path.abspath(crc_file).encode('utf-8')
+            assert len(crc_file) < d.CRC_TABLE_FILE_LEN, "crc_file path is too long"
+            self._ns = d.ns_init(nvme.pcie._ctrlr, nsid, nlba_verify,
+                                 crc_bits, crc_file)
+        else:
+            self._ns = d.ns_init(nvme.pcie._ctrlr, nsid, nlba_verify,
+                                 crc_bits, NULL)
         if self._ns is NULL:
             raise NamespaceCreationError()
         self.sector_size = d.ns_get_sector_size(self._ns)
@@ -1942,6 +1987,38 @@ cdef class Namespace(object):
         self._ns = d.nvme_get_ns(self._nvme.pcie._ctrlr, self._nsid)
         return d.ns_verify_enable(self._ns, enable)
 
+    def save_crc(self, crc_snapshot):
+        """dump the CRC data of the namespace to a snapshot file
+
+        Notice
+            Save the CRC data when no IO is active on the namespace. The unwritten LBAs are holes in the sparse file.
+
+        # Parameters
+            crc_snapshot (str): the path of file to backup crc data
+
+        Returns
+            (bool): save crc successfully or not
+        """
+
+        self._ns = d.nvme_get_ns(self._nvme.pcie._ctrlr, self._nsid)
+        return d.ns_crc_save(self._ns, crc_snapshot.encode('utf-8')) == 0
+
+    def load_crc(self, crc_snapshot):
+        """restore the CRC data of the namespace from a snapshot file
+
+        Notice
+            The snapshot should be saved from the namespace with the same LBA format, nlba_verify and crc_bits.
+
+        # Parameters
+            crc_snapshot (str): the path of file to restore crc data
+
+        Returns
+            (bool): load crc successfully or not
+        """
+
+        self._ns = d.nvme_get_ns(self._nvme.pcie._ctrlr, self._nsid)
+        return d.ns_crc_load(self._ns, crc_snapshot.encode('utf-8')) == 0
+
     def format(self, data_size=512, meta_size=0, ses=0):
         """change the format of this namespace
 
@@ -1993,7 +2070,11 @@ cdef class Namespace(object):
                  region_start=0, region_end=0xffffffffffffffff,
                  iops=0, io_count=0, lba_start=0, qprio=0,
                  distribution=None, ptype=0xbeef, pvalue=100,
-                 io_sequence=None, fw_debug=False,
+                 io_sequence=None, io_plan=None, fw_debug=False,
+                 qcount=1, qweight=None, burst_max=1, pool=None,
+                 bandwidth=0, rate_burst=1, arrival='fixed', jitter=50,
+                 latency_target=None, sweep=None, lba_distribution=None,
+                 replay_speed=1.0, verify_threads=0, cmdlog='full',
                  output_io_per_second=None,
                  output_percentile_latency=None,
                  output_cmdlog_list=None):
@@ -2013,35 +2094,103 @@ cdef class Namespace(object):
             io_size (short, range, list, dict): IO size, unit is LBA. It can be a fixed size, or a range or list of size, or specify ratio in the dict if they are not evenly distributed. 1base. Default: 8, 4K
             lba_step (short): valid only for sequential read/write, jump to next LBA by the step. Default: None, same as io_size, continous IO.
             lba_align (short): IO alignment, unit is LBA. Default: None: means 1 lba.
-            lba_random (int, bool): percentage of radom io, or True if sending IO with all random starting LBA. Default: True
+            lba_random (int, bool, str): percentage of radom io, or True if sending IO with all random starting LBA. 'permutation': random IO without replacement, which visits every block of lba_align in the region once in a pseudo-random order before repeating, and fills the region in one pass when neither time or io_count is specified. Default: True
             read_percentage (int): sending read/write mixed IO, 0 means write only, 100 means read only. Default: 100. Obsoloted by op_percentage
             op_percentage (dict): opcode of commands sent in ioworker, and their percentage. Output: real io counts sent in ioworker. Default: None, fall back to read_percentage
             time (int): specified maximum time of the IOWorker in seconds, up to 1000*3600. Default:0, means no limit
-            qdepth (int): queue depth of the Qpair created by the IOWorker, up to 1024. 1base value. Default: 64
+            qdepth (int): queue depth of the Qpair created by the IOWorker, up to 1024. 1base value. Each context of the Qpair owns 2 data buffers of the largest IO size, so the buffer pool takes io_size*qdepth*qcount*2 sectors. When replaying io_sequence, the IO size is the largest nlba in the list. When replaying io_sequence_file or io_plan, the IO size is the max transfer size (MDTS) of the controller, so a large qdepth can take hundreds of MB. Default: 64
             region_start (long): sending IO in the specified LBA region, start. Default: 0
             region_end (long): sending IO in the specified LBA region, end but not include. Default: 0xffff_ffff_ffff_ffff
-            iops (int): specified maximum IOPS. IOWorker throttles the sending IO speed. Default: 0, means no limit
+            iops (int): specified maximum IOPS. IOWorker throttles the sending IO speed in nanosecond accuracy, or it is the mean IOPS of poisson or jitter arrival. Default: 0, means no limit
             io_count (long): specified maximum IO counts to send. Default: 0, means no limit
             lba_start (long): the LBA address of the first command. Default: 0, means start from region_start
             qprio (int): SQ priority. Default: 0, as Round Robin arbitration
             distribution (list(int)): distribute 10,000 IO to 100 sections. Default: None
+            lba_distribution (tuple): skewed distribution of random LBA in the region. ('zipf', theta): zipfian distribution of aligned blocks, theta in (0, 1), the hottest block at region_start. ('pareto', h): 1-h of IO on the first h of the region, h in (0, 0.5). ('gaussian', sigma): normal distribution centered in the region, sigma is the fraction of the region. ('hotcold', [(space%, io%), ...]): levels of space and IO percentage from region_start, upto 16 levels. Default: None, uniform distribution
             pvalue (int): data pattern value. Refer to data pattern in class `Buffer`. Default: 100 (100%)
             ptype (int): data pattern type. Refer to data pattern in class `Buffer`. Default: 0xbeef (random data)
-            io_sequence (list): io sequence of captured trace from real workload. Ignore other input parameters when io_sequence is given. Default: None
+            io_sequence (list, str): io sequence of captured trace from real workload. A list of (timestamp, op, slba, nlba) tuples, timestamp in us from the start of the ioworker. Or, the file name of a binary trace of (timestamp, slba, nlba, op) records, timestamp in ns, e.g. numpy array of dtype [('timestamp', '<u8'), ('slba', '<u8'), ('nlba', '<u4'), ('op', '<u4')] saved by tofile(). The trace file is mapped and replayed in the ioworker without loading it into memory, so it can be much larger than the memory. IO is sent at its timestamp whenever a context is free, regardless of the completion of previous IO. The lag of sending each IO behind its timestamp is returned in replay. Ignore other input parameters when io_sequence is given. Default: None
+            replay_speed (float): speed of replaying io_sequence, e.g. 2.0 replays the trace in half of its time. Default: 1.0
+            verify_threads (int): number of helper threads verifying read data, upto 16. When data verify is enabled, the ioworker hands completed read data to helper threads running on other CPU cores, instead of checking CRC in the completion path. The IO is completed after its data is verified. Default: 0, verify in the completion path
+            cmdlog (str, int): commands logged in the cmdlog of the ioworker's qpairs. Refer to Qpair.cmdlog_mode(). 'error', 'off' or sampling, e.g. 1000, reduces the overhead of the ioworker at high IOPS. Default: 'full'
+            io_plan (bool, bytes, numpy.ndarray): pre-generated io plan. True: the ioworker generates LBA, size and opcode of IO in batches of 64K IO. Or, the io plan given by user, in a buffer of (slba, nlba, op) records, e.g. numpy array of dtype [('slba', '<u8'), ('nlba', '<u4'), ('op', '<u4')]. The ioworker repeats the given plan, and sends one pass of the plan when neither time or io_count is specified. Other input parameters of IO pattern are ignored, but op_percentage still defines opcodes to be counted. Default: None, generate every IO when it is sent
+            qcount (int): number of Qpairs created and polled by this single IOWorker process, each Qpair has qdepth. Statistics of each Qpair are returned in the list qpairs. Default: 1
+            qweight (list): weight of each Qpair in weighted round robin. In each round, a Qpair sends upto weight*burst_max IOs, and the next round starts when all Qpairs with due IOs have used up their IOs of the round. So Qpairs share the IOs in the ratio of their weights when they are limited by iops, bandwidth or the latency target. Default: None, poll all Qpairs in round robin without weights
+            burst_max (int): maximum IOs submitted to a Qpair in one burst. Doorbell is rung once for all IOs of the burst. Default: 1, ring doorbell for every IO
+            pool (IOWorkerPool): run the ioworker in a persistent process of the pool, instead of spawning a new process. Default: None
+            bandwidth (int, float): specified maximum bandwidth in MB/s (1MB is 1,000,000 bytes). Default: 0, means no limit
+            rate_burst (int): IOs can be sent back-to-back when the ioworker is below the iops or bandwidth limit, in IOs of io_size. Default: 1, no burst
+            arrival (str): arrival process of IO at the rate of iops. 'fixed': IO is sent once the limiters allow. 'poisson': exponential intervals between IOs. 'jitter': uniform intervals in the range of jitter percentage around the mean. Default: 'fixed'
+            jitter (int): the range of the interval around the mean in percentage, for 'jitter' arrival. Default: 50, interval varies in [50%, 150%] of the mean
+            latency_target (tuple): (percentile, latency in micro-seconds), e.g. (99, 200) for p99 latency within 200us. The ioworker adjusts queue depth, upto qdepth, and then the rate at runtime to find the highest IOPS under the target. The operating point is returned as latency_target. Default: None
+            sweep (dict): sweep queue depth and io size in one ioworker, e.g. {'qdepth': [1, 2, 4, 8], 'io_size': [8, 256], 'time': 2, 'percentile': [99, 99.9]}. Each combination runs 'time' seconds as one step, and qdepth and io_size inputs are replaced. The table of all steps is returned as sweep, including qdepth, io_size, iops, bandwidth (MB/s), latency_average_us and latency of each percentile. Default: None
             output_io_per_second (list): list to hold the output data of io_per_second. Default: None, not to collect the data
-            output_percentile_latency (dict): dict of io counter on different percentile latency. Dict key is the percentage, and the value is the latency in micro-second. Default: None, not to collect the data
+            output_percentile_latency (dict): dict of io counter on different percentile latency. Dict key is the percentage, and the value is the latency in micro-second. The latency histogram is returned as latency_distribution, a memoryview of the shared memory filled by the ioworker process. The latency histogram and percentile latency of each opcode are also returned in op_stats. Default: None, not to collect the data
             output_cmdlog_list (list): list of dwords of lastest commands completed in the ioworker. Default: None, not to collect the data
 
         Returns
             ioworker instance
         """
 
+        if sweep is not None:
+            # steps of all queue depth on each io size
+            assert latency_target is None, "sweep and latency target cannot run together"
+            assert io_sequence is None and io_plan is None, "sweep generates io in the ioworker"
+            assert io_count == 0 and time == 0, "sweep runs for the time of all steps"
+            sweep_qdepth = list(sweep.get('qdepth', [qdepth-1]))
+            sweep_io_size = list(sweep.get('io_size', [io_size]))
+            sweep_time = sweep.get('time', 1)
+            sweep_percentile = list(sweep.get('percentile', [50, 99, 99.9]))
+            assert min(sweep_qdepth) >= 1, "queue depth of sweep should be at least 1"
+            assert all(type(s) is int for s in sweep_io_size), "io_size of sweep is a list of int"
+            assert sweep_time >= 0.1, "each step runs at least 0.1 second"
+            assert all(p>0 and p<100 for p in sweep_percentile), "percentile should be in (0, 100)"
+            steps = [(q, s) for s in sweep_io_size for q in sweep_qdepth]
+            qdepth = max(sweep_qdepth)+1
+            io_size = sweep_io_size
+            if isinstance(lba_align, int):
+                lba_align = [lba_align]*len(set(io_size))
+            time = math.ceil(sweep_time*len(steps))+1
+            sweep = (steps, int(sweep_time*1000), sweep_percentile)
+
         assert qdepth>=2 and qdepth<=1024, "qdepth should be in [2, 1024]"
         assert qdepth <= (self._nvme.cap & 0xffff) + 1, "qdepth is larger than specification"
         assert region_start < region_end, "region end is not included"
         assert time <= 1000*3600ULL, "worker needs a rest :)"
         assert read_percentage <= 100, "read percentage is less than 100"
-        assert iops==0 or iops >= qdepth, "iops must be larger than qdepth"
+        assert iops >= 0 and bandwidth >= 0, "iops and bandwidth cannot be negative"
+        assert rate_burst >= 1, "rate_burst is at least one IO"
+        assert arrival in _ioworker_arrival, "arrival should be fixed, poisson or jitter"
+        assert arrival == 'fixed' or iops > 0, "arrival of io needs the mean rate in iops"
+        assert jitter >= 0 and jitter <= 100, "jitter percentage should be in [0, 100]"
+        if latency_target is not None:
+            assert len(latency_target) == 2, "latency_target is (percentile, latency_us)"
+            assert latency_target[0] > 0 and latency_target[0] < 100, "percentile should be in (0, 100)"
+            assert latency_target[1] > 0, "target latency should be larger than 0"
+            assert iops == 0 and arrival == 'fixed', "ioworker finds the iops of the latency target"
+        assert qcount >= 1, "ioworker needs at least one qpair"
+        assert qweight is None or len(qweight) == qcount, "weight of each qpair"
+        assert qweight is None or min(qweight) > 0, "weight should be larger than 0"
+        assert burst_max >= 1 and burst_max <= qdepth, "burst_max should be in [1, qdepth]"
+
+        if io_plan is not None and io_plan is not True:
+            # user given io plan: send one pass by default
+            io_plan = bytes(io_plan)
+            assert len(io_plan), "io_plan is empty"
+            assert len(io_plan)%sizeof(d.ioworker_plan) == 0, "io_plan of (slba, nlba, op) records"
+            if time==0 and io_count==0:
+                io_count = len(io_plan)//sizeof(d.ioworker_plan)
+        assert replay_speed > 0, "replay speed should be larger than 0"
+        assert verify_threads >= 0 and verify_threads <= d.IOWORKER_VERIFY_THREADS_MAX, "verify_threads should be in [0, 16]"
+        cmdlog = _cmdlog_mode_sample(cmdlog)
+        if isinstance(io_sequence, str):
+            # binary trace file, mapped and replayed in the ioworker
+            io_sequence = os.path.abspath(io_sequence)
+            assert os.path.isfile(io_sequence), "trace file not found: %s" % io_sequence
+            trace_size = os.path.getsize(io_sequence)
+            assert trace_size, "trace file is empty"
+            assert trace_size%sizeof(d.ioworker_ioseq) == 0, "trace file of (timestamp, slba, nlba, op) records"
+        assert pool is None or pool._nsid == self._nsid, "pool of another namespace"
 
         if op_percentage is None:
             op_percentage = {2: read_percentage, 1: 100-read_percentage}
@@ -2052,11 +2201,49 @@ cdef class Namespace(object):
             sum_percentage += op_percentage[k]
         assert sum_percentage == 100, "op_percentage definition error"
 
+        lba_permutation = False
+        if lba_random == 'permutation':
+            # random lba without replacement, visit every aligned block once
+            assert distribution is None and lba_distribution is None, "permutation is not skewed"
+            assert type(io_size) is int, "permutation works with fixed io_size"
+            lba_permutation = True
+            lba_random = 100
+            if lba_align is None:
+                lba_align = io_size
+            if time==0 and io_count==0:
+                # fill region one pass
+                start = (region_start+lba_align-1)//lba_align*lba_align
+                end = min(region_end, self.id_data(7, 0))
+                io_count = (end-start+lba_align-1)//lba_align
+                logging.info("fill region in random order with io count: %d" % io_count)
+
         if type(lba_random) is bool:
             if lba_random == True: lba_random = 100
             if lba_random == False: lba_random = 0
         assert type(lba_random) is int, "lba_random is a percentage, int"
         assert lba_random >= 0 and lba_random <= 100, "lba_random is a percentage, 0-100"
+
+        if lba_distribution is not None:
+            assert distribution is None, "distribution and lba_distribution cannot be used together"
+            assert lba_random != 0, "lba_distribution works on random io"
+            name, param = lba_distribution
+            assert name in _ioworker_lba_distribution, "lba_distribution should be zipf, pareto, gaussian or hotcold"
+            if name == 'hotcold':
+                levels = list(param)
+                assert len(levels) >= 1 and len(levels) <= d.IOWORKER_HOTCOLD_LEVELS_MAX, "hotcold has 1-16 levels"
+                levels = [int(round(x*10000)) for level in levels for x in level]
+                assert all(x > 0 for x in levels[0::2]), "space of each level cannot be 0"
+                assert sum(levels[0::2]) == 1000000, "space of all levels sums to 100%"
+                assert sum(levels[1::2]) == 1000000, "io of all levels sums to 100%"
+                lba_distribution = (_ioworker_lba_distribution[name], 0, levels)
+            else:
+                if name == 'zipf':
+                    assert param > 0 and param < 1, "zipf theta should be in (0, 1)"
+                elif name == 'pareto':
+                    assert param > 0 and param < 0.5, "pareto h should be in (0, 0.5)"
+                else:
+                    assert param > 0, "gaussian sigma should be larger than 0"
+                lba_distribution = (_ioworker_lba_distribution[name], param, None)
         if lba_random == 0 and type(io_size) == int and region_end != 0xffffffffffffffff:
             if time==0 and io_count==0:
                 # for pure sequential io, fill region one pass
@@ -2099,7 +2286,13 @@ cdef class Namespace(object):
                          lba_start, lba_step, io_size,
                          lba_align, lba_random, region_start, region_end,
                          op_percentage, iops, io_count, time, qdepth, qprio,
-                         distribution, pvalue, ptype, io_sequence, fw_debug,
+                         distribution, pvalue, ptype, io_sequence, io_plan, fw_debug,
+                         qcount, qweight, burst_max, pool,
+                         bandwidth, rate_burst, _ioworker_arrival[arrival], jitter,
+                         latency_target, sweep, lba_distribution, lba_permutation,
+                         replay_speed,
+                         verify_threads,
+                         cmdlog,
                          output_io_per_second,
                          output_percentile_latency,
                          output_cmdlog_list)
@@ -2427,6 +2620,109 @@ class _DotDict(dict):
         self.__dict__ = self
 
 
+# skewed distribution of random lba in ioworkers
+_ioworker_lba_distribution = {'zipf': d.IOWORKER_LBA_ZIPF,
+                              'pareto': d.IOWORKER_LBA_PARETO,
+                              'gaussian': d.IOWORKER_LBA_GAUSSIAN,
+                              'hotcold': d.IOWORKER_LBA_HOTCOLD}
+
+# arrival process of the rate limited io in ioworkers
+_ioworker_arrival = {'fixed': d.IOWORKER_ARRIVAL_FIXED,
+                     'poisson': d.IOWORKER_ARRIVAL_POISSON,
+                     'jitter': d.IOWORKER_ARRIVAL_JITTER}
+
+
+def _ioworker_tables(seconds, io_per_second, io_per_latency):
+    # shared memory for the statistics and output tables of the ioworker,
+    # which the main process reads directly without copying through queue
+    tables = _DotDict(stats = _mp.RawArray('B', sizeof(d.ioworker_stats)),
+                      io_per_second = None,
+                      io_per_latency = None)
+    if io_per_second:
+        tables.io_per_second = _mp.RawArray(ctypes.c_uint, seconds)
+    if io_per_latency:
+        tables.io_per_latency = _mp.RawArray(ctypes.c_ulong, d.LATENCY_HISTOGRAM_BUCKETS)
+    return tables
+
+
+class IOWorkerPool(object):
+    """A pool of persistent ioworker processes.
+
+    Spawning the process and initializing the driver in it costs seconds,
+    which dominates short ioworkers. Processes in the pool are created once,
+    and they keep the controller, namespace and qpairs across ioworkers.
+    Give the pool to Namespace.ioworker() to run the ioworker in it.
+
+    # Parameters
+        nvme0n1 (Namespace): the namespace the ioworkers of this pool send IO to
+        count (int): number of processes in the pool, which is the maximum number of concurrent ioworkers. Default: 1
+    """
+
+    def __init__(self, Namespace nvme0n1, count=1):
+        assert count >= 1, "pool needs at least one process"
+
+        self._pciaddr = nvme0n1._nvme.pcie._bdf
+        self._nsid = nvme0n1._nsid
+        self._nlba_verify = nvme0n1.nlba_verify
+        self._locker = nvme0n1.locker
+        self._idle = [self._spawn() for i in range(count)]
+        self._busy = []
+
+    def _spawn(self):
+        # each process has its own job and result queue, and shared
+        # memory for statistics and output tables of the longest ioworker
+        worker = _DotDict(jobq = _mp.SimpleQueue(),
+                          rqueue = _mp.SimpleQueue(),
+                          tables = _ioworker_tables(1000*3600, True, True))
+        worker.p = _mp.Process(target = _ioworker_pool_process,
+                               args = (worker.jobq, worker.rqueue,
+                                       self._locker, self._pciaddr,
+                                       self._nsid, self._nlba_verify,
+                                       worker.tables))
+        worker.p.daemon = True
+        worker.p.start()
+        return worker
+
+    def _remove(self, worker):
+        worker.p.join()
+
+        # release child process resources
+        for f in glob.glob("/var/run/dpdk/spdk%d/fbarray_memseg*%d" %
+                           (os.getpid(), worker.p.pid)):
+            os.remove(f)
+
+    def _acquire(self):
+        assert self._idle, "all processes in the pool are busy"
+        worker = self._idle.pop()
+        self._busy.append(worker)
+        return worker
+
+    def _release(self, worker, alive):
+        self._busy.remove(worker)
+        if alive:
+            self._idle.append(worker)
+        else:
+            # the process exits after error, replace it
+            self._remove(worker)
+            self._idle.append(self._spawn())
+
+    def close(self):
+        """stop all processes in the pool"""
+
+        assert not self._busy, "close ioworkers before closing the pool"
+        for worker in self._idle:
+            worker.jobq.put(None)
+        for worker in self._idle:
+            self._remove(worker)
+        self._idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class _IOWorker(object):
     """A process-worker executing user functions. Use its wrapper function Namespace.ioworker() in scripts. """
 
@@ -2436,39 +2732,67 @@ class _IOWorker(object):
                  lba_start, lba_step, lba_size,
                  lba_align, lba_random, region_start, region_end,
                  op_percentage, iops, io_count, time, qdepth, qprio,
-                 distribution, pvalue, ptype, io_sequence, fw_debug,
+                 distribution, pvalue, ptype, io_sequence, io_plan, fw_debug,
+                 qcount, qweight, burst_max, pool,
+                 bandwidth, rate_burst, arrival, jitter,
+                 latency_target, sweep, lba_distribution, lba_permutation,
+                 replay_speed,
+                 verify_threads,
+                 cmdlog,
                  output_io_per_second,
                  output_percentile_latency,
                  output_cmdlog_list):
-        # queue for returning result
-        self.q = _mp.SimpleQueue()
-
-        # create the child process
-        self.p = _mp.Process(target = self._ioworker,
-                             args = (self.q, locker, pciaddr,
-                                     nsid, nlba_verify,
-                                     int(random.random()*0xffffffff),
-                                     lba_start, lba_step, lba_size,
-                                     lba_align, lba_random,
-                                     region_start, region_end,
-                                     op_percentage,
-                                     iops, io_count, time,
-                                     max(2, qdepth), qprio,
-                                     distribution, pvalue, ptype,
-                                     io_sequence, fw_debug,
-                                     output_io_per_second,
-                                     output_percentile_latency,
-                                     output_cmdlog_list))
+        job = (int(random.random()*0xffffffff),
+               lba_start, lba_step, lba_size,
+               lba_align, lba_random,
+               region_start, region_end,
+               op_percentage,
+               iops, io_count, time,
+               max(2, qdepth), qprio,
+               distribution, pvalue, ptype,
+               io_sequence, io_plan, fw_debug,
+               qcount, qweight, burst_max,
+               bandwidth, rate_burst, arrival, jitter,
+               latency_target, sweep, lba_distribution, lba_permutation,
+               replay_speed,
+               verify_threads,
+               cmdlog,
+               output_io_per_second,
+               output_percentile_latency,
+               output_cmdlog_list)
+
+        self.pool = pool
+        if pool is not None:
+            # run in the persistent process of the pool
+            self.job = job
+        else:
+            # queue for returning result
+            self.q = _mp.SimpleQueue()
+            self._tables = _ioworker_tables(time if time else 1000*3600,
+                                            output_io_per_second is not None,
+                                            output_percentile_latency is not None)
+
+            # create the child process
+            self.p = _mp.Process(target = self._ioworker,
+                                 args = (self.q, locker, pciaddr,
+                                         nsid, nlba_verify, self._tables) + job)
+            self.p.daemon = True
         self.output_io_per_second = output_io_per_second
         self.output_percentile_latency = output_percentile_latency
         self.output_cmdlog_list = output_cmdlog_list
         self.op_counter = op_percentage
-        self.p.daemon = True
         self.fw_debug = fw_debug
 
     def start(self):
         """Start the worker's process"""
-        self.p.start()
+        if self.pool is not None:
+            self.worker = self.pool._acquire()
+            self.q = self.worker.rqueue
+            self._tables = self.worker.tables
+            ctypes.memset(self._tables.stats, 0, len(self._tables.stats))
+            self.worker.jobq.put(self.job)
+        else:
+            self.p.start()
         r = self.q.get()
         if r != "STARTED":
             # the result is sent after failed ioworker init
@@ -2485,14 +2809,30 @@ class _IOWorker(object):
 
         return self.q.empty() if hasattr(self, 'q') else False
 
-    def find_percentile_latency(self, k, output_io_per_latency):
-        target = sum(output_io_per_latency) * k // 100
-        total = 0
-        for l, c in enumerate(output_io_per_latency):
-            total += c
-            if total >= target:
-                return l
-        assert False, "should find the latency in the loop"
+    def stats(self):
+        """get live statistics of the ioworker
+
+        The ioworker publishes its statistics to shared memory every second,
+        so scripts can monitor it without disturbing the running ioworker.
+
+        Returns
+            (dict): io_count_read, io_count_nonread, bytes_read, bytes_nonread, mseconds, latency_max_us, and iops and latency_distribution of IO completed in the last second.
+        """
+
+        cdef d.ioworker_stats snapshot
+
+        d.ioworker_stats_read(<d.ioworker_stats*><size_t>ctypes.addressof(self._tables.stats),
+                              &snapshot)
+        return _DotDict({
+            'io_count_read': snapshot.io_count_read,
+            'io_count_nonread': snapshot.io_count_nonread,
+            'bytes_read': snapshot.bytes_read,
+            'bytes_nonread': snapshot.bytes_nonread,
+            'mseconds': snapshot.mseconds,
+            'iops': snapshot.iops,
+            'latency_max_us': snapshot.latency_max_us,
+            'latency_distribution': [snapshot.latency_histogram[i]
+                                     for i in range(d.LATENCY_HISTOGRAM_BUCKETS)]})
 
     def close(self):
         """Wait the ioworker's process finish
@@ -2502,11 +2842,13 @@ class _IOWorker(object):
 
         # get data from queue before joinging the subprocess, otherwise deadlock
         childpid, error, rets, \
-            output_io_per_second, \
-            output_io_per_latency, \
             output_cmdlog_list, \
-            op_counter = self.q.get()
-        self.p.join()
+            op_counter, \
+            qpair_rets, \
+            rets_extra, \
+            alive = self.q.get()
+        if self.pool is None:
+            self.p.join()
 
         _error_strings = (
             "no error",  #0
@@ -2517,6 +2859,7 @@ class _IOWorker(object):
             "buffer pool alloc fail", #-5
             "io cmd error", #-6
             "sudden terminated", #-7
+            "invalid io plan or sequence", #-8
             "illegal error code"
         )
         error_str = _error_strings[min(len(_error_strings)-1, -error)]
@@ -2528,14 +2871,20 @@ class _IOWorker(object):
             warnings.warn("ioworker device respond an ERROR status: %02x/%02x" %
                           ((rets.error>>8)&0x7, rets.error&0xff))
 
-        # transfer output table back: driver => script
+        # output tables are in shared memory: driver => script
+        # views of ctypes arrays are cast to native formats for indexing
         if self.output_io_per_second is not None:
             assert len(self.output_io_per_second) == 0
-            self.output_io_per_second += output_io_per_second[:rets['mseconds']//1000]
+            self.output_io_per_second += \
+                memoryview(self._tables.io_per_second).cast('B').cast('I')[:rets['mseconds']//1000]
             rets['iops_consistency'] = self.iops_consistency()
 
-        # transfer output table back: driver => script
-        if output_io_per_latency is not None:
+        output_io_per_latency = None
+        if self.output_percentile_latency is not None:
+            output_io_per_latency = memoryview(self._tables.io_per_latency).cast('B').cast('L')
+            if self.pool is not None:
+                # the table of the pool is reused by next ioworker
+                output_io_per_latency = output_io_per_latency.tolist()
             rets['latency_distribution'] = output_io_per_latency
 
         if output_io_per_latency is not None:
@@ -2543,7 +2892,7 @@ class _IOWorker(object):
             for i, k in enumerate(self.output_percentile_latency):
                 assert k>0 and k<100, "percentile should be in (0, 100)"
                 self.output_percentile_latency[k] = \
-                    self.find_percentile_latency(k, output_io_per_latency)
+                    latency_histogram_percentile(output_io_per_latency, k)
 
         # transfer output table back: driver => script
         if self.output_cmdlog_list:
@@ -2562,11 +2911,23 @@ class _IOWorker(object):
         else:
             rets.cpu_usage = 0
 
+        # results of optional features, e.g. latency_target and sweep
+        rets.update(rets_extra)
+
+        # statistics of each qpair
+        rets['qpairs'] = [_DotDict(r) for r in qpair_rets]
+        for r in rets.qpairs:
+            r.cpu_usage = rets.cpu_usage
+
         # release child process resources
         del self.q
-        for f in glob.glob("/var/run/dpdk/spdk%d/fbarray_memseg*%d" %
-                           (os.getpid(), childpid)):
-            os.remove(f)
+        if self.pool is not None:
+            # the process and its tables are ready for next ioworker
+            self.pool._release(self.worker, alive)
+        else:
+            for f in glob.glob("/var/run/dpdk/spdk%d/fbarray_memseg*%d" %
+                               (os.getpid(), childpid)):
+                os.remove(f)
 
         if self.fw_debug and error:
             # assert and stop test when ioworker fail in debug mode
@@ -2595,277 +2956,573 @@ class _IOWorker(object):
         self.close()
         return True
 
-    def _ioworker(self, rqueue, locker, pciaddr, nsid, nlba_verify, seed,
-                  lba_start, lba_step, lba_size, lba_align, lba_random,
+    def _ioworker(self, rqueue, locker, pciaddr, nsid, nlba_verify, tables, *job):
+        _ioworker_run(rqueue, locker, pciaddr, nsid, nlba_verify, tables, {}, False, *job)
+
+
+def _ioworker_release(locker, res):
+    """close resources of the ioworker process in right order"""
+
+    cdef Controller nvme0
+
+    with locker:
+        terminated = d.driver_config_read() & 0x10
+
+        if 'qpairs' in res:
+            # fail fast to delete queue after power loss
+            nvme0 = res['nvme0']
+            orig = nvme0.timeout
+            if terminated:
+                nvme0.timeout = 10
+                # backup BAR and remap to another memory
+                d.nvme_bar_remap(nvme0.pcie._ctrlr)
+
+            for qpair in res['qpairs']:
+                try:
+                    qpair.delete()
+                except:
+                    pass
+
+            # use original timeout
+            if terminated:
+                nvme0.timeout = orig
+                # use original BAR
+                d.nvme_bar_recover(nvme0.pcie._ctrlr)
+
+        if 'nvme0n1' in res:
+            res['nvme0n1'].close()
+
+        if 'pcie' in res:
+            res['pcie'].close()
+
+    res.clear()
+
+
+def _ioworker_pool_process(jobq, rqueue, locker, pciaddr, nsid, nlba_verify, tables):
+    """persistent ioworker process of IOWorkerPool"""
+
+    res = {}
+    keep = True
+    while keep:
+        job = jobq.get()
+        if job is None:
+            # pool is closed
+            _ioworker_release(locker, res)
+            break
+
+        # exit the process after any error or termination
+        keep = _ioworker_run(rqueue, locker, pciaddr, nsid, nlba_verify,
+                             tables, res, True, *job)
+    gc.collect()
+
+
+def _ioworker_run(rqueue, locker, pciaddr, nsid, nlba_verify, tables, res,
+                  persistent, seed, lba_start, lba_step, lba_size, lba_align, lba_random,
                   region_start, region_end, op_percentage,
                   iops, io_count, seconds, qdepth, qprio,
-                  distribution, pvalue, ptype, io_sequence, fw_debug,
+                  distribution, pvalue, ptype, io_sequence, io_plan, fw_debug,
+                  qcount, qweight, burst_max,
+                  bandwidth, rate_burst, arrival, jitter,
+                  latency_target, sweep, lba_distribution, lba_permutation,
+                  replay_speed,
+                  verify_threads,
+                  cmdlog,
                   output_io_per_second,
                   output_percentile_latency,
                   output_cmdlog_list):
-        cdef d.ioworker_args args
-        cdef d.ioworker_rets rets
-        cdef int error = 0
-        output_io_per_latency = None
+    """run one ioworker in the ioworker process
 
-        try:
-            # register events in worker's processor
-            # CTRL-c to exit
-            signal.signal(signal.SIGINT, _interrupt_handler)
-            # timeout
-            signal.signal(signal.SIGALRM, _timeout_signal_handler)
-
-            # setup random seed
-            d.driver_srand(seed)
-            random.seed(seed)
-
-            # init var
-            _reentry_flag_init()
-            memset(&args, 0, sizeof(args))
-            memset(&rets, 0, sizeof(rets))
-
-            # setup lba_size lists
-            assert isinstance(lba_size, dict)
-            assert isinstance(lba_align, list)
-            assert len(lba_size) == len(lba_align), "size and align not match"
-            args.lba_size_max = max(lba_size.keys())
-            args.lba_align_max = max(lba_align)
-            args.lba_size_ratio_sum = sum(lba_size[i] for i in lba_size)
-            assert args.lba_size_ratio_sum <= 10000, "please simplify the io_size ratios"
-            args.lba_size_list = <unsigned int*>PyMem_Malloc(len(lba_size)*sizeof(unsigned int))
-            args.lba_size_list_len = len(lba_size)
-            args.lba_size_list_ratio = <unsigned int*>PyMem_Malloc(len(lba_size)*sizeof(unsigned int))
-            args.lba_size_list_align = <unsigned int*>PyMem_Malloc(len(lba_size)*sizeof(unsigned int))
-            if not args.lba_size_list or \
-               not args.lba_size_list_ratio or \
-               not args.lba_size_list_align:
-                raise MemoryError()
-            for i, io_size in enumerate(lba_size):
-                args.lba_size_list[i] = io_size
-                args.lba_size_list_ratio[i] = lba_size[io_size]
-                args.lba_size_list_align[i] = lba_align[i]
-                assert io_size < 0x10000, "io_size is a 16bit-field in commands"
-                assert lba_align[i] < 0x10000, "io_size is a 16bit-field in commands"
-
-            # check distribution
-            if distribution is not None:
-                assert region_start == 0, "distribution has to be on the full region"
-                assert region_end == 0xffffffffffffffff, "distribution has to be on the full region"
-                assert len(distribution) == 100, "distribution on 100 equal sections"
-                assert sum(distribution) == 10000, "distribute 10000 IO on 100 sections"
-                assert lba_random == 100, "distribution has to be all random IO"
-                args.distribution = <unsigned int*>PyMem_Malloc(100*sizeof(unsigned int))
-                if not args.distribution:
-                    raise MemoryError()
-                for i in range(100):
-                    args.distribution[i] = distribution[i]
-
-            if seconds == 0:
-                # collect upto 1000hr IOPS data
-                seconds = 1000*3600ULL
-
-            if io_sequence:
-                assert iops==0, "run sequence instead of fixed iops workload"
-                args.io_sequence_len = len(io_sequence)
-                args.io_sequence = <d.ioworker_ioseq*>PyMem_Malloc(len(io_sequence)*sizeof(d.ioworker_ioseq))
-                if not args.io_sequence:
+    Resources, including pcie, controller, namespace and qpairs, are kept
+    in the dict res. The persistent process of IOWorkerPool reuses them
+    in its next ioworker, until any error or termination happens.
+    """
+
+    cdef d.ioworker_args args
+    cdef d.ioworker_rets rets
+    cdef d.ioworker_target target
+    cdef d.qpair** qpair_list = NULL
+    cdef Qpair q
+    cdef Namespace ns
+    cdef int error = 0
+    qpair_rets = []
+    rets_extra = {}
+    keep = False
+
+    try:
+        # register events in worker's processor
+        # CTRL-c to exit
+        signal.signal(signal.SIGINT, _interrupt_handler)
+        # timeout
+        signal.signal(signal.SIGALRM, _timeout_signal_handler)
+
+        # setup random seed
+        d.driver_srand(seed)
+        random.seed(seed)
+
+        # init var
+        _reentry_flag_init()
+        memset(&args, 0, sizeof(args))
+        memset(&rets, 0, sizeof(rets))
+        memset(&target, 0, sizeof(target))
+
+        # live statistics in shared memory
+        args.stats = <d.ioworker_stats*><size_t>ctypes.addressof(tables.stats)
+
+        # setup lba_size lists
+        assert isinstance(lba_size, dict)
+        assert isinstance(lba_align, list)
+        assert len(lba_size) == len(lba_align), "size and align not match"
+        args.lba_size_max = max(lba_size.keys())
+        args.lba_align_max = max(lba_align)
+        args.lba_size_ratio_sum = sum(lba_size[i] for i in lba_size)
+        assert args.lba_size_ratio_sum <= 10000, "please simplify the io_size ratios"
+        args.lba_size_list = <unsigned int*>PyMem_Malloc(len(lba_size)*sizeof(unsigned int))
+        args.lba_size_list_len = len(lba_size)
+        args.lba_size_list_ratio = <unsigned int*>PyMem_Malloc(len(lba_size)*sizeof(unsigned int))
+        args.lba_size_list_align = <unsigned int*>PyMem_Malloc(len(lba_size)*sizeof(unsigned int))
+        if not args.lba_size_list or \
+           not args.lba_size_list_ratio or \
+           not args.lba_size_list_align:
+            raise MemoryError()
+        for i, io_size in enumerate(lba_size):
+            args.lba_size_list[i] = io_size
+            args.lba_size_list_ratio[i] = lba_size[io_size]
+            args.lba_size_list_align[i] = lba_align[i]
+            assert io_size < 0x10000, "io_size is a 16bit-field in commands"
+            assert lba_align[i] < 0x10000, "io_size is a 16bit-field in commands"
+
+        # random lba without replacement
+        args.lba_permutation = lba_permutation
+
+        # skewed distribution of random lba
+        if lba_distribution is not None:
+            args.lba_distribution = lba_distribution[0]
+            args.lba_distribution_param = lba_distribution[1]
+            levels = lba_distribution[2]
+            if levels:
+                args.lba_hotcold_len = len(levels)//2
+                args.lba_hotcold = <unsigned int*>PyMem_Malloc(len(levels)*sizeof(unsigned int))
+                if not args.lba_hotcold:
                     raise MemoryError()
-                for i, line in enumerate(io_sequence):
-                    args.io_sequence[i].slba = long(line[2])
-                    args.io_sequence[i].timestamp = line[0]
-                    args.io_sequence[i].op = line[1]
-                    args.io_sequence[i].nlba = line[3]
-
-            assert op_percentage is not None
-            assert type(op_percentage) is dict
-            args.op_list = <unsigned int*>PyMem_Malloc(sizeof(unsigned int)*len(op_percentage))
-            args.op_counter = <unsigned long*>PyMem_Malloc(sizeof(unsigned long)*len(op_percentage))
-            if not args.op_list or not args.op_counter:
+                for i, x in enumerate(levels):
+                    args.lba_hotcold[i] = x
+
+        # check distribution
+        if distribution is not None:
+            assert region_start == 0, "distribution has to be on the full region"
+            assert region_end == 0xffffffffffffffff, "distribution has to be on the full region"
+            assert len(distribution) == 100, "distribution on 100 equal sections"
+            assert sum(distribution) == 10000, "distribute 10000 IO on 100 sections"
+            assert lba_random == 100, "distribution has to be all random IO"
+            args.distribution = <unsigned int*>PyMem_Malloc(100*sizeof(unsigned int))
+            if not args.distribution:
                 raise MemoryError()
-            for i, k in enumerate(op_percentage):
-                args.op_list[i] = k
-                args.op_counter[i] = op_percentage[k]
-            args.op_num = len(op_percentage)
-
-            # create array for output data: io counter per second
-            if output_io_per_second is not None:
-                # need time duration to collect io counter per second data
-                args.io_counter_per_second = <unsigned int*>PyMem_Malloc(seconds*sizeof(unsigned int))
-                if not args.io_counter_per_second:
-                    raise MemoryError()
-                memset(args.io_counter_per_second, 0, seconds*sizeof(unsigned int))
+            for i in range(100):
+                args.distribution[i] = distribution[i]
+
+        if seconds == 0:
+            # collect upto 1000hr IOPS data
+            seconds = 1000*3600ULL
+
+        if isinstance(io_sequence, str):
+            assert iops==0, "run sequence instead of fixed iops workload"
+            # the ioworker maps the file, not read it here
+            io_sequence_file = io_sequence.encode('utf-8')
+            args.io_sequence_file = io_sequence_file
+        elif io_sequence:
+            assert iops==0, "run sequence instead of fixed iops workload"
+            args.io_sequence_len = len(io_sequence)
+            args.io_sequence = <d.ioworker_ioseq*>PyMem_Malloc(len(io_sequence)*sizeof(d.ioworker_ioseq))
+            if not args.io_sequence:
+                raise MemoryError()
+            for i, line in enumerate(io_sequence):
+                # us in the list, ns in the ioworker
+                args.io_sequence[i].timestamp = int(line[0]*1000)
+                args.io_sequence[i].slba = long(line[2])
+                args.io_sequence[i].op = line[1]
+                args.io_sequence[i].nlba = line[3]
+
+        if io_sequence:
+            # dispatch lag of the replay
+            args.replay_speed = replay_speed
+            args.replay = <d.ioworker_replay*>PyMem_Malloc(sizeof(d.ioworker_replay))
+            args.replay_histogram = <unsigned long*>PyMem_Malloc(d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+            if not args.replay or not args.replay_histogram:
+                raise MemoryError()
+            memset(args.replay, 0, sizeof(d.ioworker_replay))
+            memset(args.replay_histogram, 0, d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+
+        # pre-generated io plan
+        if io_plan is True:
+            args.io_plan_batch = d.IOWORKER_PLAN_BATCH
+        elif io_plan is not None:
+            args.io_plan_len = len(io_plan)//sizeof(d.ioworker_plan)
+            args.io_plan = <d.ioworker_plan*>PyMem_Malloc(len(io_plan))
+            if not args.io_plan:
+                raise MemoryError()
+            memcpy(args.io_plan, <const char*>io_plan, len(io_plan))
 
-            # create array for output data: io counter per latency
-            if output_percentile_latency is not None:
-                # 1-1000,000 us, all latency > 1s are counted as 1000,000us
-                args.io_counter_per_latency = <unsigned long*>PyMem_Malloc(1000*1000*sizeof(unsigned long))
-                if not args.io_counter_per_latency:
-                    raise MemoryError()
-                memset(args.io_counter_per_latency, 0, 1000*1000*sizeof(unsigned long))
-
-            # create array for output data: io counter per second
-            args.cmdlog_list_len = 0
-            if output_cmdlog_list:
-                # command dwords sorted by completion time
-                args.cmdlog_list_len = len(output_cmdlog_list)
-                args.cmdlog_list = <d.ioworker_cmdlog*>PyMem_Malloc(sizeof(d.ioworker_cmdlog)*len(output_cmdlog_list))
-                if not args.cmdlog_list:
-                    raise MemoryError()
-                memset(args.cmdlog_list, 0, sizeof(d.ioworker_cmdlog)*len(output_cmdlog_list))
+        assert op_percentage is not None
+        assert type(op_percentage) is dict
+        args.op_list = <unsigned int*>PyMem_Malloc(sizeof(unsigned int)*len(op_percentage))
+        args.op_counter = <unsigned long*>PyMem_Malloc(sizeof(unsigned long)*len(op_percentage))
+        if not args.op_list or not args.op_counter:
+            raise MemoryError()
+        for i, k in enumerate(op_percentage):
+            args.op_list[i] = k
+            args.op_counter[i] = op_percentage[k]
+        args.op_num = len(op_percentage)
+
+        # statistics and latency histogram of each opcode
+        args.op_stats = <d.ioworker_op_stats*>PyMem_Malloc(sizeof(d.ioworker_op_stats)*args.op_num)
+        if not args.op_stats:
+            raise MemoryError()
+        memset(args.op_stats, 0, sizeof(d.ioworker_op_stats)*args.op_num)
+        if output_percentile_latency is not None:
+            args.op_histogram = <unsigned long*>PyMem_Malloc(args.op_num*d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+            if not args.op_histogram:
+                raise MemoryError()
+            memset(args.op_histogram, 0, args.op_num*d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
 
-            # lba_step only works with sequential io
-            if lba_step is None:
-                lba_step = 0
-                lba_step_valid = False
-            else:
-                assert type(lba_step) == int
-                lba_step_valid = True
-
-            # transfer agurments
-            args.lba_start = lba_start
-            args.lba_step = lba_step
-            args.lba_step_valid = lba_step_valid
-            args.lba_random = lba_random
-            args.region_start = region_start
-            args.region_end = region_end
-            args.iops = iops
-            args.io_count = io_count
-            args.seconds = seconds
-            args.qdepth = qdepth
-            args.pvalue = pvalue
-            args.ptype = ptype
-
-            # ready: create resources
-            with locker:
-                pcie = Pcie(pciaddr.decode('utf-8'))
-                nvme0 = Controller(pcie, True)
-                nvme0n1 = Namespace(nvme0, nsid, nlba_verify)
-                qpair = Qpair(nvme0, qdepth, qprio)
-
-            # set: all ioworkers created in recent seconds will start at the same time
+        # verify read data in helper threads
+        args.verify_threads = verify_threads
+
+        # qpairs polled in the ioworker
+        args.qcount = qcount
+        args.burst_max = burst_max
+        args.qpair_rets = <d.ioworker_rets*>PyMem_Malloc(qcount*sizeof(d.ioworker_rets))
+        qpair_list = <d.qpair**>PyMem_Malloc(qcount*sizeof(d.qpair*))
+        if not args.qpair_rets or not qpair_list:
+            raise MemoryError()
+        memset(args.qpair_rets, 0, qcount*sizeof(d.ioworker_rets))
+        if qweight is not None:
+            args.qweight = <unsigned int*>PyMem_Malloc(qcount*sizeof(unsigned int))
+            if not args.qweight:
+                raise MemoryError()
+            for i in range(qcount):
+                args.qweight[i] = qweight[i]
+
+        # output data in shared memory: io counter per second
+        if output_io_per_second is not None:
+            # need time duration to collect io counter per second data
+            assert len(tables.io_per_second) >= seconds
+            args.io_counter_per_second = <unsigned int*><size_t>ctypes.addressof(tables.io_per_second)
+            memset(args.io_counter_per_second, 0, seconds*sizeof(unsigned int))
+
+        # output data in shared memory: io counter per latency
+        if output_percentile_latency is not None:
+            # log-linear latency histogram, see latency_histogram_value()
+            args.io_counter_per_latency = <unsigned long*><size_t>ctypes.addressof(tables.io_per_latency)
+            memset(args.io_counter_per_latency, 0, d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+
+        # create array for output data: io counter per second
+        args.cmdlog_list_len = 0
+        if output_cmdlog_list:
+            # command dwords sorted by completion time
+            args.cmdlog_list_len = len(output_cmdlog_list)
+            args.cmdlog_list = <d.ioworker_cmdlog*>PyMem_Malloc(sizeof(d.ioworker_cmdlog)*len(output_cmdlog_list))
+            if not args.cmdlog_list:
+                raise MemoryError()
+            memset(args.cmdlog_list, 0, sizeof(d.ioworker_cmdlog)*len(output_cmdlog_list))
+
+        # lba_step only works with sequential io
+        if lba_step is None:
+            lba_step = 0
+            lba_step_valid = False
+        else:
+            assert type(lba_step) == int
+            lba_step_valid = True
+
+        # transfer agurments
+        args.lba_start = lba_start
+        args.lba_step = lba_step
+        args.lba_step_valid = lba_step_valid
+        args.lba_random = lba_random
+        args.region_start = region_start
+        args.region_end = region_end
+        args.iops = iops
+        args.bandwidth = int(bandwidth*1000*1000)
+        args.rate_burst = rate_burst
+        args.arrival = arrival
+        args.jitter = jitter
+        if latency_target is not None:
+            target.percentile = latency_target[0]
+            target.latency_us = latency_target[1]
+            args.target = &target
+        if sweep is not None:
+            args.sweep_len = len(sweep[0])
+            args.sweep_dwell_ms = sweep[1]
+            args.sweep = <d.ioworker_sweep*>PyMem_Malloc(args.sweep_len*sizeof(d.ioworker_sweep))
+            args.sweep_histogram = <unsigned long*>PyMem_Malloc(args.sweep_len*d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+            if not args.sweep or not args.sweep_histogram:
+                raise MemoryError()
+            memset(args.sweep, 0, args.sweep_len*sizeof(d.ioworker_sweep))
+            memset(args.sweep_histogram, 0, args.sweep_len*d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+            for i, (q, io_size) in enumerate(sweep[0]):
+                args.sweep[i].qdepth = q
+                args.sweep[i].io_size = io_size
+        args.io_count = io_count
+        args.seconds = seconds
+        args.qdepth = qdepth
+        args.pvalue = pvalue
+        args.ptype = ptype
+
+        # ready: create resources, or reuse the ones of last ioworker
+        with locker:
+            if 'nvme0n1' not in res:
+                res['pcie'] = Pcie(pciaddr.decode('utf-8'))
+                res['nvme0'] = Controller(res['pcie'], True)
+                res['nvme0n1'] = Namespace(res['nvme0'], nsid, nlba_verify)
+            delay_doorbell = burst_max > 1
+            if res.get('qconfig') != (qcount, qdepth, qprio, delay_doorbell):
+                for qpair in res.pop('qpairs', []):
+                    qpair.delete()
+                res['qpairs'] = []
+                for i in range(qcount):
+                    res['qpairs'].append(Qpair(res['nvme0'], qdepth, qprio,
+                                               delay_doorbell=delay_doorbell))
+                res['qconfig'] = (qcount, qdepth, qprio, delay_doorbell)
+        ns = res['nvme0n1']
+        for i in range(qcount):
+            q = res['qpairs'][i]
+            qpair_list[i] = q._qpair
+            d.qpair_cmdlog_mode(q._qpair, cmdlog[0], cmdlog[1])
+
+        # set: all ioworkers created in recent seconds will start at the same time
+        if not persistent:
             if time.time() > _IOWorker.target_start_time:
                 _IOWorker.target_start_time = math.ceil(10*time.time())/10+0.1
             time.sleep(_IOWorker.target_start_time-time.time())
 
-            # go: start at the same time
-            rqueue.put("STARTED")
-            error = d.ioworker_entry(nvme0n1._ns, qpair._qpair, &args, &rets)
-            if not error and rets.error:
-                error = -6;  # io cmd error
-
-            # transfer back iops counter per second: c => cython
-            if output_io_per_second is not None:
-                for i in range(seconds):
-                    output_io_per_second.append(args.io_counter_per_second[i])
-
-            # transfer back percentile latency: c => cython
-            if output_percentile_latency is not None:
-                output_io_per_latency = []
-                for i in range(1000*1000):
-                    output_io_per_latency.append(args.io_counter_per_latency[i])
-
-            # transfer back: c => cython
-            if output_cmdlog_list:
-                assert type(output_cmdlog_list) is list, "must be a list for data output"
-                for i in range(args.cmdlog_list_len):
-                    cmd = args.cmdlog_list[i]
-                    output_cmdlog_list[i] = cmd.lba, cmd.count, cmd.opcode
-
-            # output all io counters
-            for i in range(len(op_percentage)):
-                op_percentage[args.op_list[i]] = args.op_counter[i]
-
-        except Exception as e:
-            logging.warning(e)
-            warnings.warn(e)
-            error = -1
-
-        finally:
-            # checkout timeout event
-            if _timeout_happened:
-                error = -3
-
-            # sudden terminate, not block on the queue
-            fast_exit = False
-            if error:
-                fast_exit = True
-            if error == -7:
-                error = 0
-
-            # feed return to main process
-            rqueue.put((os.getpid(),
-                        error,
-                        rets,
-                        output_io_per_second,
-                        output_io_per_latency,
-                        output_cmdlog_list,
-                        op_percentage))
-            if not fast_exit:
-                # wait ioworker to collect result data in main process
-                while not rqueue.empty():
-                    time.sleep(1)
-
-            if not fw_debug or not error:
-                with locker:
-                    terminated = d.driver_config_read() & 0x10
-
-                    # close resources in right order
-                    if 'qpair' in locals():
-                        # fail fast to delete queue after power loss
-                        orig = nvme0.timeout
-                        if terminated:
-                            nvme0.timeout = 10
-                            # backup BAR and remap to another memory
-                            d.nvme_bar_remap(nvme0.pcie._ctrlr)
-
-                        try:
-                            qpair.delete()
-                        except:
-                            pass
-
-                        # use original timeout
-                        if terminated:
-                            nvme0.timeout = orig
-                            # use original BAR
-                            d.nvme_bar_recover(nvme0.pcie._ctrlr)
-
-                    if 'nvme0n1' in locals():
-                        nvme0n1.close()
-
-                    if 'pcie' in locals():
-                        pcie.close()
-
-            if args.io_sequence:
-                PyMem_Free(args.io_sequence)
-
-            if args.io_counter_per_second:
-                PyMem_Free(args.io_counter_per_second)
-
-            if args.io_counter_per_latency:
-                PyMem_Free(args.io_counter_per_latency)
-
-            if args.cmdlog_list_len:
-                PyMem_Free(args.cmdlog_list)
-
-            if args.distribution:
-                PyMem_Free(args.distribution)
-
-            if args.lba_size_list:
-                PyMem_Free(args.lba_size_list)
-
-            if args.lba_size_list_ratio:
-                PyMem_Free(args.lba_size_list_ratio)
-
-            if args.lba_size_list_align:
-                PyMem_Free(args.lba_size_list_align)
-
-            if args.op_list:
-                PyMem_Free(args.op_list)
-
-            if args.op_counter:
-                PyMem_Free(args.op_counter)
+        # go: start at the same time
+        rqueue.put("STARTED")
+        error = d.ioworker_entry(ns._ns, qpair_list, &args, &rets)
+        if not error and rets.error:
+            error = -6;  # io cmd error
+
+        # transfer back: c => cython
+        if output_cmdlog_list:
+            assert type(output_cmdlog_list) is list, "must be a list for data output"
+            for i in range(args.cmdlog_list_len):
+                cmd = args.cmdlog_list[i]
+                output_cmdlog_list[i] = cmd.lba, cmd.count, cmd.opcode
+
+        # output all io counters
+        for i in range(len(op_percentage)):
+            op_percentage[args.op_list[i]] = args.op_counter[i]
+
+        # transfer back statistics of each qpair
+        qpair_rets = [args.qpair_rets[i] for i in range(qcount)]
+
+        # transfer back statistics of each opcode
+        rets_extra['op_stats'] = {}
+        for i in range(args.op_num):
+            op = args.op_stats[i]
+            op_stats = _DotDict(io_count=op['io_count'],
+                                bytes=op['bytes'],
+                                latency_max_us=op['latency_max_us'],
+                                latency_average_us=op['latency_total_ns']//op['io_count']//1000 if op['io_count'] else 0)
+            if args.op_histogram:
+                op_stats.latency_distribution = [args.op_histogram[i*d.LATENCY_HISTOGRAM_BUCKETS+j]
+                                                 for j in range(d.LATENCY_HISTOGRAM_BUCKETS)]
+                op_stats.latency = {}
+                for p in output_percentile_latency:
+                    op_stats.latency[p] = d.latency_histogram_percentile(
+                        &args.op_histogram[i*d.LATENCY_HISTOGRAM_BUCKETS], p)/1000
+            rets_extra['op_stats'][args.op_list[i]] = op_stats
+
+        # transfer back the dispatch lag of the replay
+        if args.replay:
+            lag = {}
+            for p in (output_percentile_latency or [50, 99, 99.9]):
+                lag[p] = d.latency_histogram_percentile(args.replay_histogram, p)/1000
+            rets_extra['replay'] = _DotDict(
+                io_count=args.replay.io_count,
+                lag_max_us=args.replay.lag_max_us,
+                lag_average_us=args.replay.lag_total_ns//args.replay.io_count//1000 if args.replay.io_count else 0,
+                lag=lag,
+                lag_distribution=[args.replay_histogram[i] for i in range(d.LATENCY_HISTOGRAM_BUCKETS)])
+
+        # transfer back the operating point of the latency target
+        if latency_target is not None:
+            rets_extra['latency_target'] = _DotDict(target)
+
+        # transfer back the table of the sweep
+        if sweep is not None:
+            rets_extra['sweep'] = []
+            for i in range(args.sweep_len):
+                step = args.sweep[i]
+                latency = {}
+                for p in sweep[2]:
+                    latency[p] = d.latency_histogram_percentile(
+                        &args.sweep_histogram[i*d.LATENCY_HISTOGRAM_BUCKETS], p)/1000
+                ms = step['mseconds']
+                rets_extra['sweep'].append(_DotDict(
+                    qdepth=step['qdepth'],
+                    io_size=step['io_size'],
+                    io_count=step['io_count'],
+                    mseconds=ms,
+                    iops=step['io_count']*1000//ms if ms else 0,
+                    bandwidth=step['bytes']/ms/1000 if ms else 0,
+                    latency_average_us=step['latency_total_ns']//step['io_count']//1000 if step['io_count'] else 0,
+                    latency=latency))
+
+    except Exception as e:
+        logging.warning(e)
+        warnings.warn(e)
+        error = -1
+
+    finally:
+        # checkout timeout event
+        if _timeout_happened:
+            error = -3
+
+        # sudden terminate, not block on the queue
+        fast_exit = False
+        if error:
+            fast_exit = True
+        if error == -7:
+            error = 0
+
+        # persistent process keeps resources for the next ioworker
+        keep = persistent and not fast_exit and \
+            not d.driver_config_read() & 0x10
+
+        # feed return to main process
+        rqueue.put((os.getpid(),
+                    error,
+                    rets,
+                    output_cmdlog_list,
+                    op_percentage,
+                    qpair_rets,
+                    rets_extra,
+                    keep))
+        if not fast_exit and not persistent:
+            # wait ioworker to collect result data in main process
+            while not rqueue.empty():
+                time.sleep(1)
 
-            gc.collect()
+        if not keep and (not fw_debug or not error):
+            _ioworker_release(locker, res)
+
+        if args.io_sequence:
+            PyMem_Free(args.io_sequence)
+
+        if args.io_plan:
+            PyMem_Free(args.io_plan)
+
+        if args.cmdlog_list_len:
+            PyMem_Free(args.cmdlog_list)
+
+        if args.distribution:
+            PyMem_Free(args.distribution)
+
+        if args.lba_hotcold:
+            PyMem_Free(args.lba_hotcold)
+
+        if args.lba_size_list:
+            PyMem_Free(args.lba_size_list)
+
+        if args.lba_size_list_ratio:
+            PyMem_Free(args.lba_size_list_ratio)
+
+        if args.lba_size_list_align:
+            PyMem_Free(args.lba_size_list_align)
+
+        if args.op_list:
+            PyMem_Free(args.op_list)
+
+        if args.op_counter:
+            PyMem_Free(args.op_counter)
+
+        if args.op_stats:
+            PyMem_Free(args.op_stats)
+
+        if args.op_histogram:
+            PyMem_Free(args.op_histogram)
+
+        if args.replay:
+            PyMem_Free(args.replay)
+
+        if args.replay_histogram:
+            PyMem_Free(args.replay_histogram)
+
+        if args.qpair_rets:
+            PyMem_Free(args.qpair_rets)
+
+        if args.qweight:
+            PyMem_Free(args.qweight)
+
+        if args.sweep:
+            PyMem_Free(args.sweep)
+
+        if args.sweep_histogram:
+            PyMem_Free(args.sweep_histogram)
+
+        if qpair_list:
+            PyMem_Free(qpair_list)
+
+        gc.collect()
+
+    return keep
+
+
+def latency_histogram_value(index):
+    """get the latency represented by a bucket of the latency histogram
+
+    The ioworker collects latency in a log-linear histogram, which is
+    returned as latency_distribution. The relative error of the latency
+    in each bucket is less than 1/32.
+
+    # Parameters
+        index (int): the index of the bucket in the histogram
+
+    Returns
+        (float): the latency in micro-seconds
+    """
+
+    assert index < d.LATENCY_HISTOGRAM_BUCKETS
+    return d.latency_histogram_value(index)/1000
+
+
+def latency_histogram_percentile(histogram, percentile):
+    """get the latency of a percentile in the latency histogram
+
+    # Parameters
+        histogram (list): latency_distribution returned by ioworkers, or merged by latency_histogram_merge()
+        percentile (float): the percentile, in (0, 100]
+
+    Returns
+        (float): the latency in micro-seconds
+    """
+
+    cdef unsigned long* buckets
+    cdef unsigned long latency
+
+    assert len(histogram) == d.LATENCY_HISTOGRAM_BUCKETS
+    buckets = <unsigned long*>PyMem_Malloc(d.LATENCY_HISTOGRAM_BUCKETS*sizeof(unsigned long))
+    if not buckets:
+        raise MemoryError()
+    for i, c in enumerate(histogram):
+        buckets[i] = c
+    latency = d.latency_histogram_percentile(buckets, percentile)
+    PyMem_Free(buckets)
+    return latency/1000
+
+
+def latency_histogram_merge(*histograms):
+    """merge latency histograms of multiple ioworkers
+
+    # Parameters
+        histograms (list): latency_distribution returned by ioworkers
+
+    Returns
+        (list): the merged histogram
+    """
+
+    for h in histograms:
+        assert len(h) == d.LATENCY_HISTOGRAM_BUCKETS
+    return [sum(c) for c in zip(*histograms)]
 
 
 def srand(seed):
@@ -38,6 +38,137 @@
 #include "../spdk/lib/nvme/nvme_internal.h"
 
 
+static inline uint64_t ioworker_rand_rotl(const uint64_t x, int k)
+{
+  return (x << k) | (x >> (64 - k));
+}
+
+static uint64_t ioworker_rand_splitmix64(uint64_t* x)
+{
+  uint64_t z = (*x += 0x9e3779b97f4a7c15ULL);
+
+  z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL;
+  z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL;
+  return z ^ (z >> 31);
+}
+
+static void ioworker_rand_init(struct ioworker_global_ctx* gctx, uint64_t seed)
+{
+  // expand the seed to the whole state, which cannot be all zero
+  for (uint32_t i=0; i<4; i++)
+  {
+    gctx->rand_state[i] = ioworker_rand_splitmix64(&seed);
+  }
+}
+
+static inline uint64_t ioworker_rand(struct ioworker_global_ctx* gctx)
+{
+  // xoshiro256**: per-ioworker 64-bit generator, no lock as libc random()
+  uint64_t* s = gctx->rand_state;
+  const uint64_t result = ioworker_rand_rotl(s[1] * 5, 7) * 9;
+  const uint64_t t = s[1] << 17;
+
+  s[2] ^= s[0];
+  s[3] ^= s[1];
+  s[1] ^= s[2];
+  s[0] ^= s[3];
+  s[2] ^= t;
+  s[3] = ioworker_rand_rotl(s[3], 45);
+
+  return result;
+}
+
+static inline uint64_t ioworker_rand_range(struct ioworker_global_ctx* gctx,
+                                           uint64_t range)
+{
+  // unbiased random number in [0, range), by Lemire's multiply-shift
+  unsigned __int128 m = (unsigned __int128)ioworker_rand(gctx) * range;
+  uint64_t l = (uint64_t)m;
+
+  if (l < range)
+  {
+    uint64_t threshold = -range % range;
+
+    while (l < threshold)
+    {
+      m = (unsigned __int128)ioworker_rand(gctx) * range;
+      l = (uint64_t)m;
+    }
+  }
+
+  return m >> 64;
+}
+
+
+static void ioworker_limiter_init(struct ioworker_limiter* limiter,
+                                  uint64_t rate,
+                                  uint64_t burst,
+                                  uint64_t now)
+{
+  // interval in 32.32 fixed point ns, so high rates are not truncated
+  limiter->interval = rate ? (NS_PER_S<<32)/rate : 0;
+  limiter->tau = ((unsigned __int128)limiter->interval*(burst ? burst-1 : 0))>>32;
+  limiter->tat = now;
+  limiter->tat_frac = 0;
+}
+
+static inline bool ioworker_limiter_ready(struct ioworker_limiter* limiter,
+                                          uint64_t now)
+{
+  // conforming when the theoretical arrival time is within the burst
+  return limiter->tat <= now+limiter->tau;
+}
+
+static inline void ioworker_limiter_charge(struct ioworker_limiter* limiter,
+                                           uint64_t cost,
+                                           uint64_t now)
+{
+  unsigned __int128 delta;
+
+  if (limiter->interval == 0)
+  {
+    // not limited
+    return;
+  }
+
+  if (limiter->tat < now)
+  {
+    // idle time does not save credits beyond the burst
+    limiter->tat = now;
+    limiter->tat_frac = 0;
+  }
+
+  delta = (unsigned __int128)limiter->interval*cost + limiter->tat_frac;
+  limiter->tat += (uint64_t)(delta>>32);
+  limiter->tat_frac = (uint32_t)delta;
+}
+
+static uint64_t ioworker_arrival_next(struct ioworker_global_ctx* gctx)
+{
+  struct ioworker_args* args = gctx->args;
+  double interval = gctx->arrival_interval;
+  // uniform random number in (0, 1]
+  double u = ((ioworker_rand(gctx)>>11)+1)*(1.0/(1ULL<<53));
+
+  if (args->arrival == IOWORKER_ARRIVAL_POISSON)
+  {
+    // exponential inter-arrival time
+    interval *= -log(u);
+  }
+  else if (args->arrival == IOWORKER_ARRIVAL_JITTER)
+  {
+    // uniform inter-arrival time in the jitter range of the mean
+    interval *= 1.0+(2*u-1)*args->jitter/100.0;
+  }
+
+  // keep the fraction of ns to get the accurate mean rate
+  gctx->io_due_time_frac += interval;
+  gctx->io_due_time += (uint64_t)gctx->io_due_time_frac;
+  gctx->io_due_time_frac -= (uint64_t)gctx->io_due_time_frac;
+  return gctx->io_due_time;
+}
+
+
 static void ioworker_iosize_init(struct ioworker_global_ctx* ctx)
 {
   unsigned int sl_index = 0;
@@ -88,21 +219,406 @@ static void ioworker_distribution_init(struct spdk_nvme_ns* ns,
   assert(lookup_index == 10000);
 }
 
+static void ioworker_permutation_pass(struct ioworker_global_ctx* gctx)
+{
+  // different order in every pass
+  for (uint32_t i=0; i<4; i++)
+  {
+    gctx->perm_keys[i] = ioworker_rand(gctx);
+  }
+  gctx->perm_index = 0;
+}
+
+static void ioworker_permutation_init(struct ioworker_global_ctx* gctx,
+                                      struct ioworker_args* args)
+{
+  uint32_t bits = 2;
+
+  // the smallest even-bits domain covering all aligned blocks, and the
+  // last partial block is truncated at the region end
+  gctx->permutation = true;
+  gctx->perm_n = MAX(ALIGN_UP(args->region_end-args->region_start,
+                              args->lba_align_max)/args->lba_align_max, 1);
+  while ((1ULL<<bits) < gctx->perm_n)
+  {
+    bits += 2;
+  }
+  gctx->perm_half_bits = bits/2;
+  ioworker_permutation_pass(gctx);
+}
+
+static uint64_t ioworker_permutation(struct ioworker_global_ctx* gctx,
+                                     uint64_t x)
+{
+  uint32_t half = gctx->perm_half_bits;
+  uint64_t mask = (1ULL<<half)-1;
+
+  // 4-round feistel network is a bijection on the domain, and cycle
+  // walking keeps the bijection on [0, perm_n)
+  do
+  {
+    uint64_t l = x >> half;
+    uint64_t r = x & mask;
+
+    for (uint32_t i=0; i<4; i++)
+    {
+      uint64_t z = r ^ gctx->perm_keys[i];
+      uint64_t t = l ^ (ioworker_rand_splitmix64(&z) & mask);
+
+      l = r;
+      r = t;
+    }
+    x = (l << half) | r;
+  } while (x >= gctx->perm_n);
+
+  return x;
+}
+
+static double ioworker_zeta(uint64_t n, double theta)
+{
+  uint64_t k = MIN(n, 1024);
+  double sum = 0;
+
+  // sum the first terms, and Euler-Maclaurin formula for the long tail
+  for (uint64_t i=1; i<=k; i++)
+  {
+    sum += pow(i, -theta);
+  }
+
+  if (n > k)
+  {
+    sum += (pow(n, 1-theta)-pow(k, 1-theta))/(1-theta);
+    sum += (pow(n, -theta)-pow(k, -theta))/2;
+    sum += theta*(pow(k, -theta-1)-pow(n, -theta-1))/12;
+  }
+
+  return sum;
+}
+
+static void ioworker_skew_init(struct ioworker_global_ctx* gctx,
+                               struct ioworker_args* args)
+{
+  uint64_t span = args->region_end-args->region_start;
+  double param = args->lba_distribution_param;
+  uint64_t space = 0;
+  uint32_t io = 0;
+
+  gctx->skew = args->lba_distribution;
+  switch (gctx->skew)
+  {
+    case IOWORKER_LBA_ZIPF:
+      // Gray's method, items are aligned blocks, hottest at region start
+      assert(param > 0 && param < 1);
+      gctx->skew_n = MAX(span/args->lba_align_max, 1);
+      gctx->zipf_theta = param;
+      gctx->zipf_alpha = 1/(1-param);
+      gctx->zipf_zetan = ioworker_zeta(gctx->skew_n, param);
+      gctx->zipf_eta = (1-pow(2.0/gctx->skew_n, 1-param)) /
+                       (1-ioworker_zeta(2, param)/gctx->zipf_zetan);
+      break;
+
+    case IOWORKER_LBA_PARETO:
+      // self-similar: 1-h of io on the first h of the region
+      assert(param > 0 && param < 0.5);
+      gctx->skew_param = log(param)/log(1-param);
+      break;
+
+    case IOWORKER_LBA_GAUSSIAN:
+      // centered in the region, sigma in the fraction of the region
+      assert(param > 0);
+      gctx->skew_param = param;
+      break;
+
+    case IOWORKER_LBA_HOTCOLD:
+      // levels of (space, io) in ppm, from region start
+      assert(args->lba_hotcold_len <= IOWORKER_HOTCOLD_LEVELS_MAX);
+      gctx->hotcold_levels = args->lba_hotcold_len;
+      gctx->hotcold_lba[0] = args->region_start;
+      for (uint32_t i=0; i<args->lba_hotcold_len; i++)
+      {
+        space += args->lba_hotcold[i*2];
+        io += args->lba_hotcold[i*2+1];
+        gctx->hotcold_lba[i+1] = args->region_start +
+                                 (unsigned __int128)span*space/1000000;
+        gctx->hotcold_io[i] = io;
+      }
+      assert(space == 1000000);
+      assert(io == 1000000);
+      break;
+
+    default:
+      gctx->skew = IOWORKER_LBA_UNIFORM;
+      break;
+  }
+}
+
+
+uint32_t latency_histogram_index(uint64_t ns)
+{
+  uint32_t msb;
+  uint32_t shift;
+
+  // the first 2^SUB_BITS buckets are linear
+  if (ns < BIT(LATENCY_HISTOGRAM_SUB_BITS))
+  {
+    return ns;
+  }
+
+  // all latency longer than the range is counted in the last bucket
+  if (ns >= BIT(LATENCY_HISTOGRAM_MAX_BITS))
+  {
+    return LATENCY_HISTOGRAM_BUCKETS-1;
+  }
+
+  // each power-of-2 range is split into 2^SUB_BITS linear sub-buckets
+  msb = 63 - __builtin_clzll(ns);
+  shift = msb - LATENCY_HISTOGRAM_SUB_BITS;
+  return (shift<<LATENCY_HISTOGRAM_SUB_BITS) + (ns>>shift);
+}
+
+uint64_t latency_histogram_value(uint32_t index)
+{
+  uint32_t shift;
+  uint64_t lower;
+
+  assert(index < LATENCY_HISTOGRAM_BUCKETS);
+
+  if (index < BIT(LATENCY_HISTOGRAM_SUB_BITS))
+  {
+    return index;
+  }
+
+  // report the middle of the sub-bucket
+  shift = (index>>LATENCY_HISTOGRAM_SUB_BITS) - 1;
+  lower = (BIT(LATENCY_HISTOGRAM_SUB_BITS) +
+           (index&(BIT(LATENCY_HISTOGRAM_SUB_BITS)-1))) << shift;
+  return lower + (BIT(shift)>>1);
+}
+
+uint64_t latency_histogram_percentile(unsigned long* histogram, double percentile)
+{
+  uint64_t total = 0;
+  uint64_t target;
+  uint64_t count = 0;
+  double target_exact;
+
+  assert(histogram != NULL);
+  assert(percentile > 0 && percentile <= 100);
 
-static inline void timeradd_usecond(struct timeval* now,
-                                    unsigned long useconds,
-                                    struct timeval* due)
+  for (uint32_t i=0; i<LATENCY_HISTOGRAM_BUCKETS; i++)
+  {
+    total += histogram[i];
+  }
+
+  if (total == 0)
+  {
+    return 0;
+  }
+
+  // the smallest latency covering the percentile of all IO
+  target_exact = total*percentile/100;
+  target = (uint64_t)target_exact;
+  if (target < target_exact)
+  {
+    target += 1;
+  }
+
+  for (uint32_t i=0; i<LATENCY_HISTOGRAM_BUCKETS; i++)
+  {
+    count += histogram[i];
+    if (count >= target)
+    {
+      return latency_histogram_value(i);
+    }
+  }
+
+  return latency_histogram_value(LATENCY_HISTOGRAM_BUCKETS-1);
+}
+
+
+static int ioworker_sequence_check(struct ioworker_global_ctx* gctx,
+                                   uint64_t start,
+                                   uint64_t end)
 {
-  struct timeval duration;
+  struct ioworker_args* args = gctx->args;
 
-  duration.tv_sec = useconds/1000000ULL;
-  duration.tv_usec = useconds%1000000ULL;
-  timeradd(now, &duration, due);
+  // records come from external tools, check them before sending
+  for (uint64_t i=start; i<end; i++)
+  {
+    ioworker_ioseq* io = &gctx->io_sequence[i];
+
+    // flush has no lba
+    if ((io->nlba == 0 && io->op != 0) || io->nlba > args->lba_size_max ||
+        io->slba >= args->region_end ||
+        io->nlba > args->region_end-io->slba)
+    {
+      SPDK_WARNLOG("invalid io %ld in sequence: lba 0x%lx, count %d\n",
+                   i, io->slba, io->nlba);
+      return -1;
+    }
+  }
+
+  return 0;
+}
+
+
+static int ioworker_sequence_window(struct ioworker_global_ctx* gctx,
+                                    uint64_t index)
+{
+  // double buffer of the mapped trace: read ahead the next window,
+  // and release the previous one, so only 2 windows are resident
+  uint8_t* map = gctx->io_sequence_map;
+  uint64_t window = IOWORKER_SEQUENCE_WINDOW*sizeof(ioworker_ioseq);
+  uint64_t offset = index*sizeof(ioworker_ioseq);
+
+  assert(offset%window == 0);
+  if (offset+window < gctx->io_sequence_map_size)
+  {
+    madvise(map+offset+window,
+            MIN(window, gctx->io_sequence_map_size-offset-window),
+            MADV_WILLNEED);
+  }
+  if (offset >= window)
+  {
+    madvise(map+offset-window, window, MADV_DONTNEED);
+  }
+
+  gctx->io_sequence_window = index+IOWORKER_SEQUENCE_WINDOW;
+
+  // check all records of the window when entering it
+  return ioworker_sequence_check(gctx, index,
+                                 MIN(gctx->io_sequence_window,
+                                     gctx->io_sequence_count));
 }
 
+
+static void ioworker_sequence_fini(struct ioworker_global_ctx* gctx)
+{
+  if (gctx->io_sequence_map != NULL)
+  {
+    munmap(gctx->io_sequence_map, gctx->io_sequence_map_size);
+    gctx->io_sequence_map = NULL;
+  }
+}
+
+
+static int ioworker_sequence_init(struct ioworker_global_ctx* gctx,
+                                  struct ioworker_args* args)
+{
+  int fd;
+  void* map;
+  struct stat st;
+
+  gctx->io_sequence_index = 0;
+  if (args->io_sequence_file == NULL)
+  {
+    // user given list, no window
+    gctx->io_sequence = args->io_sequence;
+    gctx->io_sequence_count = args->io_sequence_len;
+    gctx->io_sequence_window = (uint64_t)-1;
+    return ioworker_sequence_check(gctx, 0, gctx->io_sequence_count);
+  }
+
+  // map the trace file, instead of reading it to memory
+  fd = open(args->io_sequence_file, O_RDONLY);
+  if (fd < 0)
+  {
+    SPDK_WARNLOG("cannot open trace file %s\n", args->io_sequence_file);
+    return -1;
+  }
+
+  if (fstat(fd, &st) != 0 || st.st_size == 0 ||
+      st.st_size%sizeof(ioworker_ioseq) != 0)
+  {
+    SPDK_WARNLOG("invalid trace file %s\n", args->io_sequence_file);
+    close(fd);
+    return -1;
+  }
+
+  map = mmap(NULL, st.st_size, PROT_READ, MAP_SHARED, fd, 0);
+  close(fd);
+  if (map == MAP_FAILED)
+  {
+    SPDK_WARNLOG("cannot map trace file %s\n", args->io_sequence_file);
+    return -1;
+  }
+
+  madvise(map, st.st_size, MADV_SEQUENTIAL);
+  madvise(map, MIN((uint64_t)st.st_size,
+                   IOWORKER_SEQUENCE_WINDOW*sizeof(ioworker_ioseq)),
+          MADV_WILLNEED);
+  gctx->io_sequence_map = map;
+  gctx->io_sequence_map_size = st.st_size;
+  gctx->io_sequence = map;
+  gctx->io_sequence_count = st.st_size/sizeof(ioworker_ioseq);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "trace file %s, %ld io\n",
+                args->io_sequence_file, gctx->io_sequence_count);
+
+  // enter the first window
+  if (ioworker_sequence_window(gctx, 0) != 0)
+  {
+    ioworker_sequence_fini(gctx);
+    return -1;
+  }
+  return 0;
+}
+
+
+static inline int ioworker_sequence_next(struct ioworker_global_ctx* gctx,
+                                         struct ioworker_io_ctx* ctx)
+{
+  uint64_t index = gctx->io_sequence_index++;
+
+  assert(index < gctx->io_sequence_count);
+  if (index == gctx->io_sequence_window &&
+      ioworker_sequence_window(gctx, index) != 0)
+  {
+    // stop replay before the invalid window, and fail the ioworker
+    gctx->io_sequence_count = index;
+    gctx->io_sequence_invalid = true;
+    gctx->flag_finish = true;
+    return -1;
+  }
+
+  // keep the io in ctx, the window may move before it is sent
+  ctx->ios = gctx->io_sequence[index];
+  ctx->time_sent = gctx->io_sequence_start + ctx->ios.timestamp;
+  if (gctx->io_sequence_scale != 0)
+  {
+    // replay faster or slower than the trace
+    ctx->time_sent = gctx->io_sequence_start +
+                     (uint64_t)(ctx->ios.timestamp*gctx->io_sequence_scale);
+  }
+
+  return 0;
+}
+
+
+static void ioworker_update_replay(struct ioworker_args* args,
+                                   uint64_t scheduled,
+                                   uint64_t sent)
+{
+  // io waits for a free context or a qpair slot after its trace time
+  uint64_t lag = sent > scheduled ? sent-scheduled : 0;
+  struct ioworker_replay* replay = args->replay;
+
+  replay->io_count ++;
+  replay->lag_total_ns += lag;
+  if (lag/1000 > replay->lag_max_us)
+  {
+    replay->lag_max_us = lag/1000;
+  }
+
+  if (args->replay_histogram != NULL)
+  {
+    args->replay_histogram[latency_histogram_index(lag)] ++;
+  }
+}
+
+
 static bool ioworker_send_one_is_finish(struct ioworker_args* args,
                                         struct ioworker_global_ctx* c,
-                                        struct timeval* now)
+                                        uint64_t now)
 {
   if (c->io_sequence)
   {
@@ -123,45 +639,37 @@ static bool ioworker_send_one_is_finish(struct ioworker_args* args,
 
   assert(c->io_count_sent < args->io_count);
 
-  if (timercmp(now, &c->due_time, >))
+  if (now > c->due_time)
   {
-    SPDK_DEBUGLOG(SPDK_LOG_NVME, "ioworker finish, due time %ld us\n", c->due_time.tv_usec);
+    SPDK_DEBUGLOG(SPDK_LOG_NVME, "ioworker finish, due time %ld ns\n", c->due_time);
     return true;
   }
 
   return false;
 }
 
-static uint32_t ioworker_get_duration(struct timeval* start, struct timeval* now)
+static uint32_t ioworker_get_duration(uint64_t start, uint64_t now)
 {
-  struct timeval diff;
-  uint32_t msec;
-
-  if (timercmp(now, start, >))
+  if (now > start)
   {
-    timersub(now, start, &diff);
-    msec = diff.tv_sec*1000ULL;
-    return msec + (diff.tv_usec+500)/1000ULL;
+    return (now-start+500*1000ULL)/(1000*1000ULL);
   }
 
   // something wrong
-  SPDK_INFOLOG(SPDK_LOG_NVME, "%ld.%06ld\n", now->tv_sec, now->tv_usec);
-  SPDK_INFOLOG(SPDK_LOG_NVME, "%ld.%06ld\n", start->tv_sec, start->tv_usec);
+  SPDK_INFOLOG(SPDK_LOG_NVME, "%ld\n", now);
+  SPDK_INFOLOG(SPDK_LOG_NVME, "%ld\n", start);
   assert(false);
 }
 
-static uint32_t ioworker_update_rets(struct ioworker_io_ctx* ctx,
+static uint64_t ioworker_update_rets(struct ioworker_io_ctx* ctx,
                                      struct ioworker_rets* ret,
-                                     struct timeval* now)
+                                     uint64_t now)
 {
-  struct timeval diff;
-  uint32_t latency;
+  uint64_t latency = now-ctx->time_sent;
 
-  timersub(now, &ctx->time_sent, &diff);
-  latency = timeval_to_us(&diff);
-  if (latency > ret->latency_max_us)
+  if (latency/1000 > ret->latency_max_us)
   {
-    ret->latency_max_us = latency;
+    ret->latency_max_us = latency/1000;
   }
 
   if (ctx->opcode == 0x02)
@@ -176,6 +684,227 @@ static uint32_t ioworker_update_rets(struct ioworker_io_ctx* ctx,
   return latency;
 }
 
+static void ioworker_update_op_stats(struct ioworker_io_ctx* ctx,
+                                     struct ioworker_args* args,
+                                     uint32_t sector_size,
+                                     uint64_t latency)
+{
+  uint32_t op_index = ctx->op_index;
+  struct ioworker_op_stats* op;
+
+  // opcodes not listed in op_list are not counted
+  if (op_index >= args->op_num)
+  {
+    return;
+  }
+
+  op = &args->op_stats[op_index];
+  op->io_count ++;
+  op->bytes += (uint64_t)ctx->cmd.count*sector_size;
+  op->latency_total_ns += latency;
+  if (latency/1000 > op->latency_max_us)
+  {
+    op->latency_max_us = latency/1000;
+  }
+
+  if (args->op_histogram != NULL)
+  {
+    args->op_histogram[(uint64_t)op_index*LATENCY_HISTOGRAM_BUCKETS+
+                       latency_histogram_index(latency)] ++;
+  }
+}
+
+static void ioworker_publish_stats(struct ioworker_global_ctx* gctx,
+                                   struct ioworker_stats* stats,
+                                   uint64_t now)
+{
+  struct ioworker_rets* rets = gctx->rets;
+  uint64_t io_count = rets->io_count_read+rets->io_count_nonread;
+  uint64_t sequence = stats->sequence;
+
+  // seqlock: main process retries reading when the sequence is odd or changed
+  __atomic_store_n(&stats->sequence, sequence+1, __ATOMIC_RELAXED);
+  __atomic_thread_fence(__ATOMIC_RELEASE);
+
+  stats->io_count_read = rets->io_count_read;
+  stats->io_count_nonread = rets->io_count_nonread;
+  stats->bytes_read = gctx->bytes_read;
+  stats->bytes_nonread = gctx->bytes_nonread;
+  stats->mseconds = ioworker_get_duration(gctx->time_start, now);
+  stats->latency_max_us = rets->latency_max_us;
+  if (now > gctx->time_last_stats)
+  {
+    stats->iops = (io_count-gctx->io_count_last_stats)*NS_PER_S/(now-gctx->time_last_stats);
+  }
+
+  // publish the histogram of the last second, and restart collecting
+  memcpy(stats->latency_histogram, gctx->latency_histogram_sec,
+         sizeof(gctx->latency_histogram_sec));
+  memset(gctx->latency_histogram_sec, 0, sizeof(gctx->latency_histogram_sec));
+
+  __atomic_store_n(&stats->sequence, sequence+2, __ATOMIC_RELEASE);
+
+  gctx->time_last_stats = now;
+  gctx->time_next_stats = now + NS_PER_S;
+  gctx->io_count_last_stats = io_count;
+}
+
+void ioworker_stats_read(struct ioworker_stats* stats,
+                         struct ioworker_stats* snapshot)
+{
+  uint64_t sequence;
+
+  // lock-free read of the statistics published by a running ioworker
+  do
+  {
+    sequence = __atomic_load_n(&stats->sequence, __ATOMIC_ACQUIRE);
+    memcpy(snapshot, stats, sizeof(struct ioworker_stats));
+    __atomic_thread_fence(__ATOMIC_ACQUIRE);
+  } while ((sequence&1) != 0 ||
+           sequence != __atomic_load_n(&stats->sequence, __ATOMIC_RELAXED));
+}
+
+static void ioworker_target_window_restart(struct ioworker_global_ctx* gctx,
+                                           uint64_t now)
+{
+  gctx->target_window_start = now;
+  gctx->target_window_io = 0;
+  memset(gctx->target_histogram, 0, sizeof(gctx->target_histogram));
+}
+
+static void ioworker_target_adjust(struct ioworker_global_ctx* gctx,
+                                   uint64_t now)
+{
+  struct ioworker_args* args = gctx->args;
+  struct ioworker_target* target = args->target;
+  uint64_t elapsed = now-gctx->target_window_start;
+  uint32_t target_iops = gctx->target_iops;
+  uint64_t latency;
+  uint32_t iops;
+
+  // collect enough io in the window for the percentile, but at most 1 second
+  if (elapsed < IOWORKER_TARGET_WINDOW_NS ||
+      (gctx->target_window_io < gctx->target_window_min_io && elapsed < NS_PER_S))
+  {
+    return;
+  }
+
+  if (gctx->target_window_io == 0)
+  {
+    ioworker_target_window_restart(gctx, now);
+    return;
+  }
+
+  latency = latency_histogram_percentile(gctx->target_histogram,
+                                         target->percentile);
+  iops = gctx->target_window_io*NS_PER_S/elapsed;
+  target->windows ++;
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "target window: qdepth %d, rate %d, iops %d, latency %ldns\n",
+                gctx->qdepth_limit, gctx->target_iops, iops, latency);
+
+  if (latency <= target->latency_us*1000ULL)
+  {
+    // keep the operating point of the highest iops under the target
+    if (iops > target->iops)
+    {
+      target->iops = iops;
+      target->qdepth = gctx->qdepth_limit;
+      target->percentile_latency_us = latency/1000;
+    }
+
+    if (target_iops != 0)
+    {
+      // additive increase of the rate, till it does not limit the io
+      target_iops += MAX(target_iops/20, 1);
+      if (target_iops > iops+iops/4)
+      {
+        target_iops = 0;
+      }
+    }
+    else if (gctx->qdepth_limit < gctx->qdepth_max)
+    {
+      // slow start doubles the queue depth, and then additive increase
+      if (gctx->target_slow_start)
+      {
+        gctx->qdepth_limit = MIN(gctx->qdepth_limit*2, gctx->qdepth_max);
+      }
+      else
+      {
+        gctx->qdepth_limit ++;
+      }
+    }
+  }
+  else
+  {
+    // multiplicative decrease of the queue depth, and then the rate
+    gctx->target_slow_start = false;
+    if (gctx->qdepth_limit > 1)
+    {
+      gctx->qdepth_limit = MAX(gctx->qdepth_limit*3/4, 1);
+    }
+    else
+    {
+      target_iops = MAX((target_iops ? target_iops : iops)/4*3,
+                        IOWORKER_TARGET_IOPS_MIN);
+    }
+  }
+
+  if (target_iops != gctx->target_iops)
+  {
+    gctx->target_iops = target_iops;
+    ioworker_limiter_init(&gctx->iops_limiter, target_iops,
+                          args->rate_burst, now);
+  }
+
+  ioworker_target_window_restart(gctx, now);
+}
+
+static void ioworker_sweep_start(struct ioworker_global_ctx* gctx,
+                                 uint32_t index,
+                                 uint64_t now)
+{
+  struct ioworker_args* args = gctx->args;
+  struct ioworker_sweep* step = &args->sweep[index];
+
+  assert(index < args->sweep_len);
+
+  // apply queue depth and io size of the step
+  gctx->sweep_index = index;
+  gctx->qdepth_limit = MIN(step->qdepth, gctx->qdepth_max);
+  for (uint32_t i=0; i<args->lba_size_list_len; i++)
+  {
+    if (args->lba_size_list[i] == step->io_size)
+    {
+      gctx->sweep_size_index = i;
+    }
+  }
+  gctx->sweep_start = now;
+  gctx->sweep_next = now + args->sweep_dwell_ms*1000*1000ULL;
+}
+
+static void ioworker_sweep_next(struct ioworker_global_ctx* gctx,
+                                uint64_t now)
+{
+  struct ioworker_args* args = gctx->args;
+  uint32_t index = gctx->sweep_index;
+
+  args->sweep[index].mseconds = ioworker_get_duration(gctx->sweep_start, now);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "sweep step %d: qdepth %d, io_size %d, io %ld\n",
+                index, args->sweep[index].qdepth, args->sweep[index].io_size,
+                args->sweep[index].io_count);
+
+  if (index+1 < args->sweep_len)
+  {
+    ioworker_sweep_start(gctx, index+1, now);
+  }
+  else
+  {
+    // all steps are done, io in flight is counted in the last step
+    gctx->sweep_next = (uint64_t)-1;
+    gctx->flag_finish = true;
+  }
+}
+
 static inline void ioworker_update_io_count_per_second(
     struct ioworker_global_ctx* gctx,
     struct ioworker_args* args,
@@ -184,116 +913,377 @@ static inline void ioworker_update_io_count_per_second(
   uint64_t current_io_count = rets->io_count_read + rets->io_count_nonread;
 
   // update to next second
-  timeradd_usecond(&gctx->time_next_sec, 1000000ULL, &gctx->time_next_sec);
+  gctx->time_next_sec += NS_PER_S;
   args->io_counter_per_second[gctx->last_sec ++] = current_io_count - gctx->io_count_till_last_sec;
   gctx->io_count_till_last_sec = current_io_count;
 }
 
+static void* ioworker_verify_thread(void* arg)
+{
+  struct ioworker_verify* v = (struct ioworker_verify*)arg;
+  struct ioworker_io_ctx* ctx;
+
+  pthread_mutex_lock(&v->lock);
+  while (true)
+  {
+    while (!v->exit && v->todo_head == v->todo_tail)
+    {
+      pthread_cond_wait(&v->cond, &v->lock);
+    }
+
+    if (v->todo_head == v->todo_tail)
+    {
+      // exit after all io are verified
+      break;
+    }
+
+    ctx = v->todo[v->todo_head];
+    v->todo_head = (v->todo_head+1)%v->size;
+    pthread_mutex_unlock(&v->lock);
+
+    // check crc of read data out of the lock
+    ctx->verify_error = ns_verify_read(v->ns, ctx->data_buf,
+                                       ctx->cmd.lba, ctx->cmd.count);
+
+    pthread_mutex_lock(&v->lock);
+    v->done[v->done_tail] = ctx;
+    __atomic_store_n(&v->done_tail, (v->done_tail+1)%v->size, __ATOMIC_RELEASE);
+  }
+  pthread_mutex_unlock(&v->lock);
+
+  return NULL;
+}
+
+
+static struct ioworker_verify* ioworker_verify_init(struct spdk_nvme_ns* ns,
+                                                    uint32_t thread_count,
+                                                    uint32_t io_count)
+{
+  cpu_set_t cpuset;
+  pthread_attr_t attr;
+  int cpu = sched_getcpu();
+  struct ioworker_verify* v = calloc(1, sizeof(struct ioworker_verify));
+
+  if (v == NULL)
+  {
+    return NULL;
+  }
+
+  v->ns = ns;
+  v->size = io_count+1;
+  v->todo = calloc(v->size, sizeof(struct ioworker_io_ctx*));
+  v->done = calloc(v->size, sizeof(struct ioworker_io_ctx*));
+  if (v->todo == NULL || v->done == NULL)
+  {
+    free(v->todo);
+    free(v->done);
+    free(v);
+    return NULL;
+  }
+  pthread_mutex_init(&v->lock, NULL);
+  pthread_cond_init(&v->cond, NULL);
+
+  // threads inherit the core of the ioworker, so move them to other cores
+  CPU_ZERO(&cpuset);
+  for (int i=0; i<get_nprocs(); i++)
+  {
+    if (i != cpu)
+    {
+      CPU_SET(i, &cpuset);
+    }
+  }
+  pthread_attr_init(&attr);
+  if (CPU_COUNT(&cpuset) != 0)
+  {
+    pthread_attr_setaffinity_np(&attr, sizeof(cpuset), &cpuset);
+  }
+
+  thread_count = MIN(thread_count, IOWORKER_VERIFY_THREADS_MAX);
+  for (uint32_t i=0; i<thread_count; i++)
+  {
+    if (pthread_create(&v->threads[i], &attr, ioworker_verify_thread, v) != 0)
+    {
+      break;
+    }
+    v->thread_count ++;
+  }
+  pthread_attr_destroy(&attr);
+
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "verify threads %d, cpu %d\n", v->thread_count, cpu);
+  return v;
+}
+
+
+static void ioworker_verify_fini(struct ioworker_verify* v)
+{
+  pthread_mutex_lock(&v->lock);
+  v->exit = true;
+  pthread_cond_broadcast(&v->cond);
+  pthread_mutex_unlock(&v->lock);
+
+  for (uint32_t i=0; i<v->thread_count; i++)
+  {
+    pthread_join(v->threads[i], NULL);
+  }
+
+  // unlock the read io verified but not finished, e.g. ioworker aborted
+  while (v->done_head != v->done_tail)
+  {
+    struct ioworker_io_ctx* ctx = v->done[v->done_head];
+
+    ns_verify_unlock(v->ns, ctx->cmd.lba, ctx->cmd.count);
+    v->done_head = (v->done_head+1)%v->size;
+  }
+
+  pthread_mutex_destroy(&v->lock);
+  pthread_cond_destroy(&v->cond);
+  free(v->todo);
+  free(v->done);
+  free(v);
+}
+
+
+static void ioworker_verify_submit(struct ioworker_verify* v,
+                                   struct ioworker_io_ctx* ctx)
+{
+  pthread_mutex_lock(&v->lock);
+  assert((v->todo_tail+1)%v->size != v->todo_head);
+  v->todo[v->todo_tail] = ctx;
+  v->todo_tail = (v->todo_tail+1)%v->size;
+  pthread_cond_signal(&v->cond);
+  pthread_mutex_unlock(&v->lock);
+}
+
+
+static struct ioworker_io_ctx* ioworker_verify_next(struct ioworker_verify* v)
+{
+  struct ioworker_io_ctx* ctx;
+
+  // check without the lock, only the ioworker consumes the done ring
+  if (__atomic_load_n(&v->done_tail, __ATOMIC_ACQUIRE) == v->done_head)
+  {
+    return NULL;
+  }
+
+  pthread_mutex_lock(&v->lock);
+  ctx = v->done[v->done_head];
+  v->done_head = (v->done_head+1)%v->size;
+  pthread_mutex_unlock(&v->lock);
+
+  return ctx;
+}
+
+
+static void ioworker_one_done(struct ioworker_io_ctx* ctx,
+                              uint16_t error,
+                              uint64_t now)
+{
+  struct ioworker_global_ctx* gctx = ctx->gctx;
+  struct ioworker_args* args = gctx->args;
+  struct ioworker_qpair_ctx* qctx = ctx->qctx;
+  struct ioworker_rets* rets = gctx->rets;
+
+  gctx->io_count_cplt ++;
+
+  // check status
+  if (error != 0)
+  {
+    // terminate ioworker when any error happen
+    // only keep the first error code
+    SPDK_ERRLOG("ioworker error happen in cpl, error 0x%04x\n", error);
+    gctx->flag_finish = true;
+    if (rets->error == 0)
+    {
+      rets->error = error;
+    }
+    if (qctx->rets != NULL && qctx->rets->error == 0)
+    {
+      qctx->rets->error = error;
+    }
+  }
+
+  // update io counter per second when required
+  if (args->io_counter_per_second != NULL)
+  {
+    if (now > gctx->time_next_sec)
+    {
+      ioworker_update_io_count_per_second(gctx, args, rets);
+    }
+  }
+
+  // check if all io are sent
+  if (gctx->flag_finish != true)
+  {
+    //update finish flag
+    gctx->flag_finish = ioworker_send_one_is_finish(args, gctx, now);
+  }
+
+  if (gctx->flag_finish != true)
+  {
+    STAILQ_INSERT_TAIL(&qctx->pending_io_list, ctx, next);
+    gctx->io_count_sent ++;
+  }
+
+  if (args->cmdlog_list_len != 0)
+  {
+    // find the location of ioworker_cmdlog to update
+    unsigned int cmdlog_index = gctx->current_cmdlog_index++;
+    if (cmdlog_index == args->cmdlog_list_len)
+    {
+      // wrap to the beginning
+      cmdlog_index = 0;
+      gctx->current_cmdlog_index = 1;
+    }
+
+    // update command information to ioworker_cmdlog
+    struct ioworker_cmdlog* cmd = &args->cmdlog_list[cmdlog_index];
+    memcpy(cmd, &ctx->cmd, sizeof(ctx->cmd));
+  }
+}
+
+
+static void ioworker_verify_poll(struct ioworker_global_ctx* gctx, uint64_t now)
+{
+  struct ioworker_io_ctx* ctx;
+
+  // finish io verified by helper threads
+  while ((ctx = ioworker_verify_next(gctx->verify)) != NULL)
+  {
+    uint16_t error = 0;
+
+    // other io can access these lba after the data is verified
+    ns_verify_unlock(gctx->verify->ns, ctx->cmd.lba, ctx->cmd.count);
+    if (ctx->verify_error != 0)
+    {
+      // same as inline verify: Unrecovered Read Error
+      SPDK_WARNLOG("verify fail: lba 0x%lx, count %d, error %d\n",
+                   ctx->cmd.lba, ctx->cmd.count, ctx->verify_error);
+      error = 0x0781;
+    }
+    ioworker_one_done(ctx, error, now);
+  }
+}
+
+
 static void ioworker_one_cb(void* ctx_in, const struct spdk_nvme_cpl *cpl)
 {
-  uint32_t latency_us;
-  struct timeval now;
+  uint64_t latency_ns;
+  uint64_t now;
+  uint16_t error = 0;
   struct ioworker_io_ctx* ctx = (struct ioworker_io_ctx*)ctx_in;
   struct ioworker_args* args = ctx->gctx->args;
   struct ioworker_global_ctx* gctx = ctx->gctx;
+  struct ioworker_qpair_ctx* qctx = ctx->qctx;
   struct ioworker_rets* rets = gctx->rets;
 
-  gctx->io_count_cplt ++;
+  gctx->io_outstanding --;
 
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "sent: %ld; cplt: %ld\n",
                 gctx->io_count_sent, gctx->io_count_cplt);
 
   // update statistics in ret structure
-  timeval_gettimeofday(&now);
+  now = timestamp_ns();
   assert(rets != NULL);
-  latency_us = ioworker_update_rets(ctx, rets, &now);
-  gctx->total_latency_us += latency_us;
+  latency_ns = ioworker_update_rets(ctx, rets, now);
+  gctx->total_latency_ns += latency_ns;
+  if (qctx->rets != NULL)
+  {
+    ioworker_update_rets(ctx, qctx->rets, now);
+    qctx->total_latency_ns += latency_ns;
+  }
+
+  // update all op counter, except opcodes not listed in the plan
+  if (ctx->op_index < args->op_num)
+  {
+    args->op_counter[ctx->op_index] ++;
+  }
+
+  // update statistics of each opcode
+  if (args->op_stats != NULL)
+  {
+    ioworker_update_op_stats(ctx, args, gctx->sector_size, latency_ns);
+  }
+
+  // update io count per latency
+  if (args->io_counter_per_latency != NULL)
+  {
+    args->io_counter_per_latency[latency_histogram_index(latency_ns)] ++;
+  }
+
+  // update live statistics
+  if (args->stats != NULL)
+  {
+    if (ctx->opcode == 0x02)
+    {
+      gctx->bytes_read += (uint64_t)ctx->cmd.count*gctx->sector_size;
+    }
+    else
+    {
+      gctx->bytes_nonread += (uint64_t)ctx->cmd.count*gctx->sector_size;
+    }
+    gctx->latency_histogram_sec[latency_histogram_index(latency_ns)] ++;
+  }
 
-  // update all op counter
-  args->op_counter[ctx->op_index] ++;
+  // collect statistics of current sweep step
+  if (args->sweep != NULL)
+  {
+    uint32_t index = gctx->sweep_index;
+    struct ioworker_sweep* step = &args->sweep[index];
+
+    step->io_count ++;
+    step->bytes += (uint64_t)ctx->cmd.count*gctx->sector_size;
+    step->latency_total_ns += latency_ns;
+    args->sweep_histogram[(uint64_t)index*LATENCY_HISTOGRAM_BUCKETS+
+                          latency_histogram_index(latency_ns)] ++;
+  }
 
-  // update io count per latency
-  if (args->io_counter_per_latency != NULL)
+  // collect latency for the latency target controller
+  if (args->target != NULL)
   {
-    args->io_counter_per_latency[MIN(US_PER_S-1, latency_us)] ++;
+    gctx->target_histogram[latency_histogram_index(latency_ns)] ++;
+    gctx->target_window_io ++;
   }
 
   if (gctx->io_sequence)
   {
     // replay next io
-    uint32_t ios_index = gctx->io_sequence_index;
-
-    if (ios_index < gctx->io_sequence_count)
+    if (gctx->io_sequence_index < gctx->io_sequence_count)
     {
-      timeradd_usecond(&gctx->io_sequence_start,
-                       gctx->io_sequence[ios_index].timestamp,
-                       &ctx->time_sent);
-      ctx->io_sequence_index = ios_index;
-      gctx->io_sequence_index ++;
+      ioworker_sequence_next(gctx, ctx);
     }
   }
-  else if (gctx->io_delay_time.tv_usec != 0)
+  else if (gctx->arrival_interval != 0)
   {
-    // throttle IOPS by setting delay time and insert to pending list
-    timeradd(&gctx->io_due_time, &gctx->io_delay_time, &gctx->io_due_time);
-    ctx->time_sent = gctx->io_due_time;
+    // schedule the next arrival and insert to pending list
+    ctx->time_sent = ioworker_arrival_next(gctx);
   }
 
   // check status
-  if (true == nvme_cpl_is_error(cpl))
+  if (gctx->verify != NULL && ctx->opcode == 0x02)
   {
-    // terminate ioworker when any error happen
-    // only keep the first error code
-    uint16_t error = ((*(unsigned short*)(&cpl->status))>>1)&0x7ff;
-    SPDK_ERRLOG("ioworker error happen in cpl, error 0x%04x\n", error);
-    gctx->flag_finish = true;
-    if (rets->error == 0)
+    // the lba range of read is kept locked until its data is verified,
+    // so no write can change the data and crc in the meantime
+    if (true == nvme_cpl_is_error(cpl))
     {
-      rets->error = error;
+      ns_verify_unlock(gctx->verify->ns, ctx->cmd.lba, ctx->cmd.count);
     }
-  }
-
-  // update io counter per second when required
-  if (args->io_counter_per_second != NULL)
-  {
-    if (timercmp(&now, &gctx->time_next_sec, >))
+    else
     {
-      ioworker_update_io_count_per_second(gctx, args, rets);
+      // verify read data in helper threads, and finish the io later
+      ioworker_verify_submit(gctx->verify, ctx);
+      return;
     }
   }
 
-  // check if all io are sent
-  if (gctx->flag_finish != true)
-  {
-    //update finish flag
-    struct timeval now;
-    timeval_gettimeofday(&now);
-    gctx->flag_finish = ioworker_send_one_is_finish(args, gctx, &now);
-  }
-
-  if (gctx->flag_finish != true)
+  if (true == nvme_cpl_is_error(cpl))
   {
-    STAILQ_INSERT_TAIL(&gctx->pending_io_list, ctx, next);
-    gctx->io_count_sent ++;
+    error = ((*(unsigned short*)(&cpl->status))>>1)&0x7ff;
   }
 
-  if (args->cmdlog_list_len != 0)
-  {
-    // find the location of ioworker_cmdlog to update
-    unsigned int cmdlog_index = gctx->current_cmdlog_index++;
-    if (cmdlog_index == args->cmdlog_list_len)
-    {
-      // wrap to the beginning
-      cmdlog_index = 0;
-      gctx->current_cmdlog_index = 1;
-    }
-
-    // update command information to ioworker_cmdlog
-    struct ioworker_cmdlog* cmd = &args->cmdlog_list[cmdlog_index];
-    memcpy(cmd, &ctx->cmd, sizeof(ctx->cmd));
-  }
+  ioworker_one_done(ctx, error, now);
 }
 
+
 static inline uint64_t ioworker_send_one_lba_sequential(struct ioworker_args* args,
                                                         struct ioworker_global_ctx* gctx)
 {
@@ -311,16 +1301,107 @@ static inline uint64_t ioworker_send_one_lba_sequential(struct ioworker_args* ar
   return ret;
 }
 
+static inline double ioworker_rand_double(struct ioworker_global_ctx* gctx)
+{
+  // uniform random number in [0, 1)
+  return (ioworker_rand(gctx)>>11)*(1.0/(1ULL<<53));
+}
+
+static uint64_t ioworker_send_one_lba_skew(struct ioworker_args* args,
+                                           struct ioworker_global_ctx* gctx)
+{
+  uint64_t start = args->region_start;
+  uint64_t span = args->region_end-args->region_start;
+  double x = 0;
+
+  switch (gctx->skew)
+  {
+    case IOWORKER_LBA_ZIPF:
+      {
+        double u = ioworker_rand_double(gctx);
+        double uz = u*gctx->zipf_zetan;
+        uint64_t rank;
+
+        if (uz < 1)
+        {
+          rank = 0;
+        }
+        else if (uz < 1+pow(0.5, gctx->zipf_theta))
+        {
+          rank = 1;
+        }
+        else
+        {
+          rank = gctx->skew_n*pow(gctx->zipf_eta*u-gctx->zipf_eta+1,
+                                  gctx->zipf_alpha);
+        }
+        return start + MIN(rank, gctx->skew_n-1)*args->lba_align_max;
+      }
+
+    case IOWORKER_LBA_PARETO:
+      x = pow(ioworker_rand_double(gctx), gctx->skew_param);
+      break;
+
+    case IOWORKER_LBA_GAUSSIAN:
+      // Box-Muller, and regenerate the lba out of the region
+      do
+      {
+        double r = sqrt(-2*log(1-ioworker_rand_double(gctx)));
+        x = 0.5+gctx->skew_param*r*cos(2*M_PI*ioworker_rand_double(gctx));
+      } while (x < 0 || x >= 1);
+      break;
+
+    case IOWORKER_LBA_HOTCOLD:
+      {
+        uint32_t r = ioworker_rand_range(gctx, 1000000);
+        uint32_t i = 0;
+
+        while (r >= gctx->hotcold_io[i])
+        {
+          i ++;
+        }
+        assert(i < gctx->hotcold_levels);
+
+        start = gctx->hotcold_lba[i];
+        span = gctx->hotcold_lba[i+1]-start;
+        return start + (span ? ioworker_rand_range(gctx, span) : 0);
+      }
+
+    default:
+      assert(false);
+      break;
+  }
+
+  return start + MIN((uint64_t)(x*span), span-1);
+}
+
 static inline uint64_t ioworker_send_one_lba_random(struct ioworker_args* args,
                                                     struct ioworker_global_ctx* gctx)
 {
   uint64_t start;
   uint64_t end;
 
+  // visit every aligned block once in a pass
+  if (gctx->permutation)
+  {
+    if (gctx->perm_index == gctx->perm_n)
+    {
+      ioworker_permutation_pass(gctx);
+    }
+    return args->region_start +
+           ioworker_permutation(gctx, gctx->perm_index++)*args->lba_align_max;
+  }
+
+  // skewed distribution in the region
+  if (gctx->skew != IOWORKER_LBA_UNIFORM)
+  {
+    return ioworker_send_one_lba_skew(args, gctx);
+  }
+
   // for distributed IO, pick up a random section first
   if (gctx->distribution)
   {
-    uint32_t index = random()%10000;
+    uint32_t index = ioworker_rand_range(gctx, 10000);
     start = gctx->dl_table[index].lba_start;
     end = gctx->dl_table[index].lba_end;
   }
@@ -338,7 +1419,7 @@ static inline uint64_t ioworker_send_one_lba_random(struct ioworker_args* args,
   else
   {
     assert(end>start);
-    return (random()%(end-start)) + start;
+    return ioworker_rand_range(gctx, end-start) + start;
   }
 }
 
@@ -347,8 +1428,19 @@ static inline uint32_t ioworker_send_one_size(struct ioworker_args* args,
                                               struct ioworker_global_ctx* gctx,
                                               uint16_t* lba_align)
 {
-  uint32_t si = gctx->sl_table[random()%args->lba_size_ratio_sum];
-  uint32_t ret = args->lba_size_list[si];
+  uint32_t si;
+  uint32_t ret;
+
+  if (args->sweep != NULL)
+  {
+    // io size of current sweep step
+    si = gctx->sweep_size_index;
+  }
+  else
+  {
+    si = gctx->sl_table[ioworker_rand_range(gctx, args->lba_size_ratio_sum)];
+  }
+  ret = args->lba_size_list[si];
 
   *lba_align = args->lba_size_list_align[si];
   return ret;
@@ -362,7 +1454,9 @@ static inline uint64_t ioworker_send_one_lba(struct spdk_nvme_ns* ns,
                                              uint16_t lba_count)
 {
   uint64_t ret;
-  bool is_random = (random()%100) < args->lba_random;
+  bool is_random = (args->lba_random == 100) ||
+                   (args->lba_random != 0 &&
+                    ioworker_rand_range(gctx, 100) < args->lba_random);
 
   if (is_random == false)
   {
@@ -403,41 +1497,141 @@ static inline uint64_t ioworker_send_one_lba(struct spdk_nvme_ns* ns,
 }
 
 
+static inline void ioworker_plan_one(struct spdk_nvme_ns* ns,
+                                     struct ioworker_args* args,
+                                     struct ioworker_global_ctx* gctx,
+                                     struct ioworker_plan* io)
+{
+  uint16_t lba_align;
+
+  io->op = args->op_list[gctx->op_table[ioworker_rand_range(gctx, 100)]];
+  io->nlba = ioworker_send_one_size(args, gctx, &lba_align);
+
+  // skip uncorrrectable lba
+  io->slba = ioworker_send_one_lba(ns, args, gctx, lba_align, io->nlba);
+}
+
+
+static inline struct ioworker_plan* ioworker_plan_next(struct spdk_nvme_ns* ns,
+                                                      struct ioworker_global_ctx* gctx)
+{
+  if (gctx->io_plan_index == gctx->io_plan_len)
+  {
+    gctx->io_plan_index = 0;
+
+    // generate next batch of io, or repeat the user given plan
+    if (gctx->io_plan_generate)
+    {
+      for (uint64_t i=0; i<gctx->io_plan_len; i++)
+      {
+        ioworker_plan_one(ns, gctx->args, gctx, &gctx->io_plan[i]);
+      }
+    }
+  }
+
+  return &gctx->io_plan[gctx->io_plan_index++];
+}
+
+
+static int ioworker_plan_init(struct ioworker_global_ctx* gctx,
+                              struct ioworker_args* args)
+{
+  // opcode => index of the op counter
+  memset(gctx->op_index_table, args->op_num, sizeof(gctx->op_index_table));
+  for (uint32_t i=0; i<args->op_num; i++)
+  {
+    gctx->op_index_table[args->op_list[i]&0xff] = i;
+  }
+
+  if (args->io_plan != NULL)
+  {
+    // user given plan: check all io in advance, not in submit path
+    for (uint64_t i=0; i<args->io_plan_len; i++)
+    {
+      struct ioworker_plan* io = &args->io_plan[i];
+
+      if (io->nlba == 0 || io->nlba > args->lba_size_max ||
+          io->slba >= args->region_end ||
+          io->nlba > args->region_end-io->slba)
+      {
+        SPDK_WARNLOG("invalid io %ld in plan: lba 0x%lx, count %d\n",
+                     i, io->slba, io->nlba);
+        return -1;
+      }
+    }
+
+    gctx->io_plan = args->io_plan;
+    gctx->io_plan_len = args->io_plan_len;
+    gctx->io_plan_generate = false;
+  }
+  else if (args->io_plan_batch != 0)
+  {
+    // generate io in batch
+    gctx->io_plan = malloc(sizeof(struct ioworker_plan)*args->io_plan_batch);
+    if (gctx->io_plan == NULL)
+    {
+      return -1;
+    }
+    gctx->io_plan_len = args->io_plan_batch;
+    gctx->io_plan_generate = true;
+  }
+
+  // generate or use the plan at the first io
+  gctx->io_plan_index = gctx->io_plan_len;
+  return 0;
+}
+
+
 static int ioworker_send_one(struct spdk_nvme_ns* ns,
                              struct spdk_nvme_qpair *qpair,
                              struct ioworker_io_ctx* ctx,
                              struct ioworker_global_ctx* gctx)
 {
   int ret;
-  uint16_t lba_align;
   void* buf;
   uint64_t lba_starting;
+  uint32_t lba_count;
+  uint32_t op_list_index;
+  uint8_t opcode;
   struct ioworker_args* args = gctx->args;
-  uint32_t op_list_index = gctx->op_table[random()%100];
-  uint32_t lba_count = ioworker_send_one_size(args, gctx, &lba_align);
-  uint32_t sector_size = spdk_nvme_ns_get_sector_size(ns);
-  uint8_t opcode = args->op_list[op_list_index];
+  uint32_t sector_size = gctx->sector_size;
+  uint64_t scheduled = ctx->time_sent;
 
-  // skip uncorrrectable lba
-  lba_starting = ioworker_send_one_lba(ns, args, gctx, lba_align, lba_count);
-
-  // replay io sequence
   if (gctx->io_sequence)
   {
-    uint32_t ios_index = ctx->io_sequence_index;
-
+    // replay io sequence
     op_list_index = 0;
-    opcode = gctx->io_sequence[ios_index].op;
-    lba_count = gctx->io_sequence[ios_index].nlba;
-    lba_starting = gctx->io_sequence[ios_index].slba;
-    SPDK_DEBUGLOG(SPDK_LOG_NVME, "one io: index %d, lba %lu, count %d, opcode %d\n",
-                  ios_index,  lba_starting, lba_count, opcode);
+    opcode = ctx->ios.op;
+    lba_count = ctx->ios.nlba;
+    lba_starting = ctx->ios.slba;
+    SPDK_DEBUGLOG(SPDK_LOG_NVME, "one io: time %lu, lba %lu, count %d, opcode %d\n",
+                  ctx->ios.timestamp,  lba_starting, lba_count, opcode);
+  }
+  else
+  {
+    struct ioworker_plan one;
+    struct ioworker_plan* io = &one;
+
+    if (gctx->io_plan != NULL)
+    {
+      // lookup the pre-generated plan
+      io = ioworker_plan_next(ns, gctx);
+    }
+    else
+    {
+      ioworker_plan_one(ns, args, gctx, io);
+    }
+
+    opcode = io->op;
+    lba_count = io->nlba;
+    lba_starting = io->slba;
+    op_list_index = gctx->op_index_table[opcode];
   }
 
   // trancate the tail out of the region
   lba_count = MIN(lba_count, args->region_end-lba_starting);
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "one io: ctx %p, lba 0x%lx, count %d, align %d, opcode %d\n",
-                ctx, lba_starting, lba_count, lba_align, opcode);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "one io: ctx %p, lba 0x%lx, count %d, opcode %d\n",
+                ctx, lba_starting, lba_count, opcode);
 
   assert(ctx->data_buf != NULL);
   assert(ctx->write_buf != NULL);
@@ -466,25 +1660,110 @@ static int ioworker_send_one(struct spdk_nvme_ns* ns,
   //sent one io cmd successfully
   ctx->opcode = opcode;
   ctx->op_index = op_list_index;
-  timeval_gettimeofday(&ctx->time_sent);
+  ctx->time_sent = timestamp_ns();
+  gctx->io_outstanding ++;
+  if (gctx->io_sequence && args->replay != NULL)
+  {
+    ioworker_update_replay(args, scheduled, ctx->time_sent);
+  }
+
+  // consume tokens of rate limiters
+  ioworker_limiter_charge(&gctx->iops_limiter, 1, ctx->time_sent);
+  ioworker_limiter_charge(&gctx->bw_limiter,
+                          (uint64_t)lba_count*sector_size,
+                          ctx->time_sent);
   return 0;
 }
 
 
-static void ioworker_add_cpu_time(struct timeval* start, struct timeval* cpu_time)
+static inline void ioworker_add_cpu_time(uint64_t start, uint64_t* cpu_time)
 {
-  struct timeval now = {0, 0};
-  struct timeval diff = {0, 0};
-
   // collect cpu time for utilization rate
-  timeval_gettimeofday(&now);
-  timersub(&now, start, &diff);
-  timeradd(&diff, cpu_time, cpu_time);
+  *cpu_time += timestamp_ns()-start;
+}
+
+
+static uint64_t ioworker_poll_qpair(struct spdk_nvme_ns* ns,
+                                    struct ioworker_qpair_ctx* qctx,
+                                    struct ioworker_global_ctx* gctx,
+                                    uint64_t* cpu_time)
+{
+  uint64_t now;
+  uint32_t burst = 0;
+  struct spdk_nvme_qpair* qpair = qctx->qpair;
+  struct ioworker_io_ctx* head_io = STAILQ_FIRST(&qctx->pending_io_list);
+
+  // check time and send all due pending io, up to burst_max in one burst.
+  // In burst mode, the doorbell is rung once when polling completions.
+  // Weighted qpairs also consume the credits of current round.
+  now = timestamp_ns();
+  while (head_io && now > head_io->time_sent && burst < gctx->burst_max &&
+         (qctx->weight == 0 || qctx->credit != 0) &&
+         gctx->io_outstanding < gctx->qdepth_limit &&
+         ioworker_limiter_ready(&gctx->iops_limiter, now) &&
+         ioworker_limiter_ready(&gctx->bw_limiter, now))
+  {
+    STAILQ_REMOVE_HEAD(&qctx->pending_io_list, next);
+    ioworker_send_one(ns, qpair, head_io, gctx);
+    head_io = STAILQ_FIRST(&qctx->pending_io_list);
+    burst ++;
+    if (qctx->weight != 0)
+    {
+      qctx->credit --;
+    }
+  }
+  if (burst != 0)
+  {
+    ioworker_add_cpu_time(now, cpu_time);
+  }
+
+  // collect all completions
+  now = timestamp_ns();
+  if (spdk_nvme_qpair_process_completions(qpair, 0) > 0)
+  {
+    // valid process, add cpu time
+    ioworker_add_cpu_time(now, cpu_time);
+  }
+
+  // retry one queued request for LBA confliction
+  if (!STAILQ_EMPTY(&qpair->queued_req))
+  {
+    struct nvme_request *req = STAILQ_FIRST(&qpair->queued_req);
+    STAILQ_REMOVE_HEAD(&qpair->queued_req, stailq);
+    nvme_qpair_submit_request(qpair, req);
+  }
+
+  return now;
+}
+
+
+static void ioworker_weight_refill(struct ioworker_qpair_ctx* qpair_ctx,
+                                   uint32_t qcount,
+                                   uint32_t burst_max,
+                                   uint64_t now)
+{
+  // weighted round robin: the round is over when every qpair has used up
+  // its credits, or has no due IO to send. Then each qpair can send
+  // weight*burst_max IOs in the next round.
+  for (unsigned int i=0; i<qcount; i++)
+  {
+    struct ioworker_io_ctx* head_io = STAILQ_FIRST(&qpair_ctx[i].pending_io_list);
+
+    if (qpair_ctx[i].credit != 0 && head_io && now > head_io->time_sent)
+    {
+      return;
+    }
+  }
+
+  for (unsigned int i=0; i<qcount; i++)
+  {
+    qpair_ctx[i].credit = qpair_ctx[i].weight*burst_max;
+  }
 }
 
 
 int ioworker_entry(struct spdk_nvme_ns* ns,
-                   struct spdk_nvme_qpair *qpair,
+                   struct spdk_nvme_qpair** qpair_list,
                    struct ioworker_args* args,
                    struct ioworker_rets* rets)
 {
@@ -492,16 +1771,19 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   uint64_t nsze = spdk_nvme_ns_get_num_sectors(ns);
   uint32_t sector_size = spdk_nvme_ns_get_sector_size(ns);
   uint32_t max_xfer_size = spdk_nvme_ns_get_max_io_xfer_size(ns);
-  struct ioworker_io_ctx* io_ctx = malloc(sizeof(struct ioworker_io_ctx)*args->qdepth);
+  uint32_t qcount = args->qcount ? args->qcount : 1;
+  struct ioworker_io_ctx* io_ctx = malloc(sizeof(struct ioworker_io_ctx)*args->qdepth*qcount);
+  struct ioworker_qpair_ctx* qpair_ctx = calloc(qcount, sizeof(struct ioworker_qpair_ctx));
   struct ioworker_global_ctx gctx;
-  struct timeval test_start;
+  uint64_t test_start;
   uint64_t seconds;
 
   assert(ns != NULL);
-  assert(qpair != NULL);
+  assert(qpair_list != NULL);
   assert(args != NULL);
   assert(rets != NULL);
   assert(io_ctx != NULL);
+  assert(qpair_ctx != NULL);
 
   //init rets
   rets->io_count_read = 0;
@@ -526,9 +1808,23 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.pvalue = %d\n", args->pvalue);
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.ptype = %d\n", args->ptype);
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.io_sequence = %p\n", args->io_sequence);
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.io_sequence_len = %d\n", args->io_sequence_len);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.io_sequence_len = %ld\n", args->io_sequence_len);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.io_sequence_file = %s\n", args->io_sequence_file);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.replay_speed = %f\n", args->replay_speed);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.verify_threads = %d\n", args->verify_threads);
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.cmdlog_list = %p\n", args->cmdlog_list);
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.cmdlog_list_len = %d\n", args->cmdlog_list_len);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.qcount = %d\n", args->qcount);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.burst_max = %d\n", args->burst_max);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.bandwidth = %ld\n", args->bandwidth);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.rate_burst = %d\n", args->rate_burst);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.arrival = %d\n", args->arrival);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.jitter = %d\n", args->jitter);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.target = %p\n", args->target);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.sweep_len = %d\n", args->sweep_len);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.op_stats = %p\n", args->op_stats);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.lba_distribution = %d\n", args->lba_distribution);
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "args.lba_permutation = %d\n", args->lba_permutation);
 
   //check args
   assert(args->lba_size_max != 0);
@@ -537,6 +1833,15 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   assert(args->cmdlog_list_len < 1024*1024);
 
   if (args->io_sequence)
+  {
+    // size the buffers by the largest io in the list
+    args->lba_size_max = 1;
+    for (unsigned long i=0; i<args->io_sequence_len; i++)
+    {
+      args->lba_size_max = MAX(args->lba_size_max, args->io_sequence[i].nlba);
+    }
+  }
+  else if (args->io_sequence_file || args->io_plan)
   {
     // io size is unknown, so set to max transfer size
     args->lba_size_max = max_xfer_size/sector_size;
@@ -547,6 +1852,7 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   {
     SPDK_WARNLOG("IO size is larger than max xfer size, %d\n", max_xfer_size);
     rets->error = 0x0002;  // Invalid Field in Command
+    free(qpair_ctx);
     free(io_ctx);
     return -2;
   }
@@ -586,7 +1892,11 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   //init global ctx
   memset(&gctx, 0, sizeof(gctx));
   gctx.ns = ns;
-  gctx.qpair = qpair;
+  gctx.qctx = qpair_ctx;
+  gctx.qcount = qcount;
+  gctx.burst_max = args->burst_max ? args->burst_max : 1;
+  // seeded by driver_srand()
+  ioworker_rand_init(&gctx, ((uint64_t)random() << 32) | random());
   gctx.sequential_lba = args->lba_start;
   gctx.io_count_sent = 0;
   gctx.io_count_cplt = 0;
@@ -594,18 +1904,57 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   gctx.args = args;
   gctx.rets = rets;
   gctx.current_cmdlog_index = 0;
-  timeval_gettimeofday(&test_start);
-  timeradd_usecond(&test_start, 1000000ULL*seconds, &gctx.due_time);
-  gctx.io_delay_time.tv_sec = 0;
-  gctx.io_delay_time.tv_usec = args->iops ? US_PER_S/args->iops : 0;
+  test_start = timestamp_ns();
+  gctx.due_time = test_start + NS_PER_S*seconds;
   gctx.io_due_time = test_start;
-  timeradd_usecond(&test_start, 1000000ULL, &gctx.time_next_sec);
+  if (args->arrival == IOWORKER_ARRIVAL_FIXED)
+  {
+    // send io at the limited rate, and allow bursts
+    ioworker_limiter_init(&gctx.iops_limiter, args->iops,
+                          args->rate_burst, test_start);
+  }
+  else
+  {
+    // schedule io by the arrival process of the mean rate
+    gctx.arrival_interval = args->iops ? (double)NS_PER_S/args->iops : 0;
+  }
+  ioworker_limiter_init(&gctx.bw_limiter, args->bandwidth,
+                        (uint64_t)args->rate_burst*args->lba_size_max*sector_size,
+                        test_start);
+  gctx.qdepth_max = args->qdepth*qcount;
+  gctx.qdepth_limit = gctx.qdepth_max;
+  if (args->sweep != NULL)
+  {
+    // start from the first step
+    assert(args->sweep_len != 0);
+    assert(args->sweep_histogram != NULL);
+    ioworker_sweep_start(&gctx, 0, test_start);
+  }
+  if (args->target != NULL)
+  {
+    // start from queue depth 1, and find the highest iops under the target
+    assert(args->target->percentile > 0 && args->target->percentile < 100);
+    gctx.qdepth_limit = 1;
+    gctx.target_slow_start = true;
+    gctx.target_window_min_io = 1000/(100-args->target->percentile);
+    ioworker_target_window_restart(&gctx, test_start);
+    args->target->qdepth = 0;
+    args->target->iops = 0;
+    args->target->percentile_latency_us = 0;
+    args->target->windows = 0;
+  }
+  gctx.time_next_sec = test_start + NS_PER_S;
   gctx.io_count_till_last_sec = 0;
   gctx.last_sec = 0;
-  gctx.io_sequence = args->io_sequence;
-  gctx.io_sequence_count = args->io_sequence_len;
-  gctx.io_sequence_index = 0;
-  timeval_gettimeofday(&gctx.io_sequence_start);
+  gctx.io_sequence_start = test_start;
+  if (args->replay_speed > 0 && args->replay_speed != 1.0)
+  {
+    gctx.io_sequence_scale = 1.0/args->replay_speed;
+  }
+  gctx.sector_size = sector_size;
+  gctx.time_start = test_start;
+  gctx.time_last_stats = test_start;
+  gctx.time_next_stats = test_start + NS_PER_S;
 
   // calculate distribution lookup table
   if (args->distribution)
@@ -614,6 +1963,13 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
     ioworker_distribution_init(ns, &gctx, args->distribution);
   }
 
+  // prepare skewed distribution of random lba
+  ioworker_skew_init(&gctx, args);
+  if (args->lba_permutation)
+  {
+    ioworker_permutation_init(&gctx, args);
+  }
+
   // calculate io_size lookup table
   ioworker_iosize_init(&gctx);
 
@@ -628,84 +1984,156 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
   }
   assert(op_table_index == 100);
 
+  // prepare pre-generated or user given io plan
+  if (ioworker_plan_init(&gctx, args) != 0)
+  {
+    SPDK_WARNLOG("io plan init fail\n");
+    rets->error = 0x0002;  // Invalid Field in Command
+    free(qpair_ctx);
+    free(io_ctx);
+    return -8;
+  }
+
+  // replay the io sequence from the list or the trace file
+  if (ioworker_sequence_init(&gctx, args) != 0)
+  {
+    SPDK_WARNLOG("io sequence init fail\n");
+    rets->error = 0x0002;  // Invalid Field in Command
+    if (gctx.io_plan_generate)
+    {
+      free(gctx.io_plan);
+    }
+    free(qpair_ctx);
+    free(io_ctx);
+    return -8;
+  }
+
+  // init qpair ctx
+  for (unsigned int i=0; i<qcount; i++)
+  {
+    qpair_ctx[i].qpair = qpair_list[i];
+    qpair_ctx[i].weight = args->qweight ? args->qweight[i] : 0;
+    qpair_ctx[i].credit = qpair_ctx[i].weight*gctx.burst_max;
+    qpair_ctx[i].rets = args->qpair_rets ? &args->qpair_rets[i] : NULL;
+    if (qpair_ctx[i].rets != NULL)
+    {
+      memset(qpair_ctx[i].rets, 0, sizeof(struct ioworker_rets));
+    }
+    STAILQ_INIT(&qpair_ctx[i].pending_io_list);
+    assert(qpair_ctx[i].qpair != NULL);
+  }
+
   // sending the first batch of IOs, all remaining IOs are sending
   // in callbacks till end
-  STAILQ_INIT(&gctx.pending_io_list);
   uint32_t buffer_size = args->lba_size_max * sector_size;
-  uint32_t pool_size = buffer_size * args->qdepth * 2;
+  uint64_t pool_size = (uint64_t)buffer_size * args->qdepth * qcount * 2;
   void* buffer_pool = buffer_init(pool_size, NULL, args->ptype, args->pvalue);
   if (buffer_pool == NULL)
   {
-    SPDK_WARNLOG("memory alloc fail, buffer pool size: %d\n", pool_size);
+    SPDK_WARNLOG("memory alloc fail, buffer pool size: %ld\n", pool_size);
+    if (gctx.io_plan_generate)
+    {
+      free(gctx.io_plan);
+    }
+    ioworker_sequence_fini(&gctx);
+    free(qpair_ctx);
     free(io_ctx);
     return -5;
   }
 
-  SPDK_DEBUGLOG(SPDK_LOG_NVME, "prepare buffer %d\n", pool_size);
-  for (unsigned int i=0; i<args->qdepth; i++)
+  SPDK_DEBUGLOG(SPDK_LOG_NVME, "prepare buffer %ld\n", pool_size);
+
+  // verify read data in helper threads, instead of the completion path
+  if (args->verify_threads != 0)
+  {
+    gctx.verify = ioworker_verify_init(ns, args->verify_threads,
+                                       args->qdepth*qcount);
+    if (gctx.verify == NULL || gctx.verify->thread_count == 0)
+    {
+      SPDK_WARNLOG("no verify thread, verify in the completion path\n");
+      if (gctx.verify != NULL)
+      {
+        ioworker_verify_fini(gctx.verify);
+        gctx.verify = NULL;
+      }
+    }
+    else
+    {
+      driver_verify_offload(true);
+    }
+  }
+
+  for (unsigned int i=0; i<args->qdepth*qcount; i++)
   {
-    io_ctx[i].data_buf = buffer_pool+buffer_size*2*i;
-    io_ctx[i].write_buf = buffer_pool+buffer_size*2*i+buffer_size;
+    io_ctx[i].data_buf = buffer_pool+(uint64_t)buffer_size*2*i;
+    io_ctx[i].write_buf = buffer_pool+(uint64_t)buffer_size*2*i+buffer_size;
     io_ctx[i].gctx = &gctx;
+    // spread IOs to all qpairs evenly
+    io_ctx[i].qctx = &qpair_ctx[i%qcount];
+
+    if (gctx.io_count_sent == args->io_count)
+    {
+      // not more IO than required
+      break;
+    }
 
     // set time to send it for the first time
     if (gctx.io_sequence)
     {
-      uint32_t ios_index = gctx.io_sequence_index;
-
-      if (ios_index >= gctx.io_sequence_count)
+      if (gctx.io_sequence_index >= gctx.io_sequence_count ||
+          ioworker_sequence_next(&gctx, &io_ctx[i]) != 0)
       {
         continue;
       }
-
-      timeradd_usecond(&gctx.io_sequence_start,
-                       gctx.io_sequence[ios_index].timestamp,
-                       &io_ctx[i].time_sent);
-      io_ctx[i].io_sequence_index = ios_index;
-      gctx.io_sequence_index ++;
     }
-    else if (gctx.io_delay_time.tv_usec != 0)
+    else if (gctx.arrival_interval != 0)
     {
-      // control IOPS
-      timeradd(&gctx.io_due_time, &gctx.io_delay_time, &gctx.io_due_time);
-      io_ctx[i].time_sent = gctx.io_due_time;
+      // the first arrivals
+      io_ctx[i].time_sent = ioworker_arrival_next(&gctx);
     }
     else
     {
       // free run
-      timeval_gettimeofday(&io_ctx[i].time_sent);
+      io_ctx[i].time_sent = timestamp_ns();
     }
 
-    STAILQ_INSERT_TAIL(&gctx.pending_io_list, &io_ctx[i], next);
+    STAILQ_INSERT_TAIL(&io_ctx[i].qctx->pending_io_list, &io_ctx[i], next);
     gctx.io_count_sent ++;
   }
 
   // callbacks check the end condition and mark the flag. Check the
   // flag here if it is time to stop the ioworker and return the
-  // statistics data
-  struct ioworker_io_ctx* head_io = STAILQ_FIRST(&gctx.pending_io_list);
-  struct timeval now = {0, 0};
-  struct timeval cpu_time = {0, 0};
+  // statistics data. All pending IOs are counted in io_count_sent.
+  uint64_t now = 0;
+  uint64_t cpu_time = 0;
   SPDK_DEBUGLOG(SPDK_LOG_NVME, "start sending IO ... \n");
   while (gctx.io_count_sent != gctx.io_count_cplt ||
-         gctx.flag_finish != true ||
-         head_io != NULL)
+         gctx.flag_finish != true)
   {
-    SPDK_DEBUGLOG(SPDK_LOG_NVME, "sent %ld cplt %ld, finish %d, head %p\n",
+    SPDK_DEBUGLOG(SPDK_LOG_NVME, "sent %ld cplt %ld, finish %d\n",
                   gctx.io_count_sent, gctx.io_count_cplt,
-                  gctx.flag_finish, head_io);
+                  gctx.flag_finish);
 
-    // check time and send all pending io
-    timeval_gettimeofday(&now);
-    if (head_io && timercmp(&now, &head_io->time_sent, >))
+    // poll all qpairs in round robin
+    for (unsigned int i=0; i<qcount; i++)
     {
-      ioworker_send_one(ns, qpair, head_io, &gctx);
-      STAILQ_REMOVE_HEAD(&gctx.pending_io_list, next);
-      ioworker_add_cpu_time(&now, &cpu_time);
+      now = ioworker_poll_qpair(ns, &qpair_ctx[i], &gctx, &cpu_time);
+    }
+
+    // start next round of weighted qpairs
+    if (args->qweight != NULL)
+    {
+      ioworker_weight_refill(qpair_ctx, qcount, gctx.burst_max, now);
+    }
+
+    // finish io verified by helper threads
+    if (gctx.verify != NULL)
+    {
+      ioworker_verify_poll(&gctx, now);
     }
 
     //exceed 30 seconds more than the expected test time, abort ioworker
-    if (ioworker_get_duration(&test_start, &now) > (seconds+30)*1000ULL)
+    if (ioworker_get_duration(test_start, now) > (seconds+30)*1000ULL)
     {
       //ioworker timeout
       SPDK_ERRLOG("ioworker timeout, io sent %ld, io cplt %ld, finish %d\n",
@@ -714,6 +2142,24 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
       break;
     }
 
+    // move to next step of the sweep
+    if (args->sweep != NULL && now > gctx.sweep_next)
+    {
+      ioworker_sweep_next(&gctx, now);
+    }
+
+    // adjust queue depth and rate to the latency target
+    if (args->target != NULL)
+    {
+      ioworker_target_adjust(&gctx, now);
+    }
+
+    // publish live statistics every second
+    if (args->stats != NULL && now > gctx.time_next_stats)
+    {
+      ioworker_publish_stats(&gctx, args->stats, now);
+    }
+
     // check terminate signal from main process
     if ((driver_config_read() & DCFG_IOW_TERM) != 0)
     {
@@ -721,35 +2167,52 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
       ret = -7;
       break;
     }
+  }
 
-    // collect completions
-    timeval_gettimeofday(&now);
-    if (spdk_nvme_qpair_process_completions(qpair, 0) > 0)
-    {
-      // valid process, add cpu time
-      ioworker_add_cpu_time(&now, &cpu_time);
-    }
+  // stopped by invalid io in the trace file
+  if (gctx.io_sequence_invalid && ret == 0)
+  {
+    rets->error = 0x0002;  // Invalid Field in Command
+    ret = -8;
+  }
+
+  // final return values
+  assert(now != 0);
+  rets->mseconds = ioworker_get_duration(test_start, now)+1;
+  if (args->stats != NULL)
+  {
+    ioworker_publish_stats(&gctx, args->stats, now);
+  }
+  rets->cpu_usage = cpu_time/(1000*1000ULL);
+  rets->latency_average_us = gctx.total_latency_ns/1000/(rets->io_count_read+rets->io_count_nonread);
+  for (unsigned int i=0; i<qcount; i++)
+  {
+    struct ioworker_rets* qrets = qpair_ctx[i].rets;
+    uint64_t io_count;
 
-    // retry one queued request for LBA confliction
-    if (!STAILQ_EMPTY(&qpair->queued_req))
+    if (qrets != NULL)
     {
-      struct nvme_request *req = STAILQ_FIRST(&qpair->queued_req);
-      STAILQ_REMOVE_HEAD(&qpair->queued_req, stailq);
-      nvme_qpair_submit_request(qpair, req);
+      io_count = qrets->io_count_read+qrets->io_count_nonread;
+      qrets->mseconds = rets->mseconds;
+      qrets->cpu_usage = rets->cpu_usage;
+      qrets->latency_average_us = io_count ? qpair_ctx[i].total_latency_ns/1000/io_count : 0;
     }
-
-    // update the head io after process completion
-    head_io = STAILQ_FIRST(&gctx.pending_io_list);
   }
 
-  // final return values
-  assert(now.tv_sec != 0);
-  rets->mseconds = ioworker_get_duration(&test_start, &now)+1;
-  rets->cpu_usage = timeval_to_us(&cpu_time)/1000;
-  rets->latency_average_us = gctx.total_latency_us/(rets->io_count_read+rets->io_count_nonread);
+  // wait helper threads before releasing their buffers
+  if (gctx.verify != NULL)
+  {
+    driver_verify_offload(false);
+    ioworker_verify_fini(gctx.verify);
+  }
 
   //release buffer pool
   buffer_fini(buffer_pool);
+  if (gctx.io_plan_generate)
+  {
+    free(gctx.io_plan);
+  }
+  ioworker_sequence_fini(&gctx);
 
   // handle cmdlog_list
   if (args->cmdlog_list_len != 0)
@@ -779,6 +2242,7 @@ int ioworker_entry(struct spdk_nvme_ns* ns,
     free(cmdlog_list_tmp);
   }
 
+  free(qpair_ctx);
   free(io_ctx);
   return ret;
 }
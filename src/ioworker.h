@@ -38,16 +38,56 @@ struct ioworker_io_ctx {
   void* write_buf;
   uint8_t opcode;
   uint32_t op_index;
-  struct timeval time_sent;
+  uint64_t time_sent;  // ns
   struct ioworker_global_ctx* gctx;
+  struct ioworker_qpair_ctx* qctx;
   struct ioworker_cmdlog cmd;
 
-  uint32_t io_sequence_index;
+  struct ioworker_ioseq ios;
+  int verify_error;
 
   // next pending io
   STAILQ_ENTRY(ioworker_io_ctx) next;
 };
 
+// one ioworker can send IO on multiple qpairs
+struct ioworker_qpair_ctx {
+  struct spdk_nvme_qpair* qpair;
+  struct ioworker_rets* rets;
+  uint32_t weight;   // IOs sent in each round, 0 for round robin
+  uint32_t credit;   // IOs can be sent in current round
+  uint64_t total_latency_ns;
+
+  // pending io list of this qpair
+  STAILQ_HEAD(, ioworker_io_ctx)  pending_io_list;
+};
+
+// GCRA token bucket: theoretical arrival time advanced by cost*interval
+struct ioworker_limiter {
+  uint64_t interval;  // ns per unit, 32.32 fixed point
+  uint64_t tau;       // burst tolerance, ns
+  uint64_t tat;       // theoretical arrival time, ns
+  uint32_t tat_frac;
+};
+
+// read data verified in helper threads, out of the completion path.
+// Each io is in one ring at most, so rings of all io never overflow.
+struct ioworker_verify {
+  struct spdk_nvme_ns* ns;
+  pthread_mutex_t lock;
+  pthread_cond_t cond;
+  bool exit;
+  uint32_t thread_count;
+  pthread_t threads[IOWORKER_VERIFY_THREADS_MAX];
+  uint32_t size;
+  uint32_t todo_head;
+  uint32_t todo_tail;
+  uint32_t done_head;
+  uint32_t done_tail;
+  struct ioworker_io_ctx** todo;
+  struct ioworker_io_ctx** done;
+};
+
 struct ioworker_distribution_lookup {
   uint64_t lba_start;
   uint64_t lba_end;
@@ -57,25 +97,94 @@ struct ioworker_global_ctx {
   struct ioworker_args* args;
   struct ioworker_rets* rets;
   struct spdk_nvme_ns* ns;
-  struct spdk_nvme_qpair *qpair;
-  struct timeval due_time;
-  struct timeval io_due_time;
-  struct timeval io_delay_time;
-  struct timeval time_next_sec;
+  struct ioworker_qpair_ctx* qctx;
+  uint32_t qcount;
+  uint32_t burst_max;
+  uint64_t rand_state[4];  // xoshiro256**
+  uint64_t due_time;
+  struct ioworker_limiter iops_limiter;
+  struct ioworker_limiter bw_limiter;
+  double arrival_interval;  // mean ns between poisson or jitter arrivals
+  double io_due_time_frac;
+  uint64_t io_due_time;
+  uint32_t io_outstanding;
+  uint64_t time_next_sec;
   uint64_t io_count_till_last_sec;
   uint64_t sequential_lba;
   uint64_t io_count_sent;
   uint64_t io_count_cplt;
-  uint64_t total_latency_us;
+  uint64_t total_latency_ns;
   uint32_t last_sec;
   uint32_t current_cmdlog_index;
+  uint32_t sector_size;
   bool flag_finish;
 
-  // replay io sequence
+  // live statistics published to the main process
+  uint64_t time_start;
+  uint64_t time_next_stats;
+  uint64_t time_last_stats;
+  uint64_t io_count_last_stats;
+  uint64_t bytes_read;
+  uint64_t bytes_nonread;
+  uint64_t latency_histogram_sec[LATENCY_HISTOGRAM_BUCKETS];
+
+  // pre-generated io plan, a ring of batch generated or user given io
+  ioworker_plan* io_plan;
+  uint64_t io_plan_len;
+  uint64_t io_plan_index;
+  bool io_plan_generate;
+  uint8_t op_index_table[256];
+
+  // outstanding io limited by latency target or sweep
+  uint32_t qdepth_limit;
+  uint32_t qdepth_max;
+
+  // closed-loop latency target, adjusts queue depth and then the rate
+  uint32_t target_iops;
+  bool target_slow_start;
+  uint64_t target_window_start;
+  uint64_t target_window_io;
+  uint64_t target_window_min_io;
+  uint64_t target_histogram[LATENCY_HISTOGRAM_BUCKETS];
+
+  // sweep of queue depth and io size
+  uint32_t sweep_index;
+  uint32_t sweep_size_index;
+  uint64_t sweep_start;
+  uint64_t sweep_next;
+
+  // replay io sequence, from the list or the mapped trace file
   ioworker_ioseq* io_sequence;
-  uint32_t io_sequence_count;
-  uint32_t io_sequence_index;
-  struct timeval io_sequence_start;
+  uint64_t io_sequence_count;
+  uint64_t io_sequence_index;
+  uint64_t io_sequence_start;
+  uint64_t io_sequence_window;
+  double io_sequence_scale;
+  bool io_sequence_invalid;
+
+  // verify read data in helper threads
+  struct ioworker_verify* verify;
+  void* io_sequence_map;
+  size_t io_sequence_map_size;
+
+  // random lba without replacement, by feistel permutation of blocks
+  bool permutation;
+  uint32_t perm_half_bits;
+  uint64_t perm_n;
+  uint64_t perm_index;
+  uint64_t perm_keys[4];
+
+  // skewed lba distribution of random io
+  uint32_t skew;
+  uint64_t skew_n;
+  double skew_param;
+  double zipf_theta;
+  double zipf_alpha;
+  double zipf_zetan;
+  double zipf_eta;
+  uint32_t hotcold_levels;
+  uint32_t hotcold_io[IOWORKER_HOTCOLD_LEVELS_MAX];
+  uint64_t hotcold_lba[IOWORKER_HOTCOLD_LEVELS_MAX+1];
 
   // distribution loopup table
   bool distribution;
@@ -85,7 +194,4 @@ struct ioworker_global_ctx {
   uint32_t sl_table[10000];
 
   uint8_t op_table[100];
-
-  // pending io list
-  STAILQ_HEAD(, ioworker_io_ctx)  pending_io_list;
 };
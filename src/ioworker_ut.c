@@ -91,9 +91,9 @@ uint32_t spdk_nvme_ns_get_sector_size(struct spdk_nvme_ns *ns)
   return 0;
 }
 
-void timeval_gettimeofday(struct timeval *tv)
+uint64_t timestamp_ns(void)
 {
-
+  return 0;
 }
 
 uint64_t crc32_skip_uncorr(struct spdk_nvme_ns* ns, uint64_t slba, uint32_t nlba)
@@ -129,6 +129,25 @@ spdk_dma_zmalloc(size_t size, size_t align, uint64_t *phys_addr)
   return NULL;
 }
 
+int ns_verify_read(struct spdk_nvme_ns* ns,
+                   const void* buf,
+                   uint64_t lba,
+                   uint32_t lba_count)
+{
+  // the first 64-bit word of the data is the lba
+  return *(uint64_t*)buf == lba ? 0 : -2;
+}
+
+void ns_verify_unlock(struct spdk_nvme_ns* ns,
+                      uint64_t lba,
+                      uint32_t lba_count)
+{
+}
+
+void driver_verify_offload(bool offload)
+{
+}
+
 
 // stubs
 DEFINE_STUB(spdk_nvme_ns_get_num_sectors, uint64_t,
@@ -518,78 +537,17 @@ static int suite_ioworker_distribution_init(void)
 
 
 // test cases
-static void test_timeradd_usecond_add_0(void)
-{
-  struct timeval now = {10, 100};
-  struct timeval due = {0, 0};
-
-  timeradd_usecond(&now, 0, &due);
-
-  CU_ASSERT_EQUAL(due.tv_sec, 10);
-  CU_ASSERT_EQUAL(due.tv_usec, 100);
-}
-
-static void test_timeradd_usecond_add_1(void)
-{
-  struct timeval now = {10, 10};
-  struct timeval due = {0, 0};
-
-  timeradd_usecond(&now, 1, &due);
-
-  CU_ASSERT_EQUAL(due.tv_sec, 10);
-  CU_ASSERT_EQUAL(due.tv_usec, 11);
-}
-
-static void test_timeradd_usecond_add_100(void)
-{
-  struct timeval now = {10, 1000*1000ULL};
-  struct timeval due = {0, 0};
-
-  timeradd_usecond(&now, 100, &due);
-
-  CU_ASSERT_EQUAL(due.tv_sec, 11);
-  CU_ASSERT_EQUAL(due.tv_usec, 100);
-}
-
-static void test_timeradd_usecond_add_10000000(void)
-{
-  struct timeval now = {10, 1ULL};
-  struct timeval due = {0, 0};
-
-  timeradd_usecond(&now, 10000000, &due);
-
-  CU_ASSERT_EQUAL(due.tv_sec, 20);
-  CU_ASSERT_EQUAL(due.tv_usec, 1);
-}
-
-static int suite_timeradd_usecond()
-{
-  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
-  if (s == NULL) {
-    CU_cleanup_registry();
-    return CU_get_error();
-  }
-
-  CU_ADD_TEST(s, test_timeradd_usecond_add_0);
-  CU_ADD_TEST(s, test_timeradd_usecond_add_1);
-  CU_ADD_TEST(s, test_timeradd_usecond_add_100);
-  CU_ADD_TEST(s, test_timeradd_usecond_add_10000000);
-
-  return 0;
-}
-
-
 static void test_ioworker_send_one_is_finish_io_count_full()
 {
   struct ioworker_args args;
   struct ioworker_global_ctx ctx;
-  struct timeval now;
+  uint64_t now = 0;
   bool ret;
 
   args.io_count = 100;
   ctx.io_count_sent = 100;
 
-  ret = ioworker_send_one_is_finish(&args, &ctx, &now);
+  ret = ioworker_send_one_is_finish(&args, &ctx, now);
 
   CU_ASSERT_EQUAL(ret, true);
 }
@@ -599,17 +557,15 @@ static void test_ioworker_send_one_is_finish_time_full()
 {
   struct ioworker_args args;
   struct ioworker_global_ctx ctx;
-  struct timeval now;
+  uint64_t now = 0;
   bool ret;
 
   args.io_count = 100;
   ctx.io_count_sent = 99;
-  now.tv_sec = 100;
-  now.tv_usec = 8800;
-  ctx.due_time.tv_sec = 100;
-  ctx.due_time.tv_usec = 8000;
+  now = 100*1000000000ULL+8800*1000ULL;
+  ctx.due_time = 100*1000000000ULL+8000*1000ULL;
 
-  ret = ioworker_send_one_is_finish(&args, &ctx, &now);
+  ret = ioworker_send_one_is_finish(&args, &ctx, now);
 
   CU_ASSERT_EQUAL(ret, true);
 }
@@ -618,28 +574,24 @@ static void test_ioworker_send_one_is_finish_time_long_full()
 {
   struct ioworker_args args;
   struct ioworker_global_ctx ctx;
-  struct timeval now;
+  uint64_t now = 0;
   bool ret;
 
   args.io_count = 100;
   ctx.io_count_sent = 99;
-  now.tv_sec = 10000000UL+500*3600UL;
-  now.tv_usec = 8800;
-  ctx.due_time.tv_sec = 10000000UL+500*3600UL;
-  ctx.due_time.tv_usec = 8000;
+  now = (10000000UL+500*3600UL)*1000000000ULL+8800*1000ULL;
+  ctx.due_time = (10000000UL+500*3600UL)*1000000000ULL+8000*1000ULL;
 
-  ret = ioworker_send_one_is_finish(&args, &ctx, &now);
+  ret = ioworker_send_one_is_finish(&args, &ctx, now);
 
   CU_ASSERT_EQUAL(ret, true);
 
   args.io_count = 100;
   ctx.io_count_sent = 99;
-  now.tv_sec = 10000000UL+500*3600UL;
-  now.tv_usec = 8800;
-  ctx.due_time.tv_sec = 10000000UL+500*3600UL;
-  ctx.due_time.tv_usec = 8801;
+  now = (10000000UL+500*3600UL)*1000000000ULL+8800*1000ULL;
+  ctx.due_time = (10000000UL+500*3600UL)*1000000000ULL+8801*1000ULL;
 
-  ret = ioworker_send_one_is_finish(&args, &ctx, &now);
+  ret = ioworker_send_one_is_finish(&args, &ctx, now);
 
   CU_ASSERT_EQUAL(ret, false);
 }
@@ -648,17 +600,15 @@ static void test_ioworker_send_one_is_finish_both_full()
 {
   struct ioworker_args args;
   struct ioworker_global_ctx ctx;
-  struct timeval now;
+  uint64_t now = 0;
   bool ret;
 
   args.io_count = 99;
   ctx.io_count_sent = 99;
-  now.tv_sec = 100;
-  now.tv_usec = 8800;
-  ctx.due_time.tv_sec = 99;
-  ctx.due_time.tv_usec = 8000;
+  now = 100*1000000000ULL+8800*1000ULL;
+  ctx.due_time = 99*1000000000ULL+8000*1000ULL;
 
-  ret = ioworker_send_one_is_finish(&args, &ctx, &now);
+  ret = ioworker_send_one_is_finish(&args, &ctx, now);
 
   CU_ASSERT_EQUAL(ret, true);
 }
@@ -667,17 +617,15 @@ static void test_ioworker_send_one_is_finish_none_full()
 {
   struct ioworker_args args;
   struct ioworker_global_ctx ctx;
-  struct timeval now;
+  uint64_t now = 0;
   bool ret;
 
   args.io_count = 99;
   ctx.io_count_sent = 9;
-  now.tv_sec = 100;
-  now.tv_usec = 8800;
-  ctx.due_time.tv_sec = 999;
-  ctx.due_time.tv_usec = 8000;
+  now = 100*1000000000ULL+8800*1000ULL;
+  ctx.due_time = 999*1000000000ULL+8000*1000ULL;
 
-  ret = ioworker_send_one_is_finish(&args, &ctx, &now);
+  ret = ioworker_send_one_is_finish(&args, &ctx, now);
 
   CU_ASSERT_EQUAL(ret, false);
 }
@@ -702,96 +650,84 @@ static int suite_ioworker_send_one_is_finish()
 
 static void test_ioworker_get_duration_small()
 {
-  struct timeval now;
-  struct timeval start;
+  uint64_t now;
+  uint64_t start;
   uint32_t ret;
 
-  now.tv_sec = 100;
-  now.tv_usec = 8801;
-  start.tv_sec = 100;
-  start.tv_usec = 8800;
+  now = 100*1000000000ULL+8801*1000ULL;
+  start = 100*1000000000ULL+8800*1000ULL;
 
-  ret = ioworker_get_duration(&start, &now);
+  ret = ioworker_get_duration(start, now);
 
   CU_ASSERT_EQUAL(ret, 0);
 }
 
 static void test_ioworker_get_duration_1ms()
 {
-  struct timeval now;
-  struct timeval start;
+  uint64_t now;
+  uint64_t start;
   uint32_t ret;
 
-  now.tv_sec = 100;
-  now.tv_usec = 9801;
-  start.tv_sec = 100;
-  start.tv_usec = 8800;
+  now = 100*1000000000ULL+9801*1000ULL;
+  start = 100*1000000000ULL+8800*1000ULL;
 
-  ret = ioworker_get_duration(&start, &now);
+  ret = ioworker_get_duration(start, now);
 
   CU_ASSERT_EQUAL(ret, 1);
 }
 
 static void test_ioworker_get_duration_1001ms()
 {
-  struct timeval now;
-  struct timeval start;
+  uint64_t now;
+  uint64_t start;
   uint32_t ret;
 
-  now.tv_sec = 101;
-  now.tv_usec = 9801;
-  start.tv_sec = 100;
-  start.tv_usec = 8800;
+  now = 101*1000000000ULL+9801*1000ULL;
+  start = 100*1000000000ULL+8800*1000ULL;
 
-  ret = ioworker_get_duration(&start, &now);
+  ret = ioworker_get_duration(start, now);
 
   CU_ASSERT_EQUAL(ret, 1001);
 }
 
 static void test_ioworker_get_duration_999ms()
 {
-  struct timeval now;
-  struct timeval start;
+  uint64_t now;
+  uint64_t start;
   uint32_t ret;
 
-  now.tv_sec = 101;
-  now.tv_usec = 0;
-  start.tv_sec = 100;
-  start.tv_usec = 1499;
+  now = 101*1000000000ULL;
+  start = 100*1000000000ULL+1499*1000ULL;
 
-  ret = ioworker_get_duration(&start, &now);
+  ret = ioworker_get_duration(start, now);
 
   CU_ASSERT_EQUAL(ret, 999);
 }
 
 static void test_ioworker_get_duration_998ms()
 {
-  struct timeval now;
-  struct timeval start;
+  uint64_t now;
+  uint64_t start;
   uint32_t ret;
 
-  now.tv_sec = 101;
-  now.tv_usec = 0;
-  start.tv_sec = 100;
-  start.tv_usec = 1501;
+  now = 101*1000000000ULL;
+  start = 100*1000000000ULL+1501*1000ULL;
 
-  ret = ioworker_get_duration(&start, &now);
+  ret = ioworker_get_duration(start, now);
 
   CU_ASSERT_EQUAL(ret, 998);
 }
 
 static void test_ioworker_get_duration_large()
 {
-  struct timeval now;
-  struct timeval start;
+  uint64_t now;
+  uint64_t start;
   uint32_t ret;
 
-  now.tv_sec = 1000*3600UL;
-  now.tv_usec = 0;
-  start.tv_sec = 0;
-  start.tv_usec = 0;
+  now = 1000*3600UL*1000000000ULL;
+  start = 0;
 
-  ret = ioworker_get_duration(&start, &now);
+  ret = ioworker_get_duration(start, now);
 
   CU_ASSERT_EQUAL(ret, 3600000000UL);
 }
@@ -815,26 +751,25 @@ static int suite_ioworker_get_duration()
 }
 
 
-DEFINE_STUB(timeval_to_us, uint32_t, (struct timeval* t), 0);
-
 static void test_ioworker_update_rets_latency_read()
 {
   struct ioworker_io_ctx ctx;
   struct ioworker_rets rets;
-  struct timeval now;
-  uint32_t ret;
+  uint64_t now;
+  uint64_t ret;
 
-  MOCK_SET(timeval_to_us, 200);
+  ctx.time_sent = 1000*1000ULL;
+  now = ctx.time_sent + 200*1000ULL;
 
   rets.latency_max_us = 100;
   ctx.opcode = 2;
   rets.io_count_read = 10;
   rets.io_count_nonread = 11;
 
-  ret = ioworker_update_rets(&ctx, &rets, &now);
+  ret = ioworker_update_rets(&ctx, &rets, now);
 
   CU_ASSERT_EQUAL(rets.latency_max_us, 200);
-  CU_ASSERT_EQUAL(ret, 200);
+  CU_ASSERT_EQUAL(ret, 200*1000ULL);
   CU_ASSERT_EQUAL(rets.io_count_read, 11);
   CU_ASSERT_EQUAL(rets.io_count_nonread, 11);
 }
@@ -843,20 +778,21 @@ static void test_ioworker_update_rets_latency_write()
 {
   struct ioworker_io_ctx ctx;
   struct ioworker_rets rets;
-  struct timeval now;
-  uint32_t ret;
+  uint64_t now;
+  uint64_t ret;
 
-  MOCK_SET(timeval_to_us, 2000);
+  ctx.time_sent = 1000*1000ULL;
+  now = ctx.time_sent + 2000*1000ULL;
 
   rets.latency_max_us = 100;
   ctx.opcode = 1;
   rets.io_count_read = 10;
   rets.io_count_nonread = 11;
 
-  ret = ioworker_update_rets(&ctx, &rets, &now);
+  ret = ioworker_update_rets(&ctx, &rets, now);
 
   CU_ASSERT_EQUAL(rets.latency_max_us, 2000);
-  CU_ASSERT_EQUAL(ret, 2000);
+  CU_ASSERT_EQUAL(ret, 2000*1000ULL);
   CU_ASSERT_EQUAL(rets.io_count_read, 10);
   CU_ASSERT_EQUAL(rets.io_count_nonread, 12);
 }
@@ -865,20 +801,21 @@ static void test_ioworker_update_rets_latency_large_write()
 {
   struct ioworker_io_ctx ctx;
   struct ioworker_rets rets;
-  struct timeval now;
-  uint32_t ret;
+  uint64_t now;
+  uint64_t ret;
 
-  MOCK_SET(timeval_to_us, 4000000000U);
+  ctx.time_sent = 1000*1000ULL;
+  now = ctx.time_sent + 4000000000U*1000ULL;
 
   rets.latency_max_us = 100;
   ctx.opcode = 1;
   rets.io_count_read = 10;
   rets.io_count_nonread = 11;
 
-  ret = ioworker_update_rets(&ctx, &rets, &now);
+  ret = ioworker_update_rets(&ctx, &rets, now);
 
   CU_ASSERT_EQUAL(rets.latency_max_us, 4000000000U);
-  CU_ASSERT_EQUAL(ret, 4000000000U);
+  CU_ASSERT_EQUAL(ret, 4000000000U*1000ULL);
   CU_ASSERT_EQUAL(rets.io_count_read, 10);
   CU_ASSERT_EQUAL(rets.io_count_nonread, 12);
 }
@@ -887,20 +824,21 @@ static void test_ioworker_update_rets_read()
 {
   struct ioworker_io_ctx ctx;
   struct ioworker_rets rets;
-  struct timeval now;
-  uint32_t ret;
+  uint64_t now;
+  uint64_t ret;
 
-  MOCK_SET(timeval_to_us, 2000);
+  ctx.time_sent = 1000*1000ULL;
+  now = ctx.time_sent + 2000*1000ULL;
 
   rets.latency_max_us = 10000;
   ctx.opcode = 2;
   rets.io_count_read = 10;
   rets.io_count_nonread = 11;
 
-  ret = ioworker_update_rets(&ctx, &rets, &now);
+  ret = ioworker_update_rets(&ctx, &rets, now);
 
   CU_ASSERT_EQUAL(rets.latency_max_us, 10000);
-  CU_ASSERT_EQUAL(ret, 2000);
+  CU_ASSERT_EQUAL(ret, 2000*1000ULL);
   CU_ASSERT_EQUAL(rets.io_count_read, 11);
   CU_ASSERT_EQUAL(rets.io_count_nonread, 11);
 }
@@ -909,24 +847,77 @@ static void test_ioworker_update_rets_write()
 {
   struct ioworker_io_ctx ctx;
   struct ioworker_rets rets;
-  struct timeval now;
-  uint32_t ret;
+  uint64_t now;
+  uint64_t ret;
 
-  MOCK_SET(timeval_to_us, 2000);
+  ctx.time_sent = 1000*1000ULL;
+  now = ctx.time_sent + 2000*1000ULL;
 
   rets.latency_max_us = 10000;
   ctx.opcode = 1;
   rets.io_count_read = 10;
   rets.io_count_nonread = 11;
 
-  ret = ioworker_update_rets(&ctx, &rets, &now);
+  ret = ioworker_update_rets(&ctx, &rets, now);
 
   CU_ASSERT_EQUAL(rets.latency_max_us, 10000);
-  CU_ASSERT_EQUAL(ret, 2000);
+  CU_ASSERT_EQUAL(ret, 2000*1000ULL);
   CU_ASSERT_EQUAL(rets.io_count_read, 10);
   CU_ASSERT_EQUAL(rets.io_count_nonread, 12);
 }
 
+static void test_ioworker_update_op_stats()
+{
+  struct ioworker_io_ctx ctx;
+  struct ioworker_args args;
+  struct ioworker_op_stats op_stats[2];
+  static unsigned long op_histogram[2*LATENCY_HISTOGRAM_BUCKETS];
+
+  memset(&args, 0, sizeof(args));
+  memset(op_stats, 0, sizeof(op_stats));
+  memset(op_histogram, 0, sizeof(op_histogram));
+  args.op_num = 2;
+  args.op_stats = op_stats;
+  args.op_histogram = op_histogram;
+
+  // read
+  ctx.op_index = 0;
+  ctx.cmd.count = 8;
+  ioworker_update_op_stats(&ctx, &args, 512, 100*1000ULL);
+  ioworker_update_op_stats(&ctx, &args, 512, 300*1000ULL);
+
+  // write
+  ctx.op_index = 1;
+  ctx.cmd.count = 256;
+  ioworker_update_op_stats(&ctx, &args, 512, 2000*1000ULL);
+
+  // not in op_list
+  ctx.op_index = 2;
+  ioworker_update_op_stats(&ctx, &args, 512, 5000*1000ULL);
+
+  CU_ASSERT_EQUAL(op_stats[0].io_count, 2);
+  CU_ASSERT_EQUAL(op_stats[0].bytes, 8192);
+  CU_ASSERT_EQUAL(op_stats[0].latency_total_ns, 400*1000ULL);
+  CU_ASSERT_EQUAL(op_stats[0].latency_max_us, 300);
+  CU_ASSERT_EQUAL(op_stats[1].io_count, 1);
+  CU_ASSERT_EQUAL(op_stats[1].bytes, 256*512);
+  CU_ASSERT_EQUAL(op_stats[1].latency_max_us, 2000);
+  CU_ASSERT_EQUAL(op_histogram[latency_histogram_index(100*1000ULL)], 1);
+  CU_ASSERT_EQUAL(op_histogram[latency_histogram_index(300*1000ULL)], 1);
+  CU_ASSERT_EQUAL(op_histogram[LATENCY_HISTOGRAM_BUCKETS+
+                               latency_histogram_index(2000*1000ULL)], 1);
+  CU_ASSERT_EQUAL(latency_histogram_percentile(&op_histogram[LATENCY_HISTOGRAM_BUCKETS], 99),
+                  latency_histogram_value(latency_histogram_index(2000*1000ULL)));
+
+  // histogram is optional
+  args.op_histogram = NULL;
+  ctx.op_index = 0;
+  ctx.cmd.count = 8;
+  ioworker_update_op_stats(&ctx, &args, 4096, 100*1000ULL);
+  CU_ASSERT_EQUAL(op_stats[0].io_count, 3);
+  CU_ASSERT_EQUAL(op_stats[0].bytes, 8192+32768);
+}
+
 static int suite_ioworker_update_rets()
 {
   CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
@@ -940,6 +931,7 @@ static int suite_ioworker_update_rets()
   CU_ADD_TEST(s, test_ioworker_update_rets_latency_large_write);
   CU_ADD_TEST(s, test_ioworker_update_rets_read);
   CU_ADD_TEST(s, test_ioworker_update_rets_write);
+  CU_ADD_TEST(s, test_ioworker_update_op_stats);
 
   return 0;
 }
@@ -953,8 +945,7 @@ static void test_ioworker_update_io_count_per_second_1()
   rets.io_count_read = 0;
   rets.io_count_nonread = 1;
   ctx.last_sec = 10;
-  ctx.time_next_sec.tv_sec = 1;
-  ctx.time_next_sec.tv_usec = 100;
+  ctx.time_next_sec = 1*1000000000ULL+100*1000ULL;
   ctx.io_count_till_last_sec = 0;
   args.io_counter_per_second = malloc(sizeof(uint32_t)*20);
   args.io_counter_per_second[10] = 0;
@@ -962,8 +953,7 @@ static void test_ioworker_update_io_count_per_second_1()
   ioworker_update_io_count_per_second(&ctx, &args, &rets);
 
   CU_ASSERT_EQUAL(ctx.last_sec, 11);
-  CU_ASSERT_EQUAL(ctx.time_next_sec.tv_sec, 2);
-  CU_ASSERT_EQUAL(ctx.time_next_sec.tv_usec, 100);
+  CU_ASSERT_EQUAL(ctx.time_next_sec, 2*1000000000ULL+100*1000ULL);
   CU_ASSERT_EQUAL(args.io_counter_per_second[10], 1);
   CU_ASSERT_EQUAL(ctx.io_count_till_last_sec, 1);
 
@@ -979,8 +969,7 @@ static void test_ioworker_update_io_count_per_second_100000_long()
   rets.io_count_read = 30000;
   rets.io_count_nonread = 80000;
   ctx.last_sec = 500*3600;
-  ctx.time_next_sec.tv_sec = 12345;
-  ctx.time_next_sec.tv_usec = 0;
+  ctx.time_next_sec = 12345*1000000000ULL;
   ctx.io_count_till_last_sec = 10000;
   args.io_counter_per_second = malloc(sizeof(uint32_t)*1000*3600);
   args.io_counter_per_second[500*3600] = 0;
@@ -988,8 +977,7 @@ static void test_ioworker_update_io_count_per_second_100000_long()
   ioworker_update_io_count_per_second(&ctx, &args, &rets);
 
   CU_ASSERT_EQUAL(ctx.last_sec, 500*3600+1);
-  CU_ASSERT_EQUAL(ctx.time_next_sec.tv_sec, 12346);
-  CU_ASSERT_EQUAL(ctx.time_next_sec.tv_usec, 0);
+  CU_ASSERT_EQUAL(ctx.time_next_sec, 12346*1000000000ULL);
   CU_ASSERT_EQUAL(args.io_counter_per_second[500*3600], 100000);
   CU_ASSERT_EQUAL(ctx.io_count_till_last_sec, 110000);
 
@@ -1197,6 +1185,1263 @@ static int suite_ioworker_send_one_lba()
 }
 
 
+static void test_latency_histogram_index_linear()
+{
+  CU_ASSERT_EQUAL(latency_histogram_index(0), 0);
+  CU_ASSERT_EQUAL(latency_histogram_index(1), 1);
+  CU_ASSERT_EQUAL(latency_histogram_index(31), 31);
+  CU_ASSERT_EQUAL(latency_histogram_index(32), 32);
+  CU_ASSERT_EQUAL(latency_histogram_index(63), 63);
+  CU_ASSERT_EQUAL(latency_histogram_index(64), 64);
+  CU_ASSERT_EQUAL(latency_histogram_index(65), 64);
+  CU_ASSERT_EQUAL(latency_histogram_index(66), 65);
+}
+
+static void test_latency_histogram_index_max()
+{
+  CU_ASSERT_EQUAL(LATENCY_HISTOGRAM_BUCKETS, 1024);
+  CU_ASSERT_EQUAL(latency_histogram_index((1ULL<<36)-1), 1023);
+  CU_ASSERT_EQUAL(latency_histogram_index(1ULL<<36), 1023);
+  CU_ASSERT_EQUAL(latency_histogram_index(-1ULL), 1023);
+}
+
+static void test_latency_histogram_value_error()
+{
+  // value of the bucket is within 1/32 of all latency in the bucket
+  for (uint64_t ns=1; ns<(1ULL<<36); ns=ns*3/2+1)
+  {
+    uint64_t value = latency_histogram_value(latency_histogram_index(ns));
+    uint64_t diff = value>ns ? value-ns : ns-value;
+    CU_ASSERT(diff*32 <= ns);
+  }
+}
+
+static void test_latency_histogram_value_monotonic()
+{
+  for (uint32_t i=1; i<LATENCY_HISTOGRAM_BUCKETS; i++)
+  {
+    CU_ASSERT(latency_histogram_value(i) > latency_histogram_value(i-1));
+    CU_ASSERT_EQUAL(latency_histogram_index(latency_histogram_value(i)), i);
+  }
+}
+
+static void test_latency_histogram_percentile()
+{
+  unsigned long histogram[LATENCY_HISTOGRAM_BUCKETS];
+
+  memset(histogram, 0, sizeof(histogram));
+  CU_ASSERT_EQUAL(latency_histogram_percentile(histogram, 99), 0);
+
+  histogram[latency_histogram_index(10)] = 90;
+  histogram[latency_histogram_index(1000)] = 9;
+  histogram[latency_histogram_index(1000000)] = 1;
+  CU_ASSERT_EQUAL(latency_histogram_percentile(histogram, 50), 10);
+  CU_ASSERT_EQUAL(latency_histogram_percentile(histogram, 90), 10);
+  CU_ASSERT_EQUAL(latency_histogram_percentile(histogram, 99),
+                  latency_histogram_value(latency_histogram_index(1000)));
+  CU_ASSERT_EQUAL(latency_histogram_percentile(histogram, 99.999),
+                  latency_histogram_value(latency_histogram_index(1000000)));
+}
+
+static int suite_latency_histogram()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_latency_histogram_index_linear);
+  CU_ADD_TEST(s, test_latency_histogram_index_max);
+  CU_ADD_TEST(s, test_latency_histogram_value_error);
+  CU_ADD_TEST(s, test_latency_histogram_value_monotonic);
+  CU_ADD_TEST(s, test_latency_histogram_percentile);
+
+  return 0;
+}
+
+
+static void test_ioworker_publish_stats()
+{
+  static struct ioworker_global_ctx ctx;
+  static struct ioworker_stats stats;
+  static struct ioworker_stats snapshot;
+  struct ioworker_rets rets;
+
+  memset(&ctx, 0, sizeof(ctx));
+  memset(&stats, 0, sizeof(stats));
+  memset(&rets, 0, sizeof(rets));
+  ctx.rets = &rets;
+  ctx.time_start = 1000*1000000000ULL;
+  ctx.time_last_stats = ctx.time_start;
+  rets.io_count_read = 3000;
+  rets.io_count_nonread = 1000;
+  rets.latency_max_us = 2000;
+  ctx.bytes_read = 3000*4096;
+  ctx.bytes_nonread = 1000*4096;
+  ctx.latency_histogram_sec[latency_histogram_index(100000)] = 4000;
+
+  ioworker_publish_stats(&ctx, &stats, ctx.time_start+2*1000000000ULL);
+
+  CU_ASSERT_EQUAL(stats.sequence, 2);
+  CU_ASSERT_EQUAL(stats.io_count_read, 3000);
+  CU_ASSERT_EQUAL(stats.io_count_nonread, 1000);
+  CU_ASSERT_EQUAL(stats.bytes_read, 3000*4096);
+  CU_ASSERT_EQUAL(stats.bytes_nonread, 1000*4096);
+  CU_ASSERT_EQUAL(stats.mseconds, 2000);
+  CU_ASSERT_EQUAL(stats.iops, 2000);
+  CU_ASSERT_EQUAL(stats.latency_max_us, 2000);
+  CU_ASSERT_EQUAL(stats.latency_histogram[latency_histogram_index(100000)], 4000);
+  CU_ASSERT_EQUAL(ctx.latency_histogram_sec[latency_histogram_index(100000)], 0);
+  CU_ASSERT_EQUAL(ctx.io_count_last_stats, 4000);
+  CU_ASSERT_EQUAL(ctx.time_next_stats, ctx.time_start+3*1000000000ULL);
+
+  // next second
+  rets.io_count_read = 4000;
+  ioworker_publish_stats(&ctx, &stats, ctx.time_start+3*1000000000ULL);
+  ioworker_stats_read(&stats, &snapshot);
+
+  CU_ASSERT_EQUAL(snapshot.sequence, 4);
+  CU_ASSERT_EQUAL(snapshot.io_count_read, 4000);
+  CU_ASSERT_EQUAL(snapshot.iops, 1000);
+  CU_ASSERT_EQUAL(snapshot.mseconds, 3000);
+  CU_ASSERT_EQUAL(snapshot.latency_histogram[latency_histogram_index(100000)], 0);
+}
+
+static int suite_ioworker_stats()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_publish_stats);
+
+  return 0;
+}
+
+
+static void test_ioworker_rand_seed()
+{
+  static struct ioworker_global_ctx ctx1;
+  static struct ioworker_global_ctx ctx2;
+
+  ioworker_rand_init(&ctx1, 1);
+  ioworker_rand_init(&ctx2, 1);
+  for (int i=0; i<1000; i++)
+  {
+    CU_ASSERT_EQUAL(ioworker_rand(&ctx1), ioworker_rand(&ctx2));
+  }
+
+  ioworker_rand_init(&ctx2, 2);
+  CU_ASSERT_NOT_EQUAL(ioworker_rand(&ctx1), ioworker_rand(&ctx2));
+
+  // state cannot be all zero, even with seed 0
+  ioworker_rand_init(&ctx1, 0);
+  CU_ASSERT_NOT_EQUAL(ioworker_rand(&ctx1)|ioworker_rand(&ctx1), 0);
+}
+
+static void test_ioworker_rand_range_large()
+{
+  static struct ioworker_global_ctx ctx;
+  uint64_t range = 1ULL<<40;  // 512TB in 512-byte LBA
+  bool high = false;
+
+  ioworker_rand_init(&ctx, 0x1234);
+  for (int i=0; i<1000; i++)
+  {
+    uint64_t lba = ioworker_rand_range(&ctx, range);
+    CU_ASSERT(lba < range);
+    if (lba >= (1ULL<<31))
+    {
+      high = true;
+    }
+  }
+
+  // cover the lba beyond 2^31
+  CU_ASSERT(high);
+  CU_ASSERT(ioworker_rand_range(&ctx, -1ULL) < -1ULL);
+}
+
+static void test_ioworker_rand_range_uniform()
+{
+  static struct ioworker_global_ctx ctx;
+  uint32_t counter[100];
+
+  memset(counter, 0, sizeof(counter));
+  ioworker_rand_init(&ctx, 0x5678);
+  for (int i=0; i<100000; i++)
+  {
+    counter[ioworker_rand_range(&ctx, 100)] ++;
+  }
+
+  for (int i=0; i<100; i++)
+  {
+    CU_ASSERT(counter[i] > 800);
+    CU_ASSERT(counter[i] < 1200);
+  }
+
+  CU_ASSERT_EQUAL(ioworker_rand_range(&ctx, 1), 0);
+}
+
+static int suite_ioworker_rand()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_rand_seed);
+  CU_ADD_TEST(s, test_ioworker_rand_range_large);
+  CU_ADD_TEST(s, test_ioworker_rand_range_uniform);
+
+  return 0;
+}
+
+
+static void test_ioworker_plan_user()
+{
+  static struct ioworker_global_ctx gctx;
+  struct ioworker_args args;
+  struct ioworker_plan plan[3] = {{0, 8, 2}, {100, 8, 1}, {200, 1, 9}};
+  uint32_t op_list[2] = {2, 1};
+
+  memset(&gctx, 0, sizeof(gctx));
+  memset(&args, 0, sizeof(args));
+  args.op_list = op_list;
+  args.op_num = 2;
+  args.io_plan = plan;
+  args.io_plan_len = 3;
+  args.lba_size_max = 256;
+  args.region_end = 1000;
+
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), 0);
+  CU_ASSERT_EQUAL(gctx.op_index_table[2], 0);
+  CU_ASSERT_EQUAL(gctx.op_index_table[1], 1);
+  CU_ASSERT_EQUAL(gctx.op_index_table[9], 2);
+
+  // repeat the plan
+  CU_ASSERT_PTR_EQUAL(ioworker_plan_next(&ns, &gctx), &plan[0]);
+  CU_ASSERT_PTR_EQUAL(ioworker_plan_next(&ns, &gctx), &plan[1]);
+  CU_ASSERT_PTR_EQUAL(ioworker_plan_next(&ns, &gctx), &plan[2]);
+  CU_ASSERT_PTR_EQUAL(ioworker_plan_next(&ns, &gctx), &plan[0]);
+  CU_ASSERT_EQUAL(plan[0].slba, 0);
+
+  // io out of the region
+  plan[2].slba = 999;
+  plan[2].nlba = 2;
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), -1);
+  plan[2].slba = 1000;
+  plan[2].nlba = 1;
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), -1);
+
+  // invalid io size
+  plan[2].slba = 0;
+  plan[2].nlba = 0;
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), -1);
+  plan[2].nlba = 257;
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), -1);
+  plan[2].nlba = 256;
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), 0);
+}
+
+static void test_ioworker_plan_generate()
+{
+  static struct ioworker_global_ctx gctx;
+  struct ioworker_args args;
+  struct ioworker_plan* io;
+  uint32_t op_list[1] = {1};
+  uint32_t size_list[1] = {8};
+  uint32_t align_list[1] = {8};
+
+  memset(&gctx, 0, sizeof(gctx));
+  memset(&args, 0, sizeof(args));
+  args.op_list = op_list;
+  args.op_num = 1;
+  args.lba_size_list = size_list;
+  args.lba_size_list_align = align_list;
+  args.lba_size_ratio_sum = 1;
+  args.lba_random = 0;
+  args.region_end = 1000;
+  args.io_plan_batch = 4;
+  gctx.args = &args;
+  ioworker_rand_init(&gctx, 1);
+
+  CU_ASSERT_EQUAL(ioworker_plan_init(&gctx, &args), 0);
+  CU_ASSERT(gctx.io_plan_generate);
+
+  // generate the next batch after the first batch is used up
+  for (uint64_t i=0; i<10; i++)
+  {
+    io = ioworker_plan_next(&ns, &gctx);
+    CU_ASSERT_EQUAL(io->slba, i*8);
+    CU_ASSERT_EQUAL(io->nlba, 8);
+    CU_ASSERT_EQUAL(io->op, 1);
+    CU_ASSERT_EQUAL(gctx.op_index_table[io->op], 0);
+  }
+  CU_ASSERT_EQUAL(gctx.io_plan_index, 2);
+
+  free(gctx.io_plan);
+}
+
+static int suite_ioworker_plan()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_plan_user);
+  CU_ADD_TEST(s, test_ioworker_plan_generate);
+
+  return 0;
+}
+
+
+static void test_ioworker_limiter_iops_exact()
+{
+  struct ioworker_limiter limiter;
+  uint64_t start = 1000;
+  uint64_t now = start;
+
+  // 300K IOPS: 3333.33ns per io, no truncation to 3333ns
+  ioworker_limiter_init(&limiter, 300000, 1, start);
+  for (int i=0; i<300000; i++)
+  {
+    CU_ASSERT(ioworker_limiter_ready(&limiter, now));
+    ioworker_limiter_charge(&limiter, 1, now);
+    CU_ASSERT_FALSE(ioworker_limiter_ready(&limiter, now));
+    now = limiter.tat;
+  }
+  CU_ASSERT(now-start >= NS_PER_S-1);
+  CU_ASSERT(now-start <= NS_PER_S);
+
+  // beyond 1M IOPS is still limited
+  ioworker_limiter_init(&limiter, 3000000, 1, start);
+  CU_ASSERT_NOT_EQUAL(limiter.interval, 0);
+  ioworker_limiter_charge(&limiter, 3000000, start);
+  CU_ASSERT(limiter.tat-start >= NS_PER_S-1);
+  CU_ASSERT(limiter.tat-start <= NS_PER_S);
+}
+
+static void test_ioworker_limiter_burst()
+{
+  struct ioworker_limiter limiter;
+  uint64_t now = 5000000;
+
+  // 1000 IOPS with burst of 4 io
+  ioworker_limiter_init(&limiter, 1000, 4, now);
+  for (int i=0; i<4; i++)
+  {
+    CU_ASSERT(ioworker_limiter_ready(&limiter, now));
+    ioworker_limiter_charge(&limiter, 1, now);
+  }
+  CU_ASSERT_FALSE(ioworker_limiter_ready(&limiter, now));
+
+  // one more io after 1ms
+  now += 1000000;
+  CU_ASSERT(ioworker_limiter_ready(&limiter, now));
+  ioworker_limiter_charge(&limiter, 1, now);
+  CU_ASSERT_FALSE(ioworker_limiter_ready(&limiter, now));
+
+  // long idle time does not save more credits than the burst
+  now += 1000*1000000ULL;
+  for (int i=0; i<4; i++)
+  {
+    CU_ASSERT(ioworker_limiter_ready(&limiter, now));
+    ioworker_limiter_charge(&limiter, 1, now);
+  }
+  CU_ASSERT_FALSE(ioworker_limiter_ready(&limiter, now));
+}
+
+static void test_ioworker_limiter_bandwidth()
+{
+  struct ioworker_limiter limiter;
+
+  // 1MB/s: one 4K io takes 4096us, and burst of two 4K io
+  ioworker_limiter_init(&limiter, 1000000, 8192, 0);
+  CU_ASSERT(ioworker_limiter_ready(&limiter, 0));
+  ioworker_limiter_charge(&limiter, 4096, 0);
+  CU_ASSERT_EQUAL(limiter.tat, 4096000);
+  CU_ASSERT(ioworker_limiter_ready(&limiter, 1));
+  ioworker_limiter_charge(&limiter, 4096, 1);
+  CU_ASSERT_EQUAL(limiter.tat, 8192000);
+  CU_ASSERT_FALSE(ioworker_limiter_ready(&limiter, 1));
+
+  // not limited
+  ioworker_limiter_init(&limiter, 0, 1, 0);
+  ioworker_limiter_charge(&limiter, 4096, 0);
+  CU_ASSERT(ioworker_limiter_ready(&limiter, 0));
+}
+
+static void test_ioworker_arrival_poisson()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  uint64_t last = 0;
+  uint32_t short_interval = 0;
+
+  memset(&args, 0, sizeof(args));
+  args.arrival = IOWORKER_ARRIVAL_POISSON;
+  memset(&ctx, 0, sizeof(ctx));
+  ctx.args = &args;
+  ctx.arrival_interval = 1000.;
+  ioworker_rand_init(&ctx, 0x1234);
+  for (int i=0; i<100000; i++)
+  {
+    uint64_t t = ioworker_arrival_next(&ctx);
+    CU_ASSERT(t >= last);
+    if (t-last < 1000)
+    {
+      short_interval ++;
+    }
+    last = t;
+  }
+
+  // mean interval, and P(x<mean) = 1-1/e
+  CU_ASSERT(last > 98*1000000ULL);
+  CU_ASSERT(last < 102*1000000ULL);
+  CU_ASSERT(short_interval > 62000);
+  CU_ASSERT(short_interval < 64500);
+}
+
+static void test_ioworker_arrival_jitter()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  uint64_t last = 0;
+
+  memset(&args, 0, sizeof(args));
+  args.arrival = IOWORKER_ARRIVAL_JITTER;
+  args.jitter = 50;
+  memset(&ctx, 0, sizeof(ctx));
+  ctx.args = &args;
+  ctx.arrival_interval = 1000.;
+  ioworker_rand_init(&ctx, 0x5678);
+  for (int i=0; i<100000; i++)
+  {
+    uint64_t t = ioworker_arrival_next(&ctx);
+    CU_ASSERT(t-last >= 499);
+    CU_ASSERT(t-last <= 1501);
+    last = t;
+  }
+  CU_ASSERT(last > 99*1000000ULL);
+  CU_ASSERT(last < 101*1000000ULL);
+}
+
+static int suite_ioworker_limiter()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_limiter_iops_exact);
+  CU_ADD_TEST(s, test_ioworker_limiter_burst);
+  CU_ADD_TEST(s, test_ioworker_limiter_bandwidth);
+  CU_ADD_TEST(s, test_ioworker_arrival_poisson);
+  CU_ADD_TEST(s, test_ioworker_arrival_jitter);
+
+  return 0;
+}
+
+
+static void test_ioworker_target_window(struct ioworker_global_ctx* gctx,
+                                        uint64_t* now,
+                                        uint64_t io_count,
+                                        uint64_t latency_ns)
+{
+  // one window of io with the same latency
+  gctx->target_histogram[latency_histogram_index(latency_ns)] += io_count;
+  gctx->target_window_io += io_count;
+  *now += IOWORKER_TARGET_WINDOW_NS;
+  ioworker_target_adjust(gctx, *now);
+}
+
+static void test_ioworker_target_qdepth()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  struct ioworker_target target;
+  uint64_t now = 1000;
+
+  memset(&args, 0, sizeof(args));
+  memset(&target, 0, sizeof(target));
+  memset(&ctx, 0, sizeof(ctx));
+  target.percentile = 99;
+  target.latency_us = 200;
+  args.target = &target;
+  args.qdepth = 63;
+  args.rate_burst = 1;
+  ctx.args = &args;
+  ctx.qdepth_max = 63;
+  ctx.qdepth_limit = 1;
+  ctx.target_slow_start = true;
+  ctx.target_window_min_io = 1000/(100-target.percentile);
+  ioworker_target_window_restart(&ctx, now);
+
+  // not enough io in the window
+  test_ioworker_target_window(&ctx, &now, 10, 100000);
+  CU_ASSERT_EQUAL(target.windows, 0);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 1);
+
+  // slow start
+  test_ioworker_target_window(&ctx, &now, 1000, 100000);
+  CU_ASSERT_EQUAL(target.windows, 1);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 2);
+  CU_ASSERT_EQUAL(target.qdepth, 1);
+  test_ioworker_target_window(&ctx, &now, 2000, 100000);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 4);
+  CU_ASSERT_EQUAL(target.qdepth, 2);
+  CU_ASSERT_EQUAL(target.iops, 20000);
+  CU_ASSERT(target.percentile_latency_us >= 97);
+  CU_ASSERT(target.percentile_latency_us <= 103);
+
+  // over the target: decrease, and then additive increase
+  test_ioworker_target_window(&ctx, &now, 4000, 300000);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 3);
+  CU_ASSERT_EQUAL(target.qdepth, 2);
+  test_ioworker_target_window(&ctx, &now, 3000, 150000);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 4);
+  CU_ASSERT_EQUAL(target.qdepth, 3);
+  CU_ASSERT_EQUAL(target.iops, 30000);
+  CU_ASSERT_EQUAL(ctx.target_iops, 0);
+
+  // limited by the max queue depth
+  ctx.qdepth_limit = 63;
+  test_ioworker_target_window(&ctx, &now, 1000, 100000);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 63);
+}
+
+static void test_ioworker_target_rate()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  struct ioworker_target target;
+  uint64_t now = 1000;
+
+  memset(&args, 0, sizeof(args));
+  memset(&target, 0, sizeof(target));
+  memset(&ctx, 0, sizeof(ctx));
+  target.percentile = 99;
+  target.latency_us = 50;
+  args.target = &target;
+  args.qdepth = 63;
+  args.rate_burst = 1;
+  ctx.args = &args;
+  ctx.qdepth_max = 63;
+  ctx.qdepth_limit = 1;
+  ctx.target_window_min_io = 1000/(100-target.percentile);
+  ioworker_target_window_restart(&ctx, now);
+
+  // over the target at queue depth 1: limit the rate
+  test_ioworker_target_window(&ctx, &now, 10000, 80000);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 1);
+  CU_ASSERT_EQUAL(ctx.target_iops, 75000);
+  CU_ASSERT_NOT_EQUAL(ctx.iops_limiter.interval, 0);
+  CU_ASSERT_EQUAL(target.iops, 0);
+
+  // under the target: increase the rate
+  test_ioworker_target_window(&ctx, &now, 7500, 40000);
+  CU_ASSERT_EQUAL(ctx.target_iops, 75000+3750);
+  CU_ASSERT_EQUAL(target.iops, 75000);
+  CU_ASSERT_EQUAL(target.qdepth, 1);
+
+  // the rate does not limit io any more
+  test_ioworker_target_window(&ctx, &now, 1000, 40000);
+  CU_ASSERT_EQUAL(ctx.target_iops, 0);
+  CU_ASSERT_EQUAL(ctx.iops_limiter.interval, 0);
+  CU_ASSERT_EQUAL(target.iops, 75000);
+  CU_ASSERT_EQUAL(target.windows, 3);
+
+  // the lowest rate
+  ctx.target_iops = IOWORKER_TARGET_IOPS_MIN;
+  test_ioworker_target_window(&ctx, &now, 10, 80000);
+  CU_ASSERT_EQUAL(target.windows, 3);
+  now += NS_PER_S;
+  ioworker_target_adjust(&ctx, now);
+  CU_ASSERT_EQUAL(ctx.target_iops, IOWORKER_TARGET_IOPS_MIN);
+}
+
+static int suite_ioworker_target()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_target_qdepth);
+  CU_ADD_TEST(s, test_ioworker_target_rate);
+
+  return 0;
+}
+
+
+static void test_ioworker_sweep_steps()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  struct ioworker_sweep sweep[3];
+  unsigned int lba_size_list[2] = {8, 256};
+  unsigned int lba_size_list_align[2] = {8, 1};
+  uint16_t lba_align;
+  uint64_t now = 1000;
+
+  memset(&args, 0, sizeof(args));
+  memset(&ctx, 0, sizeof(ctx));
+  memset(sweep, 0, sizeof(sweep));
+  sweep[0].qdepth = 1;
+  sweep[0].io_size = 256;
+  sweep[1].qdepth = 128;
+  sweep[1].io_size = 256;
+  sweep[2].qdepth = 16;
+  sweep[2].io_size = 8;
+  args.sweep = sweep;
+  args.sweep_len = 3;
+  args.sweep_dwell_ms = 500;
+  args.lba_size_list = lba_size_list;
+  args.lba_size_list_align = lba_size_list_align;
+  args.lba_size_list_len = 2;
+  ctx.args = &args;
+  ctx.qdepth_max = 64;
+
+  ioworker_sweep_start(&ctx, 0, now);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 1);
+  CU_ASSERT_EQUAL(ctx.sweep_size_index, 1);
+  CU_ASSERT_EQUAL(ctx.sweep_next, now+500*1000*1000ULL);
+
+  // limited by the qpairs
+  now = ctx.sweep_next+1;
+  ioworker_sweep_next(&ctx, now);
+  CU_ASSERT_EQUAL(sweep[0].mseconds, 500);
+  CU_ASSERT_EQUAL(ctx.sweep_index, 1);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 64);
+  CU_ASSERT_FALSE(ctx.flag_finish);
+
+  now = ctx.sweep_next+1;
+  ioworker_sweep_next(&ctx, now);
+  CU_ASSERT_EQUAL(ctx.sweep_index, 2);
+  CU_ASSERT_EQUAL(ctx.qdepth_limit, 16);
+  CU_ASSERT_EQUAL(ctx.sweep_size_index, 0);
+  CU_ASSERT_EQUAL(ioworker_send_one_size(&args, &ctx, &lba_align), 8);
+  CU_ASSERT_EQUAL(lba_align, 8);
+
+  // finish after the last step
+  now = ctx.sweep_next+1;
+  ioworker_sweep_next(&ctx, now);
+  CU_ASSERT_EQUAL(sweep[2].mseconds, 500);
+  CU_ASSERT_EQUAL(ctx.sweep_index, 2);
+  CU_ASSERT_TRUE(ctx.flag_finish);
+  CU_ASSERT_EQUAL(ctx.sweep_next, (uint64_t)-1);
+}
+
+static int suite_ioworker_sweep()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_sweep_steps);
+
+  return 0;
+}
+
+
+static void test_ioworker_skew_setup(struct ioworker_global_ctx* ctx,
+                                     struct ioworker_args* args,
+                                     uint32_t distribution,
+                                     double param)
+{
+  memset(args, 0, sizeof(*args));
+  memset(ctx, 0, sizeof(*ctx));
+  args->region_start = 1000;
+  args->region_end = 1000+1000000;
+  args->lba_align_max = 1;
+  args->lba_distribution = distribution;
+  args->lba_distribution_param = param;
+  ctx->args = args;
+  ioworker_rand_init(ctx, 0x1234);
+}
+
+static void test_ioworker_skew_zeta()
+{
+  double sum = 0;
+
+  for (uint64_t i=1; i<=1000000; i++)
+  {
+    sum += pow(i, -0.99);
+  }
+  CU_ASSERT(fabs(ioworker_zeta(1000000, 0.99)-sum) < sum*1e-9);
+  CU_ASSERT(fabs(ioworker_zeta(2, 0.5)-(1+pow(2, -0.5))) < 1e-12);
+}
+
+static void test_ioworker_skew_zipf()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  uint32_t first = 0;
+  uint32_t hot = 0;
+
+  test_ioworker_skew_setup(&ctx, &args, IOWORKER_LBA_ZIPF, 0.99);
+  ioworker_skew_init(&ctx, &args);
+  CU_ASSERT_EQUAL(ctx.skew_n, 1000000);
+  for (int i=0; i<1000000; i++)
+  {
+    uint64_t lba = ioworker_send_one_lba_random(&args, &ctx);
+    CU_ASSERT(lba >= args.region_start && lba < args.region_end);
+    if (lba == args.region_start)
+    {
+      first ++;
+    }
+    if (lba < args.region_start+10000)
+    {
+      hot ++;
+    }
+  }
+
+  // the hottest item, and the top 1% items
+  CU_ASSERT(first > 1000000/ctx.zipf_zetan*0.95);
+  CU_ASSERT(first < 1000000/ctx.zipf_zetan*1.05);
+  CU_ASSERT(hot > 600000);
+  CU_ASSERT(hot < 750000);
+
+  // items are aligned blocks
+  args.lba_align_max = 8;
+  ioworker_skew_init(&ctx, &args);
+  CU_ASSERT_EQUAL(ctx.skew_n, 125000);
+  for (int i=0; i<1000; i++)
+  {
+    uint64_t lba = ioworker_send_one_lba_random(&args, &ctx);
+    CU_ASSERT((lba-args.region_start)%8 == 0);
+    CU_ASSERT(lba < args.region_end);
+  }
+}
+
+static void test_ioworker_skew_pareto_gaussian()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  uint32_t count = 0;
+
+  // 80% io on 20% space
+  test_ioworker_skew_setup(&ctx, &args, IOWORKER_LBA_PARETO, 0.2);
+  ioworker_skew_init(&ctx, &args);
+  for (int i=0; i<100000; i++)
+  {
+    uint64_t lba = ioworker_send_one_lba_random(&args, &ctx);
+    CU_ASSERT(lba >= args.region_start && lba < args.region_end);
+    if (lba < args.region_start+200000)
+    {
+      count ++;
+    }
+  }
+  CU_ASSERT(count > 79000);
+  CU_ASSERT(count < 81000);
+
+  // 68% io in 1 sigma
+  count = 0;
+  test_ioworker_skew_setup(&ctx, &args, IOWORKER_LBA_GAUSSIAN, 0.1);
+  ioworker_skew_init(&ctx, &args);
+  for (int i=0; i<100000; i++)
+  {
+    uint64_t lba = ioworker_send_one_lba_random(&args, &ctx);
+    CU_ASSERT(lba >= args.region_start && lba < args.region_end);
+    if (lba >= args.region_start+400000 && lba < args.region_start+600000)
+    {
+      count ++;
+    }
+  }
+  CU_ASSERT(count > 67300);
+  CU_ASSERT(count < 69300);
+}
+
+static void test_ioworker_skew_hotcold()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  // 50% io on 0.1% space, 30% io on 9.9% space, and 20% io on the rest
+  unsigned int levels[6] = {1000, 500000, 99000, 300000, 900000, 200000};
+  uint32_t count[3] = {0, 0, 0};
+
+  test_ioworker_skew_setup(&ctx, &args, IOWORKER_LBA_HOTCOLD, 0);
+  args.lba_hotcold = levels;
+  args.lba_hotcold_len = 3;
+  ioworker_skew_init(&ctx, &args);
+  CU_ASSERT_EQUAL(ctx.hotcold_lba[1], args.region_start+1000);
+  CU_ASSERT_EQUAL(ctx.hotcold_lba[3], args.region_end);
+  for (int i=0; i<100000; i++)
+  {
+    uint64_t lba = ioworker_send_one_lba_random(&args, &ctx);
+    CU_ASSERT(lba >= args.region_start && lba < args.region_end);
+    if (lba < args.region_start+1000)
+    {
+      count[0] ++;
+    }
+    else if (lba < args.region_start+100000)
+    {
+      count[1] ++;
+    }
+    else
+    {
+      count[2] ++;
+    }
+  }
+  CU_ASSERT(count[0] > 49000 && count[0] < 51000);
+  CU_ASSERT(count[1] > 29000 && count[1] < 31000);
+  CU_ASSERT(count[2] > 19000 && count[2] < 21000);
+}
+
+static int suite_ioworker_skew()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_skew_zeta);
+  CU_ADD_TEST(s, test_ioworker_skew_zipf);
+  CU_ADD_TEST(s, test_ioworker_skew_pareto_gaussian);
+  CU_ADD_TEST(s, test_ioworker_skew_hotcold);
+
+  return 0;
+}
+
+
+static void test_ioworker_permutation_coverage()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+  static uint8_t visited[1000];
+  uint64_t first[10];
+  bool same = true;
+
+  memset(&args, 0, sizeof(args));
+  memset(&ctx, 0, sizeof(ctx));
+  args.region_start = 800;
+  args.region_end = 800+8000-3;
+  args.lba_align_max = 8;
+  args.lba_random = 100;
+  ctx.args = &args;
+  ioworker_rand_init(&ctx, 0x1234);
+  ioworker_permutation_init(&ctx, &args);
+  CU_ASSERT_EQUAL(ctx.perm_n, 1000);
+  CU_ASSERT_EQUAL(ctx.perm_half_bits, 5);
+
+  // every block once in each pass, and different order in next pass
+  for (int pass=0; pass<2; pass++)
+  {
+    memset(visited, 0, sizeof(visited));
+    for (int i=0; i<1000; i++)
+    {
+      uint64_t lba = ioworker_send_one_lba_random(&args, &ctx);
+
+      CU_ASSERT(lba >= args.region_start && lba < args.region_end);
+      CU_ASSERT((lba-args.region_start)%8 == 0);
+      visited[(lba-args.region_start)/8] ++;
+      if (i < 10)
+      {
+        if (pass == 0)
+        {
+          first[i] = lba;
+        }
+        else if (first[i] != lba)
+        {
+          same = false;
+        }
+      }
+    }
+    for (int i=0; i<1000; i++)
+    {
+      CU_ASSERT_EQUAL(visited[i], 1);
+    }
+  }
+  CU_ASSERT_FALSE(same);
+}
+
+static void test_ioworker_permutation_small()
+{
+  static struct ioworker_global_ctx ctx;
+  struct ioworker_args args;
+
+  memset(&args, 0, sizeof(args));
+  memset(&ctx, 0, sizeof(ctx));
+  args.region_start = 0;
+  args.region_end = 3;
+  args.lba_align_max = 1;
+  ctx.args = &args;
+  ioworker_rand_init(&ctx, 0x5678);
+  ioworker_permutation_init(&ctx, &args);
+  CU_ASSERT_EQUAL(ctx.perm_n, 3);
+  CU_ASSERT_EQUAL(ioworker_permutation(&ctx, 0)+
+                  ioworker_permutation(&ctx, 1)+
+                  ioworker_permutation(&ctx, 2), 3);
+
+  // region smaller than the alignment
+  args.region_end = 4;
+  args.lba_align_max = 8;
+  ioworker_permutation_init(&ctx, &args);
+  CU_ASSERT_EQUAL(ctx.perm_n, 1);
+  CU_ASSERT_EQUAL(ioworker_send_one_lba_random(&args, &ctx), 0);
+  CU_ASSERT_EQUAL(ioworker_send_one_lba_random(&args, &ctx), 0);
+}
+
+static int suite_ioworker_permutation()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_permutation_coverage);
+  CU_ADD_TEST(s, test_ioworker_permutation_small);
+
+  return 0;
+}
+
+static void test_ioworker_sequence_list()
+{
+  static struct ioworker_global_ctx gctx;
+  struct ioworker_args args;
+  struct ioworker_io_ctx ctx;
+  ioworker_ioseq seq[2] = {{0, 100, 8, 2}, {5*3600*NS_PER_S+1, 200, 1, 1}};
+
+  memset(&gctx, 0, sizeof(gctx));
+  memset(&args, 0, sizeof(args));
+  args.io_sequence = seq;
+  args.io_sequence_len = 2;
+  args.lba_size_max = 8;
+  args.region_end = 1000;
+  gctx.args = &args;
+  gctx.io_sequence_start = 1000;
+
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), 0);
+  CU_ASSERT_EQUAL(gctx.io_sequence_count, 2);
+  CU_ASSERT_PTR_NULL(gctx.io_sequence_map);
+
+  ioworker_sequence_next(&gctx, &ctx);
+  CU_ASSERT_EQUAL(ctx.time_sent, 1000);
+  CU_ASSERT_EQUAL(ctx.ios.slba, 100);
+  CU_ASSERT_EQUAL(ctx.ios.nlba, 8);
+  CU_ASSERT_EQUAL(ctx.ios.op, 2);
+
+  // ns timestamp beyond 32-bit us
+  ioworker_sequence_next(&gctx, &ctx);
+  CU_ASSERT_EQUAL(ctx.time_sent, 5*3600*NS_PER_S+1001);
+  CU_ASSERT_EQUAL(ctx.ios.slba, 200);
+  CU_ASSERT_EQUAL(gctx.io_sequence_index, 2);
+  ioworker_sequence_fini(&gctx);
+
+  // invalid io in the list
+  seq[1].nlba = 9;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+  seq[1].nlba = 0;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+  seq[1].nlba = 1;
+  seq[1].slba = 1000;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+  seq[1].slba = 996;
+  seq[1].nlba = 5;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+  seq[1].nlba = 4;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), 0);
+  ioworker_sequence_fini(&gctx);
+
+  // flush has no lba
+  seq[1].slba = 0;
+  seq[1].nlba = 0;
+  seq[1].op = 0;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), 0);
+  ioworker_sequence_fini(&gctx);
+}
+
+static void test_ioworker_sequence_file()
+{
+  static struct ioworker_global_ctx gctx;
+  struct ioworker_args args;
+  struct ioworker_io_ctx ctx;
+  char filename[] = "/tmp/ioworker_ut_trace_XXXXXX";
+  uint64_t count = IOWORKER_SEQUENCE_WINDOW+10;
+  int fd = mkstemp(filename);
+  FILE* f = fdopen(fd, "wb");
+
+  CU_ASSERT(fd >= 0);
+  for (uint64_t i=0; i<count; i++)
+  {
+    ioworker_ioseq io = {i*1000, i*8, 8, 2};
+    fwrite(&io, sizeof(io), 1, f);
+  }
+  fclose(f);
+
+  memset(&gctx, 0, sizeof(gctx));
+  memset(&args, 0, sizeof(args));
+  args.io_sequence_file = filename;
+  args.lba_size_max = 8;
+  args.region_end = count*8;
+  gctx.args = &args;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), 0);
+  CU_ASSERT_PTR_NOT_NULL(gctx.io_sequence_map);
+  CU_ASSERT_EQUAL(gctx.io_sequence_count, count);
+  CU_ASSERT_EQUAL(gctx.io_sequence_window, IOWORKER_SEQUENCE_WINDOW);
+
+  // replay across the window
+  for (uint64_t i=0; i<count; i++)
+  {
+    CU_ASSERT_EQUAL(ioworker_sequence_next(&gctx, &ctx), 0);
+    if (ctx.ios.slba != i*8 || ctx.time_sent != i*1000)
+    {
+      CU_ASSERT(false);
+      break;
+    }
+  }
+  CU_ASSERT_EQUAL(gctx.io_sequence_window, 2*IOWORKER_SEQUENCE_WINDOW);
+  ioworker_sequence_fini(&gctx);
+  CU_ASSERT_PTR_NULL(gctx.io_sequence_map);
+  CU_ASSERT_FALSE(gctx.io_sequence_invalid);
+
+  // invalid io in the second window fails when the window is entered
+  args.region_end = count*8-1;
+  memset(&gctx, 0, sizeof(gctx));
+  gctx.args = &args;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), 0);
+  for (uint64_t i=0; i<IOWORKER_SEQUENCE_WINDOW; i++)
+  {
+    ioworker_sequence_next(&gctx, &ctx);
+  }
+  CU_ASSERT_FALSE(gctx.io_sequence_invalid);
+  CU_ASSERT_EQUAL(ioworker_sequence_next(&gctx, &ctx), -1);
+  CU_ASSERT_TRUE(gctx.io_sequence_invalid);
+  CU_ASSERT_TRUE(gctx.flag_finish);
+  CU_ASSERT_EQUAL(gctx.io_sequence_count, IOWORKER_SEQUENCE_WINDOW);
+  ioworker_sequence_fini(&gctx);
+
+  // invalid io in the first window fails the init
+  args.lba_size_max = 7;
+  memset(&gctx, 0, sizeof(gctx));
+  gctx.args = &args;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+  CU_ASSERT_PTR_NULL(gctx.io_sequence_map);
+
+  // incomplete record
+  truncate(filename, count*sizeof(ioworker_ioseq)-1);
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+
+  // empty file
+  truncate(filename, 0);
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+
+  unlink(filename);
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), -1);
+}
+
+static void test_ioworker_sequence_speed()
+{
+  static struct ioworker_global_ctx gctx;
+  struct ioworker_args args;
+  struct ioworker_io_ctx ctx;
+  ioworker_ioseq seq[2] = {{1000, 0, 8, 2}, {3000, 8, 8, 2}};
+
+  memset(&gctx, 0, sizeof(gctx));
+  memset(&args, 0, sizeof(args));
+  args.io_sequence = seq;
+  args.io_sequence_len = 2;
+  args.lba_size_max = 8;
+  args.region_end = 16;
+  gctx.args = &args;
+  gctx.io_sequence_start = 100;
+  CU_ASSERT_EQUAL(ioworker_sequence_init(&gctx, &args), 0);
+
+  // 2x faster
+  gctx.io_sequence_scale = 0.5;
+  ioworker_sequence_next(&gctx, &ctx);
+  CU_ASSERT_EQUAL(ctx.time_sent, 600);
+  ioworker_sequence_next(&gctx, &ctx);
+  CU_ASSERT_EQUAL(ctx.time_sent, 1600);
+}
+
+static void test_ioworker_update_replay()
+{
+  struct ioworker_args args;
+  struct ioworker_replay replay;
+  uint64_t histogram[LATENCY_HISTOGRAM_BUCKETS];
+
+  memset(&args, 0, sizeof(args));
+  memset(&replay, 0, sizeof(replay));
+  memset(histogram, 0, sizeof(histogram));
+  args.replay = &replay;
+  args.replay_histogram = histogram;
+
+  ioworker_update_replay(&args, 1000, 1000);
+  ioworker_update_replay(&args, 1000, 3000);
+  ioworker_update_replay(&args, 1000, 2001000);
+  // sent before the scheduled time is counted as no lag
+  ioworker_update_replay(&args, 5000, 4000);
+  CU_ASSERT_EQUAL(replay.io_count, 4);
+  CU_ASSERT_EQUAL(replay.lag_total_ns, 2002000);
+  CU_ASSERT_EQUAL(replay.lag_max_us, 2000);
+  CU_ASSERT_EQUAL(histogram[latency_histogram_index(0)], 2);
+  CU_ASSERT_EQUAL(histogram[latency_histogram_index(2000)], 1);
+  CU_ASSERT_EQUAL(histogram[latency_histogram_index(2000000)], 1);
+}
+
+static int suite_ioworker_sequence()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_sequence_list);
+  CU_ADD_TEST(s, test_ioworker_sequence_file);
+  CU_ADD_TEST(s, test_ioworker_sequence_speed);
+  CU_ADD_TEST(s, test_ioworker_update_replay);
+
+  return 0;
+}
+
+static void test_ioworker_verify_threads()
+{
+  static struct ioworker_io_ctx ctx[64];
+  static uint64_t data[64];
+  struct ioworker_io_ctx* one;
+  struct ioworker_verify* v;
+  uint32_t verified = 0;
+
+  v = ioworker_verify_init(NULL, 4, 64);
+  CU_ASSERT_PTR_NOT_NULL(v);
+  CU_ASSERT_EQUAL(v->thread_count, 4);
+  CU_ASSERT_PTR_NULL(ioworker_verify_next(v));
+
+  for (int i=0; i<64; i++)
+  {
+    // every 8th io reads wrong data
+    data[i] = (i%8 == 7) ? 0 : i;
+    ctx[i].data_buf = &data[i];
+    ctx[i].cmd.lba = i;
+    ctx[i].cmd.count = 1;
+    ctx[i].verify_error = 1;
+    ioworker_verify_submit(v, &ctx[i]);
+  }
+
+  // verdicts are delivered in any order
+  while (verified < 64)
+  {
+    one = ioworker_verify_next(v);
+    if (one != NULL)
+    {
+      uint32_t i = one-ctx;
+      CU_ASSERT_EQUAL(one->verify_error, (i%8 == 7) ? -2 : 0);
+      verified ++;
+    }
+  }
+  CU_ASSERT_PTR_NULL(ioworker_verify_next(v));
+
+  // submit again after the rings wrap
+  ioworker_verify_submit(v, &ctx[3]);
+  ioworker_verify_fini(v);
+}
+
+static void test_ioworker_verify_thread_max()
+{
+  struct ioworker_verify* v;
+
+  v = ioworker_verify_init(NULL, 100, 1);
+  CU_ASSERT_PTR_NOT_NULL(v);
+  CU_ASSERT_EQUAL(v->thread_count, IOWORKER_VERIFY_THREADS_MAX);
+  CU_ASSERT_EQUAL(v->size, 2);
+  ioworker_verify_fini(v);
+}
+
+static int suite_ioworker_verify()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_verify_threads);
+  CU_ADD_TEST(s, test_ioworker_verify_thread_max);
+
+  return 0;
+}
+
+
+static void test_ioworker_weight_refill()
+{
+  static struct ioworker_qpair_ctx qctx[2];
+  static struct ioworker_io_ctx io[2];
+  uint32_t sent[2] = {0, 0};
+
+  // both qpairs always have due IO
+  memset(qctx, 0, sizeof(qctx));
+  memset(io, 0, sizeof(io));
+  for (int i=0; i<2; i++)
+  {
+    STAILQ_INIT(&qctx[i].pending_io_list);
+    STAILQ_INSERT_TAIL(&qctx[i].pending_io_list, &io[i], next);
+  }
+  qctx[0].weight = 1;
+  qctx[1].weight = 4;
+
+  ioworker_weight_refill(qctx, 2, 2, 100);
+  CU_ASSERT_EQUAL(qctx[0].credit, 2);
+  CU_ASSERT_EQUAL(qctx[1].credit, 8);
+
+  // not refilled before the heavy qpair uses up its credits
+  for (int round=0; round<1000; round++)
+  {
+    for (int i=0; i<2; i++)
+    {
+      if (qctx[i].credit != 0)
+      {
+        qctx[i].credit --;
+        sent[i] ++;
+      }
+    }
+    ioworker_weight_refill(qctx, 2, 2, 100);
+  }
+  CU_ASSERT_EQUAL(sent[0], 250);
+  CU_ASSERT_EQUAL(sent[1], 1000);
+
+  // refilled when the qpair with credits has no due IO
+  qctx[0].credit = 0;
+  qctx[1].credit = 3;
+  io[1].time_sent = 200;
+  ioworker_weight_refill(qctx, 2, 1, 100);
+  CU_ASSERT_EQUAL(qctx[0].credit, 1);
+  CU_ASSERT_EQUAL(qctx[1].credit, 4);
+
+  qctx[0].credit = 0;
+  qctx[1].credit = 3;
+  STAILQ_INIT(&qctx[1].pending_io_list);
+  ioworker_weight_refill(qctx, 2, 1, 300);
+  CU_ASSERT_EQUAL(qctx[0].credit, 1);
+}
+
+static int suite_ioworker_weight()
+{
+  CU_Suite* s = CU_add_suite(__func__, NULL, NULL);
+  if (s == NULL) {
+    CU_cleanup_registry();
+    return CU_get_error();
+  }
+
+  CU_ADD_TEST(s, test_ioworker_weight_refill);
+
+  return 0;
+}
+
+
 int main()
 {
   unsigned int  num_failures;
@@ -1205,7 +2450,6 @@ int main()
     return CU_get_error();
   }
 
-  suite_timeradd_usecond();
   suite_ioworker_distribution_init();
   suite_ioworker_send_one_is_finish();
   suite_ioworker_get_duration();
@@ -1213,6 +2457,18 @@ int main()
   suite_ioworker_update_io_count_per_second();
   suite_ioworker_iosize_init();
   suite_ioworker_send_one_lba();
+  suite_latency_histogram();
+  suite_ioworker_stats();
+  suite_ioworker_rand();
+  suite_ioworker_plan();
+  suite_ioworker_limiter();
+  suite_ioworker_target();
+  suite_ioworker_sweep();
+  suite_ioworker_skew();
+  suite_ioworker_permutation();
+  suite_ioworker_sequence();
+  suite_ioworker_verify();
+  suite_ioworker_weight();
 
   CU_basic_run_tests();
   num_failures = CU_get_number_of_failures();
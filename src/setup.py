@@ -45,7 +45,7 @@ setup(
             include_dirs = ['../spdk/include'],
 
             # dpdk prebuilt static libraries
-            libraries=['uuid', 'numa', 'pthread'],
+            libraries=['uuid', 'numa', 'pthread', 'm'],
 
             # spdk static libraries
             extra_objects=[